@@ -12,114 +12,668 @@ When selecting the "Analyze" option from the main menu, users will have two
 options. First, they can analyze and view the habit with the longest streak for a given
 periodicity. Second, they can analyze and view the longest overall streak for a given
 habit and compare it to its current streak.
+The log of a habit is shown as a calendar heatmap of a year, drawn from the completion
+bitmap of the habit (see bitmap.py) instead of its rows in habit_log.
+Completion rates per day, week or month are read from the rollup table habit_rollup,
+which db.py keeps up to date with every check-off and extends by the periods that began
+since on the first write of a day (see db.extend_rollup()), so they never scan the log
+and never write.
+All views show the habits of the current user (see db.use_user()); the summary over
+all users reads the shards of db.connect_shards() in parallel worker processes.
+The habit and streak rows behind the views are kept in a small LRU cache, which is
+read again only after the database was written (see db.generation()).
+The get_* and iter_* functions only query and return records (named tuples), the
+iter_* ones as generators that walk the cursor row by row for large listings; the
+view_* functions at the end of the file are the thin layer that prints them.
 """
 
-from db import db_name
+import os
 import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date
+import bitmap
+import db
+import periods
 
+# result records of the query functions below; they are plain tuples with named fields
 
-def view_habits_by_time_period(time_period=None):
+HabitStreak = namedtuple("HabitStreak", ["habit_ID", "habit_name", "habit_time_period",
+                                         "habit_counter", "habit_counter_max"])
+CompletionRate = namedtuple("CompletionRate", ["habit_ID", "period_start", "completed", "expected", "rate"])
+CompletionTrend = namedtuple("CompletionTrend", ["recent", "previous", "change"])
+PeriodRate = namedtuple("PeriodRate", ["period_start", "rate"])
+# rank: 1 for the best value, habits with the same value share a rank
+LeaderboardEntry = namedtuple("LeaderboardEntry", ["rank", "habit_ID", "habit_name", "habit_time_period", "value"])
+HabitHistory = namedtuple("HabitHistory", ["habit_ID", "year", "completed", "current_streak",
+                                           "longest_streak", "longest_gap", "last_completed", "bitmap"])
+
+
+class QueryCache:
+    """
+    A bounded cache of query results that drops the least recently used entry when
+    it is full. Every entry remembers the database generation it was read at; an entry
+    of an older generation counts as a miss and is read again.
+
+    Attributes:
+        maxsize (int): Largest number of entries.
+        hits (int): Number of results served from the cache.
+        misses (int): Number of results read from the database.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, generation, load):
+        """
+            Returns the cached result for key, or calls load() and caches its result.
+        :param key: Hashable key of the query, e.g. its filter arguments.
+        :param generation: Current generation of the database.
+        :param load: Function without arguments that reads the result.
+        :return: The result.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generation:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        result = load()
+        with self._lock:
+            self._entries[key] = (generation, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        """
+            Removes all entries and resets the counters.
+        :return:
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        """
+            Returns the counters, e.g. for the benchmark.
+        :return: dict: hits, misses, hit_rate and size
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._entries),
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+# results of get_habit_streaks() per database, user and filter
+habit_streak_cache = QueryCache()
+
+
+# methods to query habits and streaks
+
+def _habit_streak_query(habit_ID, time_period):
+    """
+        Builds the query of the habit and streak records.
+    :return: tuple: (query, parameters)
+    """
+    query = """
+            SELECT habit_info.habit_ID, 
+            habit_info.habit_name, 
+            habit_info.habit_time_period, 
+            habit_streak.habit_counter,
+            habit_streak.habit_counter_max
+            FROM habit_info JOIN habit_streak 
+            ON habit_info.habit_ID = habit_streak.habit_ID
+            WHERE habit_info.user_ID IS ?
+            """
+    parameters = (db.current_user(),)
+    if habit_ID is not None:
+        query, parameters = query + " AND habit_info.habit_ID = ?", parameters + (habit_ID,)
+    elif periods.is_valid(time_period):
+        query, parameters = (query + " AND habit_info.habit_time_period = ?",
+                             parameters + (periods.normalize(time_period),))
+    return query + " ORDER BY habit_info.habit_ID", parameters
+
+
+def iter_habit_streaks(habit_ID=None, time_period=None):
+    """
+        Yields the current user's habits with their streaks one by one while the cursor
+        walks the result, so a listing of many habits is never held in memory as a whole.
+        Nothing is cached; use get_habit_streaks() for small, repeated queries.
+    :param habit_ID: (int, optional) The ID of a specific habit.
+    :param time_period: (str, optional) Periodicity of the habits, e.g. 'd', 'w' or '3/w',
+                                     only used if habit_ID is None.
+    :return: Iterator[HabitStreak] ordered by habit ID.
+    """
+    cursor = db.get_connection().cursor()
+    cursor.execute(*_habit_streak_query(habit_ID, time_period))
+    yield from map(HabitStreak._make, cursor)
+
+
+def get_habit_streaks(habit_ID=None, time_period=None):
+    """
+        Returns the current user's habits with their current and longest streak,
+        filtered optionally by habit ID or time period. The records are served from
+        habit_streak_cache as long as the database was not written.
+    :param habit_ID: (int, optional) The ID of a specific habit.
+    :param time_period: (str, optional) Periodicity of the habits, e.g. 'd', 'w' or '3/w',
+                                     only used if habit_ID is None.
+    :return: list[HabitStreak] ordered by habit ID.
+    """
+    time_period = periods.normalize(time_period) if periods.is_valid(time_period) else None
+    database = db.get_database()
+    if database.in_transaction():
+        # the uncommitted writes of this thread are not part of any generation
+        return list(iter_habit_streaks(habit_ID, time_period))
+    key = (database.db_name, db.current_user(), habit_ID, time_period)
+    return list(habit_streak_cache.get(key, db.generation(),
+                                       lambda: list(iter_habit_streaks(habit_ID, time_period))))
+
+
+def get_longest_streaks(time_period=None):
+    """
+        Returns the habits whose longest streak is the highest of all habits, several if
+        they share it, see get_streak_leaders().
+    :param time_period: (str, optional) Periodicity of the habits, e.g. 'd', 'w' or '3/w'.
+    :return: list[HabitStreak] ordered by habit ID.
+    """
+    return [get_habit_streaks(entry.habit_ID)[0] for entry in get_streak_leaders(time_period)]
+
+
+# methods to query completion rates, read from the rollup table habit_rollup only
+
+BUCKET_NAMES = {"d": "Day", "w": "Week", "m": "Month"}
+
+
+def _current_bucket(bucket):
+    """
+        Returns the start of the running bucket as ISO-8601 string.
+    """
+    return db.day_string(db.bucket_start(date.today().toordinal(), bucket))
+
+
+def iter_completion_rates(habit_ID=None, bucket="w"):
+    """
+        Yields the completion rate of every day, ISO week or month of the current user's
+        habits while the cursor walks the rollup table.
+        A rate is the share of the habit's periods completed in the bucket, e.g. 5 of 7
+        days of a week for a daily habit.
+    :param habit_ID: (int, optional) The ID of a specific habit.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :return: Iterator[CompletionRate] ordered by habit ID and period.
+    """
+    query = f"""
+            SELECT habit_rollup.habit_ID, habit_rollup.period_start, habit_rollup.completed,
+            habit_rollup.expected, {db.ROLLUP_RATE}
+            FROM habit_info JOIN habit_rollup
+            ON habit_info.habit_ID = habit_rollup.habit_ID
+            WHERE habit_info.user_ID IS ? AND habit_rollup.bucket = ? AND habit_rollup.expected > 0
+            """
+    parameters = (db.current_user(), bucket)
+    if habit_ID is not None:
+        query, parameters = query + " AND habit_info.habit_ID = ?", parameters + (habit_ID,)
+
+    cursor = db.get_connection().cursor()
+    cursor.execute(query + " ORDER BY habit_rollup.habit_ID, habit_rollup.period_start", parameters)
+    yield from map(CompletionRate._make, cursor)
+
+
+def get_completion_rates(habit_ID=None, bucket="w"):
+    """
+        Returns the completion rates of iter_completion_rates() as a list.
+    :param habit_ID: (int, optional) The ID of a specific habit.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :return: list[CompletionRate] ordered by habit ID and period.
+    """
+    return list(iter_completion_rates(habit_ID, bucket))
+
+
+def get_completion_trend(habit_ID, bucket="w", count=4):
+    """
+        Compares the completion rate of the last finished periods of a habit with the
+        periods before them.
+    :param habit_ID: (int) The ID of the habit.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :param count: (int) Number of buckets on each side of the comparison.
+    :return: CompletionTrend: the previous rate and the change are None if there are
+                              not enough periods; None if the habit has no rollup rows.
+    """
+    cursor = db.get_connection().cursor()
+    cursor.execute("""
+                   SELECT MIN(completed, expected), expected
+                   FROM habit_rollup
+                   WHERE habit_ID = ? AND bucket = ? AND period_start < ? AND expected > 0
+                   ORDER BY period_start DESC LIMIT ?
+                   """, (habit_ID, bucket, _current_bucket(bucket), 2 * count))
+    rows = cursor.fetchall()
+    if not rows:
+        return None
+
+    def rate(part):
+        return sum(row[0] for row in part) / sum(row[1] for row in part) if part else None
+
+    recent, previous = rate(rows[:count]), rate(rows[count:])
+    return CompletionTrend(recent, previous, None if previous is None else recent - previous)
+
+
+def get_best_and_worst_period(habit_ID, bucket="m"):
+    """
+        Finds the buckets with the highest and the lowest completion rate of a habit.
+        The running bucket is left out, as it is not over yet. Of buckets with the
+        same rate the most recent one is returned.
+    :param habit_ID: (int) The ID of the habit.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :return: tuple: (PeriodRate, PeriodRate) of the best and the worst bucket, or None
+                    if the habit has no finished buckets.
+    """
+    current = _current_bucket(bucket)
+    query = f"""
+            SELECT period_start, {db.ROLLUP_RATE} AS rate
+            FROM habit_rollup
+            WHERE habit_ID = ? AND bucket = ? AND period_start < ? AND expected > 0
+            ORDER BY rate {{}}, period_start DESC LIMIT 1
+            """
+    cursor = db.get_connection().cursor()
+    cursor.execute(query.format("DESC"), (habit_ID, bucket, current))
+    best = cursor.fetchone()
+    if best is None:
+        return None
+    cursor.execute(query.format("ASC"), (habit_ID, bucket, current))
+    return PeriodRate._make(best), PeriodRate._make(cursor.fetchone())
+
+
+# methods to query the history of a habit, read from its completion bitmap
+
+def get_habit_history(habit_ID, year=None):
+    """
+        Sums up the completions of a habit in a year, together with its streaks and its
+        longest gap, all taken from the completion bitmap.
+    :param habit_ID: (int) The ID of the habit.
+    :param year: (int, optional) The year, the current year if not provided.
+    :return: HabitHistory, or None if the habit was never completed.
+    """
+    habit_bitmap = db.get_habit_bitmap(habit_ID)
+    if habit_bitmap is None or not habit_bitmap.bits:
+        return None
+    records = get_habit_streaks(habit_ID)
+    time_period = records[0].habit_time_period if records else "d"
+    year = year or date.today().year
+
+    first = date(year, 1, 1).toordinal()
+    completed = bin(bitmap.window(habit_bitmap, first, date(year, 12, 31).toordinal() - first + 1)).count("1")
+    if time_period == "d":
+        current, longest = bitmap.streaks(habit_bitmap)
+    else:
+        current, longest = db.compute_streaks(bitmap.completion_days(habit_bitmap), time_period)
+    return HabitHistory(habit_ID, year, completed, current, longest, bitmap.longest_gap(habit_bitmap),
+                        bitmap.last_completion(habit_bitmap), habit_bitmap)
+
+
+# methods to rank the habits, every leaderboard reads only the top rows of an index
+
+# column of habit_streak ranked by get_streak_leaderboard()
+STREAK_LEADERBOARDS = {"current": "habit_counter", "longest": "habit_counter_max"}
+
+
+def _ranked(rows):
+    """
+        Numbers rows ordered by their value, best first. Rows with the same value share
+        a rank and the rank after them is skipped, e.g. 1, 2, 2, 4.
+    :param rows: (habit_ID, habit_name, habit_time_period, value) tuples.
+    :return: list[LeaderboardEntry]
+    """
+    entries, rank, previous = [], 0, None
+    for position, (habit_ID, habit_name, habit_time_period, value) in enumerate(rows, 1):
+        if value != previous:
+            rank, previous = position, value
+        entries.append(LeaderboardEntry(rank, habit_ID, habit_name, habit_time_period, value))
+    return entries
+
+
+def _top(columns, source, value, key, parameters, limit):
+    """
+        Reads the rows with the limit highest values; rows tied with the last of them
+        are cut by habit ID. The query walks an index on value from the top and stops
+        after limit rows, so the work grows with limit and not with the number of habits.
+    :param columns: SELECT list ending with value.
+    :param source: FROM and WHERE clause.
+    :param value: SQL expression ranked, highest first.
+    :param key: habit_ID column of the ranked table; ordering by it keeps the index
+                sorted, so tied rows need no sort of their own.
+    :param parameters: Parameters of source.
+    :param limit: (int) Number of rows.
+    :return: list[tuple] ordered by value, then habit ID.
+    """
+    if limit < 1:
+        return []
+    cursor = db.get_connection().cursor()
+    cursor.execute(f"""
+                   SELECT {columns} {source}
+                   ORDER BY {value} DESC, {key} LIMIT ?
+                   """, parameters + (limit,))
+    return cursor.fetchall()
+
+
+def _streak_source(by, time_period):
+    """
+        Returns the streak column ranked and the FROM and WHERE clause with its parameters
+        of the current user's habits, optionally of one periodicity.
+    :return: tuple[str, str, tuple]
+    """
+    value = "habit_streak." + STREAK_LEADERBOARDS[by]
+    # CROSS JOIN keeps habit_streak as the outer loop, so its index is read top-down
+    # instead of all habits of the user being collected through habit_info_user
+    source = """
+             FROM habit_streak CROSS JOIN habit_info ON habit_info.habit_ID = habit_streak.habit_ID
+             WHERE habit_info.user_ID IS ?
+             """
+    parameters = (db.current_user(),)
+    if periods.is_valid(time_period):
+        source, parameters = (source + " AND habit_info.habit_time_period = ?",
+                              parameters + (periods.normalize(time_period),))
+    return value, source, parameters
+
+
+def get_streak_leaderboard(by="longest", time_period=None, limit=10):
+    """
+        Ranks the current user's habits by their current or longest streak.
+    :param by: (str) 'current' or 'longest', see STREAK_LEADERBOARDS.
+    :param time_period: (str, optional) Periodicity of the habits, e.g. 'd', 'w' or '3/w'.
+    :param limit: (int) Number of habits; habits tied with the last of them are cut by habit ID.
+    :return: list[LeaderboardEntry] with the streak as value, best first.
+    """
+    value, source, parameters = _streak_source(by, time_period)
+    columns = f"habit_info.habit_ID, habit_info.habit_name, habit_info.habit_time_period, {value}"
+    return _ranked(_top(columns, source, value, "habit_streak.habit_ID", parameters, limit))
+
+
+def get_streak_leaders(time_period=None):
+    """
+        Returns all habits sharing the highest longest streak, unlike the leaderboard
+        that cuts ties at its limit. The highest value is read from the top of the index,
+        then the range of rows with that value.
+    :param time_period: (str, optional) Periodicity of the habits, e.g. 'd', 'w' or '3/w'.
+    :return: list[LeaderboardEntry] of rank 1, ordered by habit ID.
+    """
+    value, source, parameters = _streak_source("longest", time_period)
+    cursor = db.get_connection().cursor()
+    cursor.execute(f"""
+                   SELECT habit_info.habit_ID, habit_info.habit_name, habit_info.habit_time_period, {value}
+                   {source} AND {value} = (SELECT {value} {source} ORDER BY {value} DESC LIMIT 1)
+                   ORDER BY habit_streak.habit_ID
+                   """, parameters + parameters)
+    return _ranked(cursor.fetchall())
+
+
+def last_finished_period(bucket):
+    """
+        Returns the start of the last day, ISO week or month that is over.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :return: str: ISO-8601 date
+    """
+    current = db.bucket_start(date.today().toordinal(), bucket)
+    return db.day_string(db.bucket_start(current - 1, bucket))
+
+
+def get_completion_leaderboard(bucket="w", day=None, limit=10):
+    """
+        Ranks the current user's habits by their completion rate in one day, ISO week or
+        month, read from the rollup table habit_rollup.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :param day: (datetime.date, optional) A day of the period, the last finished
+                                       period if not provided.
+    :param limit: (int) Number of habits; habits tied with the last of them are cut by habit ID.
+    :return: list[LeaderboardEntry] with the rate as value, best first.
+    """
+    if day is None:
+        period_start = last_finished_period(bucket)
+    else:
+        period_start = db.day_string(db.bucket_start(day.toordinal(), bucket))
+    value = f"({db.ROLLUP_RATE})"
+    source = """
+             FROM habit_rollup CROSS JOIN habit_info ON habit_info.habit_ID = habit_rollup.habit_ID
+             WHERE habit_rollup.bucket = ? AND habit_rollup.period_start = ?
+             AND habit_rollup.expected > 0 AND habit_info.user_ID IS ?
+             """
+    parameters = (bucket, period_start, db.current_user())
+    columns = f"habit_info.habit_ID, habit_info.habit_name, habit_info.habit_time_period, {value}"
+    return _ranked(_top(columns, source, value, "habit_rollup.habit_ID", parameters, limit))
+
+
+# analytics over all users, every shard is read in a worker process of its own
+
+# fields of get_cross_user_summary(), added up over the shards except longest_streak
+SUMMARY_FIELDS = ("users", "habits", "daily_habits", "weekly_habits", "other_habits", "completions",
+                  "longest_streak")
+
+
+def _shard_summary(db_name):
+    """
+        Aggregates one database file, runs in a worker process with a read-only connection.
+    :return: dict with the keys of SUMMARY_FIELDS
+    """
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+                       SELECT COUNT(DISTINCT habit_info.user_ID) + MAX(habit_info.user_ID IS NULL),
+                       COUNT(*),
+                       TOTAL(habit_info.habit_time_period = 'd'),
+                       TOTAL(habit_info.habit_time_period = 'w'),
+                       TOTAL(habit_info.habit_time_period NOT IN ('d', 'w')),
+                       MAX(habit_streak.habit_counter_max)
+                       FROM habit_info
+                       LEFT JOIN habit_streak ON habit_streak.habit_ID = habit_info.habit_ID
+                       """)
+        users, habits, daily, weekly, other, longest = cursor.fetchone()
+        cursor.execute("SELECT COUNT(*) FROM habit_log WHERE habit_completed")
+        completions = cursor.fetchone()[0]
+    finally:
+        conn.close()
+    return dict(zip(SUMMARY_FIELDS, (users or 0, habits, int(daily), int(weekly), int(other),
+                                     completions, longest or 0)))
+
+
+def get_cross_user_summary(workers=None):
+    """
+        Aggregates the habits of all users. With db.connect_shards() the shards are
+        read in parallel by a pool of processes, each with its own read-only connection,
+        and the results are added up; otherwise the current database is read directly.
+    :param workers: (int, optional) Number of processes, one per CPU if not provided.
+    :return: dict: users, habits, daily_habits, weekly_habits, other_habits (all other
+                   periodicities), completions and the longest streak of any habit.
+    """
+    router = db.get_router()
+    if router is None:
+        return _shard_summary(db.get_database().db_name)
+
+    paths = router.shard_paths()
+    summary = dict.fromkeys(SUMMARY_FIELDS, 0)
+    if not paths:
+        return summary
+    with ProcessPoolExecutor(max_workers=min(workers or os.cpu_count(), len(paths))) as pool:
+        for shard in pool.map(_shard_summary, paths):
+            for field in SUMMARY_FIELDS:
+                if field == "longest_streak":
+                    summary[field] = max(summary[field], shard[field])
+                else:
+                    summary[field] += shard[field]
+    return summary
+
+
+# methods to display the results above in the CLI, they only format and print
+
+def _print_habit_streaks(records, line):
+    """
+        Prints one line per record as the cursor delivers them, or a notice if there
+        are none. records may be a list or a generator of HabitStreak records.
+    """
+    empty = True
+    for record in records:
+        if empty:
+            print("\n--- Habits and Streaks ---")
+            empty = False
+        print(line(record))
+    if empty:
+        print("\nNo matching habits found.")
+
+
+def view_habits_by_time_period(time_period=None, rows=None):
     """
         Displays all habits and their current streaks, filtered optionally by time period.
 
     :param time_period: str, optional; Filter for the habit time period.
-                                     'd' for daily habits, 'w' for weekly habits.
+                                     e.g. 'd' for daily, 'w' for weekly or '3/w' habits.
                                      If not provided, shows all habits.
+    :param rows: iterable, optional; HabitStreak records to display instead of
+                                     querying the database.
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            if time_period in ("d", "w"):
-                cursor.execute("""
-                                SELECT habit_info.habit_ID, 
-                                habit_info.habit_name, 
-                                habit_info.habit_time_period, 
-                                habit_streak.habit_counter 
-                                FROM habit_info JOIN habit_streak 
-                                ON habit_info.habit_ID = habit_streak.habit_ID
-                                WHERE habit_info.habit_time_period = ?
-                            """, (time_period,))
-            else:
-                cursor.execute("""
-                                SELECT habit_info.habit_ID, 
-                                habit_info.habit_name, 
-                                habit_info.habit_time_period, 
-                                habit_streak.habit_counter
-                                FROM habit_info JOIN habit_streak 
-                                ON habit_info.habit_ID = habit_streak.habit_ID
-                            """)
-
-            rows = cursor.fetchall()
-            if not rows:
-                print("\nNo matching habits found.")
-                return
-
-            print("\n--- Habits and Streaks ---")
-            for row in rows:
-                habit_ID, habit_name, habit_time_period, habit_counter = row
-                period_str = "Daily" if time_period == "d" else "Weekly"
-                print(f"[{habit_ID}] {habit_name} ({period_str}) "
-                      f"– Current streak: {habit_counter}")
+        _print_habit_streaks(get_habit_streaks(time_period=time_period) if rows is None else rows,
+                             lambda record: f"[{record.habit_ID}] {record.habit_name} "
+                                            f"({periods.describe(record.habit_time_period)}) "
+                                            f"– Current streak: {record.habit_counter}")
     except sqlite3.OperationalError as e:
         print("Failed to retrieve habit streak information:", e)
 
 
-def analyze_current_streak_max(habit_ID=None, time_period=None):
+def analyze_current_streak_max(habit_ID=None, time_period=None, rows=None):
     """
         Displays the longest streaks for habits, filtered by habit ID or time period.
     :param habit_ID: (int, optional) The ID of a specific habit to analyze.
                                   If provided, only this habit is analyzed.
-    :param time_period: (str, optional) Time period filter, either 'd' for daily or 'w' for weekly.
+    :param time_period: (str, optional) Time period filter, e.g. 'd', 'w' or '3/w'.
                                      If provided and habit_ID is None, all habits of this type are shown.
+    :param rows: (iterable, optional) HabitStreak records to display instead of
+                                   querying the database.
+    :return:
+    """
+    try:
+        _print_habit_streaks(get_habit_streaks(habit_ID, time_period) if rows is None else rows,
+                             lambda record: f"[{record.habit_ID}] {record.habit_name} "
+                                            f"({periods.describe(record.habit_time_period)}) "
+                                            f"Longest streak: {record.habit_counter_max}")
+    except sqlite3.OperationalError as e:
+        print("Failed to retrieve habit streak information:", e)
+
+
+def view_leaderboard(entries, title, value_format="{}"):
+    """
+        Displays a leaderboard with the rank of every habit.
+    :param entries: list[LeaderboardEntry] of get_streak_leaderboard() or
+                    get_completion_leaderboard().
+    :param title: (str) Heading of the leaderboard.
+    :param value_format: (str) Format of the value, e.g. "{:.0%}" for rates.
+    :return:
+    """
+    if not entries:
+        print(f"\n--- {title} ---\nNo matching habits found.")
+        return
+    print(f"\n--- {title} ---")
+    for entry in entries:
+        print(f"{entry.rank:>3}. [{entry.habit_ID}] {entry.habit_name} "
+              f"({periods.describe(entry.habit_time_period)}): {value_format.format(entry.value)}")
+
+
+def view_completion_rates(habit_ID, bucket="w", count=4):
+    """
+        Displays the completion rates of a habit per bucket, its trend and its best
+        and worst bucket.
+    :param habit_ID: (int) The ID of the habit.
+    :param bucket: (str) 'd' for days, 'w' for weeks or 'm' for months.
+    :param count: (int) Number of buckets compared for the trend.
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            if habit_ID is not None:
-                cursor.execute("""
-                                SELECT habit_info.habit_ID,
-                                       habit_info.habit_name,
-                                       habit_info.habit_time_period,
-                                       habit_streak.habit_counter_max
-                                FROM habit_info
-                                JOIN habit_streak 
-                                ON habit_info.habit_ID = habit_streak.habit_ID
-                                WHERE habit_info.habit_ID = ?
-                            """, (habit_ID,))
-            elif time_period in ("d", "w"):
-                cursor.execute("""
-                                SELECT habit_info.habit_ID, 
-                                habit_info.habit_name, 
-                                habit_info.habit_time_period, 
-                                habit_streak.habit_counter_max
-                                FROM habit_info 
-                                JOIN habit_streak 
-                                ON habit_info.habit_ID = habit_streak.habit_ID
-                                WHERE habit_info.habit_time_period = ?
-                            """, (time_period,))
+        empty = True
+        for record in iter_completion_rates(habit_ID, bucket):
+            if empty:
+                print(f"\n--- Completion rate per {BUCKET_NAMES[bucket].lower()} ---")
+                empty = False
+            print(f"{BUCKET_NAMES[bucket]} of {record.period_start}: "
+                  f"{record.completed}/{record.expected} ({record.rate:.0%})")
+        if empty:
+            print("\nNo completions recorded for this habit yet.")
+            return
+
+        trend = get_completion_trend(habit_ID, bucket, count)
+        if trend is None:
+            return
+        if trend.change is None:
+            print(f"Last {count}: {trend.recent:.0%}")
+        else:
+            print(f"Last {count}: {trend.recent:.0%}, {count} before: {trend.previous:.0%} "
+                  f"({trend.change:+.0%})")
+        extremes = get_best_and_worst_period(habit_ID, bucket)
+        if extremes:
+            best, worst = extremes
+            print(f"Best: {best.period_start} ({best.rate:.0%}), worst: {worst.period_start} ({worst.rate:.0%})")
+    except sqlite3.OperationalError as e:
+        print("Failed to retrieve completion rates:", e)
+
+
+HEATMAP_DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+
+
+def render_heatmap(habit_bitmap, year, today=None):
+    """
+        Draws the completions of a year as a calendar with one row per weekday and one
+        column per ISO week, like the contribution graph of GitHub. '#' marks a
+        completion, '.' a day without one; days outside the year, before the first
+        day of the habit or after today stay blank.
+    :param habit_bitmap: bitmap.Bitmap of the habit.
+    :param year: (int) The year to draw.
+    :param today: (datetime.date, optional) Last day to draw, date.today() if not provided.
+    :return: str
+    """
+    first, last = date(year, 1, 1).toordinal(), date(year, 12, 31).toordinal()
+    last = min(last, (today or date.today()).toordinal())
+    monday = db.bucket_start(first, "w")
+    weeks = (date(year, 12, 31).toordinal() - monday) // 7 + 1
+
+    labels = [" "] * (weeks + 3)
+    for month in range(1, 13):
+        column = (db.bucket_start(date(year, month, 1).toordinal(), "w") - monday) // 7
+        labels[column:column + 3] = date(year, month, 1).strftime("%b")
+    lines = ["    " + "".join(labels).rstrip()]
+    for weekday, name in enumerate(HEATMAP_DAYS):
+        cells = []
+        for week in range(weeks):
+            day = monday + week * 7 + weekday
+            if day < first or day > last or day < habit_bitmap.first_day:
+                cells.append(" ")
             else:
-                cursor.execute("""
-                                SELECT habit_info.habit_ID, 
-                                habit_info.habit_name, 
-                                habit_info.habit_time_period,
-                                habit_streak.habit_counter_max
-                                FROM habit_info 
-                                JOIN habit_streak 
-                                ON habit_info.habit_ID = habit_streak.habit_ID
-                            """)
-
-            rows = cursor.fetchall()
-            if not rows:
-                print("\nNo matching habits found.")
-                return
+                cells.append("#" if bitmap.completed_on(habit_bitmap, day) else ".")
+        lines.append(f"{name} " + "".join(cells).rstrip())
+    return "\n".join(lines)
 
-            print("\n--- Habits and Streaks ---")
-            for row in rows:
-                habit_ID, habit_name, habit_time_period, habit_counter_max = row
-                period_str = "Daily" if habit_time_period == "d" else "Weekly"
-                print(f"[{habit_ID}] {habit_name} ({period_str}) "
-                      f"Longest streak: {habit_counter_max}")
+
+def view_habit_history(habit_ID, year=None):
+    """
+        Displays the completions of a habit in a year as heatmap, together with its
+        streaks and its longest gap, see get_habit_history().
+    :param habit_ID: (int) The ID of the habit.
+    :param year: (int, optional) The year to show, the current year if not provided.
+    :return:
+    """
+    try:
+        history = get_habit_history(habit_ID, year)
+        if history is None:
+            print("\nNo completions recorded for this habit yet.")
+            return
+        print(f"\n--- History {history.year}: {history.completed} days completed ---")
+        print(render_heatmap(history.bitmap, history.year))
+        print(f"Current streak: {history.current_streak}, longest streak: {history.longest_streak}, "
+              f"longest gap: {history.longest_gap} days, "
+              f"last completed: {history.last_completed}")
     except sqlite3.OperationalError as e:
-        print("Failed to retrieve habit streak information:", e)
+        print("Failed to retrieve the habit history:", e)
@@ -0,0 +1,203 @@
+# ANALYZE_NP.PY
+"""The analyze_np.py-file is the vectorized analytics backend of analyze.py.
+Instead of walking the log of one habit after another, the complete habit_log is
+loaded with a single query into NumPy arrays (habit IDs and day ordinals as int32)
+and the streaks of all habits are computed at once with array operations: every
+completion is put into the period of its habit with the bucket functions of
+periods.py, done for all rows at once, the completions per period are counted and
+the streaks are found by run-length encoding the met periods.
+The numbers are the same as the ones of db.compute_streaks() and
+db.recompute_streaks(): a streak is a run of consecutive periods in which the habit
+was completed often enough.
+"""
+
+from collections import namedtuple
+from datetime import date
+import numpy as np
+import db
+import periods
+
+# the completions of all habits, one entry per completed habit_log row, and the periodicity
+# of every habit: its unit as index into UNITS (-1 if unknown), length and target
+LogArrays = namedtuple("LogArrays", ["habit_ids", "days", "all_habit_ids", "units", "lengths", "targets"])
+
+# the streaks of all habits as runs of consecutive met periods, ordered by habit and day;
+# missed_days is the last day of the period after a streak, the day it broke
+StreakRuns = namedtuple("StreakRuns", ["habit_ids", "first_days", "last_days", "lengths", "missed_days"])
+
+UNITS = ("d", "w", "m")
+
+# the day number of 1970-01-01, where datetime64 starts counting
+_EPOCH_DAY = date(1970, 1, 1).toordinal()
+
+
+def load_log_arrays():
+    """
+        Loads all completions from 'habit_log' with one bulk fetch.
+    :return: LogArrays: habit_ids and days (int32 day ordinals) per completion, sorted by
+             habit and day, plus all_habit_ids and their periodicities from 'habit_info'.
+    """
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT habit_ID, habit_time_period FROM habit_info ORDER BY habit_ID")
+    habits = cursor.fetchall()
+    all_habit_ids = np.array([row[0] for row in habits], dtype=np.int32)
+    # a habit with an unknown time period never continues a streak
+    periodicities = [periods.get(row[1]) or periods.Periodicity(None, 1, 1) for row in habits]
+    units = np.array([UNITS.index(p.unit) if p.unit else -1 for p in periodicities], dtype=np.int32)
+    lengths = np.array([p.length for p in periodicities], dtype=np.int32)
+    targets = np.array([p.target for p in periodicities], dtype=np.int32)
+
+    # the whole log comes back as two comma separated strings in one row, parsing them
+    # with NumPy is much faster than building a Python tuple per log entry
+    cursor.execute("""
+                    SELECT group_concat(habit_ID), group_concat(habit_day)
+                    FROM habit_log
+                    WHERE habit_completed
+                    """)
+    habit_ids, days = (np.fromstring(column or "", dtype=np.int32, sep=",")
+                       for column in cursor.fetchone())
+
+    order = np.lexsort((days, habit_ids))
+    return LogArrays(habit_ids[order], days[order], all_habit_ids, units, lengths, targets)
+
+
+def _unit_index(days, units):
+    """
+        The bucket functions of periods.BUCKETS for arrays: the number of the day, ISO
+        week or month containing each day, counted from day number 1. Unknown units
+        count days.
+    :return: array of int64
+    """
+    days = days.astype(np.int64)
+    months = (days - _EPOCH_DAY).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64) + 1969 * 12
+    return np.select([units == 1, units == 2], [(days - 1) // 7, months], days - 1)
+
+
+def _unit_start(index, units):
+    """
+        The inverse of _unit_index(), like periods.UNIT_STARTS: the first day of each unit.
+    :return: array of int64
+    """
+    months = (index - 1969 * 12).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64) + _EPOCH_DAY
+    return np.select([units == 1, units == 2], [index * 7 + 1, months], index + 1)
+
+
+def streak_runs(log=None):
+    """
+        Splits the completions into streaks (runs of consecutive periods that were met).
+    :param log: LogArrays, loaded from the database if not provided.
+    :return: StreakRuns
+    """
+    if log is None:
+        log = load_log_arrays()
+
+    # completions of habits that no longer exist in habit_info are ignored
+    known = np.isin(log.habit_ids, log.all_habit_ids)
+    habit_ids, days = log.habit_ids[known], log.days[known]
+    habit_rows = np.searchsorted(log.all_habit_ids, habit_ids)
+    units, lengths, targets = log.units[habit_rows], log.lengths[habit_rows], log.targets[habit_rows]
+    if not len(days):
+        return StreakRuns(habit_ids, days, days, days, days)
+
+    # 1. put every completion into its period, the rows of one period are neighbours
+    buckets = _unit_index(days, units) // lengths
+    new_period = np.concatenate(([True], (habit_ids[1:] != habit_ids[:-1]) | (buckets[1:] != buckets[:-1])))
+    period_starts = np.flatnonzero(new_period)
+    period_ends = np.concatenate((period_starts[1:], [len(days)])) - 1
+
+    # 2. keep the periods with enough completions
+    met = (period_ends - period_starts + 1) >= targets[period_starts]
+    period_starts, period_ends = period_starts[met], period_ends[met]
+    if not len(period_starts):
+        return StreakRuns(*(days[:0],) * 5)
+    habit_ids, buckets, units = habit_ids[period_starts], buckets[period_starts], units[period_starts]
+
+    # 3. a met period continues the streak of the previous one if it is the same habit one period later
+    continues = (habit_ids[1:] == habit_ids[:-1]) & (np.diff(buckets) == 1) & (units[1:] >= 0)
+    starts = np.flatnonzero(np.concatenate(([True], ~continues)))
+    ends = np.concatenate((starts[1:], [len(buckets)])) - 1
+
+    # the period after the last one of a streak ends the day before the period after it starts
+    last_lengths = lengths[period_starts[ends]]
+    missed_days = np.where(units[ends] >= 0,
+                           _unit_start((buckets[ends] + 2) * last_lengths, units[ends]) - 1,
+                           days[period_ends[ends]] + 1)
+    return StreakRuns(habit_ids[starts], days[period_starts[starts]], days[period_ends[ends]],
+                      (ends - starts + 1).astype(np.int32), missed_days)
+
+
+def _per_habit(log, runs, values, reduce):
+    """
+        Reduces one value per streak to one value per habit, 0 for habits without completions.
+    :return: tuple: (habit IDs, values) as arrays ordered by habit ID.
+    """
+    result = np.zeros(len(log.all_habit_ids), dtype=np.int32)
+    if len(runs.habit_ids):
+        first_run = np.flatnonzero(np.concatenate(([True], runs.habit_ids[1:] != runs.habit_ids[:-1])))
+        result[np.searchsorted(log.all_habit_ids, runs.habit_ids[first_run])] = reduce(values, first_run)
+    return log.all_habit_ids, result
+
+
+def longest_streaks(log=None):
+    """
+        Computes the longest streak of every habit.
+    :param log: LogArrays, loaded from the database if not provided.
+    :return: tuple: (habit IDs, longest streaks) as arrays ordered by habit ID.
+    """
+    if log is None:
+        log = load_log_arrays()
+    runs = streak_runs(log)
+    return _per_habit(log, runs, runs.lengths, np.maximum.reduceat)
+
+
+def current_streaks(log=None):
+    """
+        Computes the current streak (the streak ending with the last met period) of every habit.
+    :param log: LogArrays, loaded from the database if not provided.
+    :return: tuple: (habit IDs, current streaks) as arrays ordered by habit ID.
+    """
+    if log is None:
+        log = load_log_arrays()
+    runs = streak_runs(log)
+
+    def last_of_group(values, first_run):
+        return values[np.concatenate((first_run[1:], [len(values)])) - 1]
+
+    return _per_habit(log, runs, runs.lengths, last_of_group)
+
+
+def streak_run_lengths(log=None):
+    """
+        Returns the lengths of all streaks of every habit in chronological order.
+    :param log: LogArrays, loaded from the database if not provided.
+    :return: dict: {habit_ID: array of streak lengths}
+    """
+    runs = streak_runs(log)
+    return _split_by_habit(runs, runs.lengths)
+
+
+def streak_break_dates(log=None):
+    """
+        Returns the dates on which the streaks of every habit broke, i.e. the last day of
+        the period after a streak that was followed by another streak.
+    :param log: LogArrays, loaded from the database if not provided.
+    :return: dict: {habit_ID: list of datetime.date}
+    """
+    runs = streak_runs(log)
+    if not len(runs.habit_ids):
+        return {}
+    followed = np.concatenate((runs.habit_ids[1:] == runs.habit_ids[:-1], [False]))
+    broken = StreakRuns(*(field[followed] for field in runs))
+    return {habit_ID: [date.fromordinal(int(day)) for day in days]
+            for habit_ID, days in _split_by_habit(broken, broken.missed_days).items()}
+
+
+def _split_by_habit(runs, values):
+    """
+        Groups one value per streak by the habit the streak belongs to.
+    :return: dict: {habit_ID: array of values}
+    """
+    if not len(runs.habit_ids):
+        return {}
+    first_run = np.flatnonzero(np.concatenate(([True], runs.habit_ids[1:] != runs.habit_ids[:-1])))
+    return dict(zip(runs.habit_ids[first_run].tolist(), np.split(values, first_run[1:])))
@@ -0,0 +1,284 @@
+# BENCHMARK.PY
+"""The benchmark.py-file measures the hot paths of db.py and analyze.py on large
+databases. It builds a synthetic database of N habits with M days of log entries
+(with a configurable completion density and share of weekly and custom periodicity
+habits) and times
+- creating a Habit, one by one and 100 at a time with Habit.create_many(),
+- checking off a habit (check_off_habit_in_db, which also updates the streak),
+- get_all_habits, view_habits_by_time_period and analyze_current_streak_max,
+- the streak computation of the vectorized backend in analyze_np.py against a Python
+  loop that reads and analyzes one habit after another,
+- recompute_streaks in one process and with --workers processes.
+The results can be written to a JSON file, and a later run can be compared against it
+with a threshold: the run fails if a path got slower by more than that percentage.
+    python benchmark.py --habits 1000 --days 1500 --output before.json
+    python benchmark.py --habits 1000 --days 1500 --compare before.json --threshold 20
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import time
+from contextlib import redirect_stdout
+from datetime import date, timedelta
+import analyze
+import analyze_np
+import db
+from habit import Habit
+
+
+# periodicities of the habits built with a custom_share, see periods.py
+CUSTOM_PERIODS = ("m", "3d", "2w", "3/w", "10/m")
+
+
+def build_database(db_name, habits, days, density=0.8, weekly_share=0.3, seed=0, custom_share=0.0):
+    """
+        Creates a database with synthetic habits and log entries.
+    :param db_name: Path of the new database file, an existing file is replaced.
+    :param habits: Number of habits.
+    :param days: Number of days of history per habit.
+    :param density: Probability that a habit is checked off on a given day.
+    :param weekly_share: Share of weekly habits, the others are daily.
+    :param seed: Seed of the random generator, the same seed builds the same database.
+    :param custom_share: Share of habits with one of the CUSTOM_PERIODS.
+    :return: int: Number of log entries written.
+    """
+    if os.path.exists(db_name):
+        os.remove(db_name)
+    db.connect(db_name)
+    db.initialize_db()
+
+    rng = random.Random(seed)
+    first_day = date.today() - timedelta(days=days)
+    dates = [(first_day + timedelta(days=offset)).isoformat() for offset in range(days)]
+
+    def time_period():
+        share = rng.random()
+        if share < custom_share:
+            return rng.choice(CUSTOM_PERIODS)
+        return "w" if share < custom_share + weekly_share else "d"
+
+    with db.transaction() as conn:
+        cursor = conn.cursor()
+        cursor.executemany("""
+                            INSERT INTO habit_info (habit_ID, habit_name, habit_description,
+                            habit_time_period, habit_date_created)
+                            VALUES (?, ?, ?, ?, ?)
+                           """,
+                           ((habit_ID, f"Habit {habit_ID}", "synthetic habit",
+                             time_period(), dates[0])
+                            for habit_ID in range(1, habits + 1)))
+        cursor.executemany("INSERT INTO habit_streak (habit_ID) VALUES (?)",
+                           ((habit_ID,) for habit_ID in range(1, habits + 1)))
+        cursor.executemany("""
+                            INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created)
+                            VALUES (?, ?, ?)
+                           """,
+                           ((habit_ID, True, day)
+                            for habit_ID in range(1, habits + 1)
+                            for day in dates if rng.random() < density))
+        db.rebuild_rollup()
+        db.rebuild_bitmaps()
+        # the streaks as snapshot of the log, so check-offs only apply their own events
+        db.recompute_streaks()
+        cursor.execute("SELECT COUNT(*) FROM habit_log")
+        return cursor.fetchone()[0]
+
+
+def streaks_per_habit_loop():
+    """
+        Computes the streaks the scalar way: one query and one Python loop per habit.
+    :return: dict: {habit_ID: (current streak, longest streak)}
+    """
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT habit_ID, habit_time_period FROM habit_info")
+    streaks = {}
+    for habit_ID, time_period in cursor.fetchall():
+        cursor.execute("""
+                        SELECT habit_day FROM habit_log
+                        WHERE habit_ID = ? AND habit_completed
+                        ORDER BY habit_date_created
+                       """, (habit_ID,))
+        days = [row[0] for row in cursor]
+        streaks[habit_ID] = db.compute_streaks(days, time_period)
+    return streaks
+
+
+def streaks_vectorized(log=None):
+    """
+        Computes the streaks of all habits at once with analyze_np.py.
+    :param log: analyze_np.LogArrays, loaded from the database if not provided.
+    :return: dict: {habit_ID: (current streak, longest streak)}
+    """
+    if log is None:
+        log = analyze_np.load_log_arrays()
+    habit_ids, current = analyze_np.current_streaks(log)
+    _, longest = analyze_np.longest_streaks(log)
+    return dict(zip(habit_ids.tolist(), zip(current.tolist(), longest.tolist())))
+
+
+def timed(function, *args):
+    """
+        Runs function once and measures the wall time.
+    :return: tuple: (seconds, result of the function)
+    """
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def measure(function, calls):
+    """
+        Calls function(i) for i in range(calls) and measures every call.
+    :return: dict: number of calls and the median, minimum and total time in seconds.
+    """
+    seconds = [timed(function, i)[0] for i in range(calls)]
+    return {"calls": calls, "median": statistics.median(seconds),
+            "min": min(seconds), "total": sum(seconds)}
+
+
+def _check_off(habit_ID):
+    """
+        Checks off a habit the way the main menu does.
+    """
+    db.check_off_habit_in_db(habit_ID)
+
+
+def run_benchmarks(habits, repeat, workers=4):
+    """
+        Times all hot paths on the current database. Every habit is checked off at most
+        once, so the check-off benchmark runs at most once per habit.
+    :param habits: Number of habits in the database.
+    :param repeat: Number of calls per benchmark.
+    :param workers: Number of processes of the parallel recompute.
+    :return: dict: {benchmark name: result of measure()}
+    """
+    rng = random.Random(1)
+    check_off_ids = rng.sample(range(1, habits + 1), min(repeat, habits))
+    quiet = io.StringIO()
+
+    results = {}
+    with redirect_stdout(quiet):
+        results["get_all_habits"] = measure(lambda i: db.get_all_habits(), repeat)
+        # the same view with an empty cache on every call, then the hit and miss
+        # counters are started for the cached views
+        results["view_habits_uncached"] = measure(
+            lambda i: (analyze.habit_streak_cache.clear(), analyze.view_habits_by_time_period("d")), repeat)
+        analyze.habit_streak_cache.clear()
+        results["view_habits_by_time_period"] = measure(
+            lambda i: analyze.view_habits_by_time_period("d"), repeat)
+        results["analyze_current_streak_max"] = measure(
+            lambda i: analyze.analyze_current_streak_max(time_period="w"), repeat)
+        results["completion_rates"] = measure(
+            lambda i: analyze.get_completion_rates(check_off_ids[i % len(check_off_ids)], "m"), repeat)
+        results["check_off"] = measure(lambda i: _check_off(check_off_ids[i]), len(check_off_ids))
+        results["habit_creation"] = measure(
+            lambda i: Habit(name=f"Benchmark {i}", description="created by the benchmark",
+                            time_period="d"), repeat)
+        results["habit_creation_bulk_100"] = measure(
+            lambda i: Habit.create_many({"name": f"Benchmark {i}.{j}", "description": "created by the benchmark",
+                                         "time_period": "d"} for j in range(100)), repeat)
+
+    # the whole-log streak computations run once, they take much longer than the paths above
+    loop = measure(lambda i: streaks_per_habit_loop(), 1)
+    vectorized = measure(lambda i: streaks_vectorized(), 1)
+    if streaks_per_habit_loop() != streaks_vectorized():
+        raise SystemExit("The vectorized streaks differ from the per-habit loop!")
+    results["streaks_per_habit_loop"] = loop
+    results["streaks_vectorized"] = vectorized
+    with redirect_stdout(quiet):
+        results["recompute_streaks"] = measure(lambda i: db.recompute_streaks(), 1)
+        results["recompute_streaks_parallel"] = measure(lambda i: db.recompute_streaks(workers=workers), 1)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+        Compares the median times with the ones of an earlier run.
+    :param results: Results of run_benchmarks().
+    :param baseline: Results of the earlier run.
+    :param threshold: Allowed slowdown in percent.
+    :return: list[str]: Names of the benchmarks that got slower by more than threshold.
+    """
+    regressions = []
+    print(f"\n{'benchmark':<30}{'before':>12}{'now':>12}{'change':>10}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, now = baseline[name]["median"], result["median"]
+        change = (now - before) / before * 100 if before else 0.0
+        flag = ""
+        if change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<30}{before * 1000:>10.3f}ms{now * 1000:>10.3f}ms{change:>+9.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hot paths of db.py and analyze.py.")
+    parser.add_argument("--db", default="benchmark.db", help="database file to build")
+    parser.add_argument("--habits", type=int, default=1000, help="number of habits")
+    parser.add_argument("--days", type=int, default=1500, help="days of history per habit")
+    parser.add_argument("--density", type=float, default=0.8, help="check-off probability per day")
+    parser.add_argument("--weekly-share", type=float, default=0.3, help="share of weekly habits")
+    parser.add_argument("--custom-share", type=float, default=0.0,
+                        help="share of habits with other periodicities, e.g. monthly or 3/w")
+    parser.add_argument("--repeat", type=int, default=50, help="calls per benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="processes of the parallel recompute")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="allowed slowdown in percent when comparing (default: 10)")
+    args = parser.parse_args(argv)
+
+    with redirect_stdout(io.StringIO()):
+        seconds, rows = timed(build_database, args.db, args.habits, args.days,
+                              args.density, args.weekly_share, 0, args.custom_share)
+    print(f"Built {args.db}: {args.habits} habits, {rows} log entries in {seconds:.2f} s")
+
+    results = run_benchmarks(args.habits, args.repeat, args.workers)
+    print(f"\n{'benchmark':<30}{'calls':>7}{'median':>12}{'min':>12}")
+    for name, result in results.items():
+        print(f"{name:<30}{result['calls']:>7}{result['median'] * 1000:>10.3f}ms"
+              f"{result['min'] * 1000:>10.3f}ms")
+    cache = analyze.habit_streak_cache.stats()
+    print(f"\nStreak cache: {cache['hits']} hits, {cache['misses']} misses "
+          f"({cache['hit_rate']:.0%} hit rate)")
+
+    report = {
+        "parameters": {"habits": args.habits, "days": args.days, "density": args.density,
+                       "weekly_share": args.weekly_share, "custom_share": args.custom_share,
+                       "repeat": args.repeat,
+                       "log_entries": rows},
+        "environment": {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+                        "platform": platform.platform()},
+        "results": results,
+        "cache": cache,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("parameters") != report["parameters"]:
+            print("Warning: the compared run used different parameters.")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} benchmark(s) slower by more than {args.threshold}%: "
+                  f"{', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+# BITMAP.PY
+"""The bitmap.py-file holds the completion history of a habit as a single integer with
+one bit per day: bit n is set if the habit was completed n days after its first day.
+db.py stores it as a BLOB in the table habit_bitmap, next to the text rows of
+habit_log, and keeps it up to date with every check-off. A multi-year history takes a
+few hundred bytes and is read with a single row lookup.
+Streaks, gaps and "completed on day X" are answered with shifts and bitwise ANDs on
+the whole history at once, instead of parsing and comparing one date after the other.
+All day numbers are those of date.toordinal().
+"""
+
+from collections import namedtuple
+from datetime import date
+
+# first_day: day number of bit 0, bits: int with one bit per day
+Bitmap = namedtuple("Bitmap", ["first_day", "bits"])
+
+
+def from_blob(first_day, blob):
+    """
+        Builds a bitmap from the values stored in habit_bitmap.
+    :param first_day: Day number of bit 0.
+    :param blob: bytes, least significant byte first.
+    :return: Bitmap
+    """
+    return Bitmap(first_day, int.from_bytes(blob, "little"))
+
+
+def to_blob(bitmap):
+    """
+        Returns the bits of a bitmap as bytes for habit_bitmap, least significant byte first.
+    :return: bytes
+    """
+    return bitmap.bits.to_bytes((bitmap.bits.bit_length() + 7) // 8, "little")
+
+
+def add_days(bitmap, days):
+    """
+        Returns a bitmap with the bits of some days set. Days before the first day move
+        the first day back.
+    :param bitmap: Bitmap, or None for an empty history.
+    :param days: Day numbers to set.
+    :return: Bitmap
+    """
+    days = list(days)
+    if bitmap is None:
+        bitmap = Bitmap(min(days), 0)
+    first_day = min([bitmap.first_day] + days)
+    bits = bitmap.bits << (bitmap.first_day - first_day)
+    for day in days:
+        bits |= 1 << (day - first_day)
+    return Bitmap(first_day, bits)
+
+
+def completed_on(bitmap, day):
+    """
+        Checks if the habit was completed on a day.
+    :param day: Day number of the day.
+    :return: bool
+    """
+    offset = day - bitmap.first_day
+    return offset >= 0 and bool(bitmap.bits >> offset & 1)
+
+
+def completion_days(bitmap):
+    """
+        Returns the day numbers of all completions in ascending order.
+    :return: list[int]
+    """
+    days = []
+    bits, offset = bitmap.bits, bitmap.first_day
+    while bits:
+        lowest = bits & -bits
+        days.append(offset + lowest.bit_length() - 1)
+        bits ^= lowest
+    return days
+
+
+def last_completion(bitmap):
+    """
+        Returns the day of the last completion, or None if there is none.
+    :return: datetime.date
+    """
+    if not bitmap.bits:
+        return None
+    return date.fromordinal(bitmap.first_day + bitmap.bits.bit_length() - 1)
+
+
+def _longest_run(bits):
+    """
+        Returns the length of the longest run of consecutive set bits. Every AND with
+        the bits shifted by one removes the last bit of every run, so the number of
+        rounds until nothing is left is the longest run.
+    """
+    rounds = 0
+    while bits:
+        bits &= bits >> 1
+        rounds += 1
+    return rounds
+
+
+def streaks(bitmap):
+    """
+        Derives the current and the longest streak of a daily habit from the bitmap:
+        completions on consecutive days continue a streak, the current streak ends with
+        the last completion. This is db.compute_streaks() of a daily habit; habits of
+        other periodicities bucket completion_days() by their calendar periods instead.
+    :return: tuple: (current streak, longest streak)
+    """
+    bits = bitmap.bits
+    if not bits:
+        return 0, 0
+    length = bits.bit_length()
+    # the highest cleared bit below the last completion ends the current streak
+    cleared = ~bits & ((1 << length) - 1)
+    return length - cleared.bit_length(), _longest_run(bits)
+
+
+def longest_gap(bitmap):
+    """
+        Returns the largest number of consecutive days without a completion between the
+        first and the last completion.
+    :return: int
+    """
+    bits = bitmap.bits
+    if not bits:
+        return 0
+    bits >>= (bits & -bits).bit_length() - 1
+    return _longest_run(~bits & ((1 << bits.bit_length()) - 1))
+
+
+def window(bitmap, first_day, days):
+    """
+        Returns the bits of a range of days, bit 0 being first_day.
+    :param first_day: Day number of the first day of the range.
+    :param days: Number of days in the range.
+    :return: int
+    """
+    shift = first_day - bitmap.first_day
+    bits = bitmap.bits >> shift if shift >= 0 else bitmap.bits << -shift
+    return bits & ((1 << days) - 1)
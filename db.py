@@ -1,167 +1,1079 @@
+import os
+import queue
 import sqlite3
-from datetime import datetime, timedelta, date
+import threading
+import time
+import zlib
+from collections import Counter
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import date, datetime
+from functools import lru_cache
+from itertools import count, groupby, repeat
+from operator import itemgetter
+import bitmap
+import periods
 
-db_name = "main.db"
+
+# functions called with every newly opened connection, e.g. by profiling.py
+connection_hooks = []
+
+# source of Database.generation, shared so no two databases ever report the same value
+_generations = count()
+
+# seconds a statement waits for the lock of another writer before "database is locked"
+BUSY_TIMEOUT = 5.0
+
+# fsync only at checkpoints; with WAL a crash can lose the last commits but never corrupts
+SYNCHRONOUS = "NORMAL"
+
+
+class Database:
+    """
+    A SQLite database file together with the connection used to talk to it.
+
+    Every thread gets exactly one connection to the file which is opened on first
+    use and reused for all following statements, instead of connecting and
+    disconnecting in every function. Statements are grouped with transaction(),
+    which can be nested: only the outermost block commits.
+
+    Attributes:
+        db_name (str): Path of the SQLite database file.
+        commit_count (int): Number of transactions committed so far.
+        generation (int): Changes with every commit of this process, see generation().
+    """
+
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.commit_count = 0
+        self.generation = next(_generations)
+        self._local = threading.local()
+
+    def connection(self):
+        """
+            Returns the connection of the calling thread, opening it if necessary.
+        :return: sqlite3.Connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode, transactions are opened explicitly by transaction()
+            conn = sqlite3.connect(self.db_name, isolation_level=None, timeout=BUSY_TIMEOUT)
+            conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+            for hook in connection_hooks:
+                hook(conn)
+            self._local.conn = conn
+            self._local.depth = 0
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        """
+            Runs the enclosed statements in one transaction and yields the connection.
+            A nested transaction() joins the enclosing one, so a caller can group
+            several db functions and have them committed exactly once.
+        :return:
+        """
+        conn = self.connection()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        # take the write lock up front: a deferred transaction that reads first cannot
+        # wait for another writer and fails with "database is locked" instead
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        else:
+            conn.execute("COMMIT")
+            self.commit_count += 1
+            self.generation = next(_generations)
+        finally:
+            self._local.depth = 0
+
+    def in_transaction(self):
+        """
+            Checks if the calling thread is inside a transaction() of this database.
+        :return: bool
+        """
+        return bool(getattr(self._local, "depth", 0))
+
+    def close(self):
+        """
+            Closes the connection of the calling thread.
+        :return:
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+# the database used by all functions of this module, main.db unless connect() is called
+_database = Database("main.db")
+
+
+def connect(db_name):
+    """
+        Makes db_name the database used by all functions in db.py and analyze.py.
+    :param db_name: Path of the SQLite database file.
+    :return: Database: The database that is now in use.
+    """
+    global _database
+    if _database.db_name != db_name:
+        _database.close()
+        _database = Database(db_name)
+    return _database
+
+
+def get_database():
+    """
+        Returns the Database currently in use: the shard of the current user if a
+        ShardRouter is in use, otherwise the database of connect().
+    :return: Database
+    """
+    return getattr(_routing, "database", None) or _database
+
+
+def get_connection():
+    """
+        Returns the connection of the current database for read-only queries.
+    :return: sqlite3.Connection
+    """
+    return get_database().connection()
+
+
+def transaction():
+    """
+        Groups statements on the current database into one transaction,
+        see Database.transaction().
+    :return:
+    """
+    return get_database().transaction()
+
+
+def generation():
+    """
+        Returns a value that changes whenever the current database is written: by any
+        mutating function of this module (add_habit_info, check_off_habit_in_db,
+        update_streak_in_db, update_habit_info, delete_habit_from_db, ...) through the
+        commit of its transaction, or by another process (PRAGMA data_version).
+        Query results read at the same generation are still up to date.
+    :return: tuple
+    """
+    database = get_database()
+    return database.generation, database.connection().execute("PRAGMA data_version").fetchone()[0]
+
+
+# multi-user support: every user's habits live in one of several shard files
+
+class ShardRouter:
+    """
+    Spreads the users over a fixed number of SQLite files in one directory. The shard
+    of a user is chosen by a stable hash of the user ID, so a user always ends up in
+    the same file; changing the number of shards moves users to other files.
+
+    Every shard is a Database of its own, with its own connections and its own file
+    lock, so a long write of one user only blocks the users of the same shard.
+
+    Attributes:
+        directory (str): Directory of the shard files.
+        shard_count (int): Number of shards.
+    """
+
+    def __init__(self, directory, shard_count=16):
+        self.directory = directory
+        self.shard_count = shard_count
+        self._databases = {}
+        self._lock = threading.Lock()
+
+    def shard_of(self, user_ID):
+        """
+            Returns the number of the shard holding the habits of a user.
+        :return: int
+        """
+        return zlib.crc32(str(user_ID).encode("utf-8")) % self.shard_count
+
+    def shard_path(self, shard):
+        """
+            Returns the path of a shard file.
+        :return: str
+        """
+        return os.path.join(self.directory, f"shard_{shard:03d}.db")
+
+    def shard_paths(self):
+        """
+            Returns the paths of all shard files that exist.
+        :return: list[str]
+        """
+        return [path for path in map(self.shard_path, range(self.shard_count)) if os.path.exists(path)]
+
+    def database_for(self, user_ID):
+        """
+            Returns the Database of a user's shard, creating its tables when it is
+            used for the first time.
+        :return: Database
+        """
+        shard = self.shard_of(user_ID)
+        database = self._databases.get(shard)
+        if database is None:
+            with self._lock:
+                database = self._databases.get(shard)
+                if database is None:
+                    database = Database(self.shard_path(shard))
+                    with _routed(database, None):
+                        initialize_db(verbose=False)
+                    self._databases[shard] = database
+        return database
+
+    def close(self):
+        """
+            Closes the connections of the calling thread to all shards.
+        :return:
+        """
+        for database in self._databases.values():
+            database.close()
+
+
+# database and user of the calling thread, set by use_user()
+_routing = threading.local()
+
+# the ShardRouter used by use_user(), None if all users share the database of connect()
+_router = None
+
+
+def connect_shards(directory, shard_count=16):
+    """
+        Stores all following users in shard files in directory, see ShardRouter.
+    :param directory: Directory of the shard files, created if necessary. None goes
+                      back to keeping all users in the database of connect().
+    :param shard_count: Number of shards.
+    :return: ShardRouter, or None
+    """
+    global _router
+    if _router is not None:
+        _router.close()
+        _router = None
+    if directory is not None:
+        os.makedirs(directory, exist_ok=True)
+        _router = ShardRouter(directory, shard_count)
+    return _router
+
+
+def get_router():
+    """
+        Returns the ShardRouter in use, or None if there is none.
+    """
+    return _router
+
+
+@contextmanager
+def _routed(database, user_ID):
+    """
+        Sends the statements of this thread to database and sets the current user.
+    """
+    previous = getattr(_routing, "database", None), getattr(_routing, "user_ID", None)
+    _routing.database, _routing.user_ID = database, user_ID
+    try:
+        yield database
+    finally:
+        _routing.database, _routing.user_ID = previous
+
+
+def use_user(user_ID):
+    """
+        Runs the enclosed db.py and analyze.py calls of this thread for one user: new
+        habits belong to the user, listings only contain the user's habits and, with
+        connect_shards(), all statements go to the user's shard.
+            with db.use_user("alice"):
+                db.check_off_habit_in_db(3)
+    :param user_ID: ID of the user, None for the habits without a user.
+    :return: context manager
+    """
+    database = _router.database_for(user_ID) if _router is not None and user_ID is not None else None
+    return _routed(database, user_ID)
+
+
+def current_user():
+    """
+        Returns the ID of the user set by use_user() in this thread, or None.
+    """
+    return getattr(_routing, "user_ID", None)
+
+
+# optional single writer: one thread runs the writes of all callers with group commits
+
+class WriteQueue:
+    """
+    A background thread that runs the writes of many callers, e.g. the worker threads
+    of server.py, on its own connection. Writes waiting in the queue are committed
+    together: one transaction per group instead of one per write, with a savepoint per
+    write so a failing write does not undo the others of its group. If the group
+    cannot get the write lock (another process is writing), the whole group is run
+    again, so no write is dropped. Callers block until their write is committed.
+
+    Attributes:
+        max_batch (int): Largest number of writes committed together.
+        writes (int): Number of writes committed so far.
+        commits (int): Number of group commits so far.
+        retries (int): Number of groups that were run again because the database was locked.
+    """
+
+    def __init__(self, max_batch=256, retry_delay=0.05):
+        self.max_batch = max_batch
+        self.retry_delay = retry_delay
+        self.writes = self.commits = self.retries = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="habit-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, function, *args):
+        """
+            Runs function(*args) on the writer thread, on the database and for the user
+            of the calling thread, and waits until it is committed. Called from inside
+            a transaction it runs right away, as part of that transaction.
+        :return: The return value of function, its exception is raised here.
+        """
+        database = get_database()
+        if database.in_transaction():
+            return function(*args)
+        future = Future()
+        self._queue.put((database, current_user(), function, args, future))
+        return future.result()
+
+    def stop(self):
+        """
+            Commits the writes still waiting and ends the writer thread.
+        :return:
+        """
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        running = True
+        while running:
+            jobs = [self._queue.get()]
+            while jobs[-1] is not None and len(jobs) < self.max_batch:
+                try:
+                    jobs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if jobs[-1] is None:
+                running = False
+                jobs.pop()
+
+            groups = {}
+            for job in jobs:
+                groups.setdefault(job[0], []).append(job)
+            for database, group in groups.items():
+                self._commit(database, group)
+
+    def _commit(self, database, jobs):
+        """
+            Runs a group of writes in one transaction and hands out their results
+            once it is committed.
+        """
+        while True:
+            results = []
+            try:
+                with _routed(database, None), transaction() as conn:
+                    for _, user_ID, function, args, future in jobs:
+                        conn.execute("SAVEPOINT write_job")
+                        try:
+                            with _routed(database, user_ID):
+                                results.append((future, function(*args), None))
+                        except Exception as e:
+                            conn.execute("ROLLBACK TO write_job")
+                            results.append((future, None, e))
+                        conn.execute("RELEASE write_job")
+            except sqlite3.OperationalError as e:
+                if _is_locked(e):
+                    # nothing of the group was written, run all of it again
+                    self.retries += 1
+                    time.sleep(self.retry_delay)
+                    continue
+                results = [(job[4], None, e) for job in jobs]
+            else:
+                self.writes += len(jobs)
+                self.commits += 1
+
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            return
+
+
+# the WriteQueue used for all writes of this module, None if every caller writes on its own connection
+_write_queue = None
+
+# times a write on the caller's own connection is run again after it did not get the write lock
+WRITE_RETRIES = 3
+
+
+def start_write_queue(max_batch=256):
+    """
+        Sends all following writes through a single writer thread, see WriteQueue.
+    :return: WriteQueue
+    """
+    global _write_queue
+    if _write_queue is None:
+        _write_queue = WriteQueue(max_batch)
+    return _write_queue
+
+
+def stop_write_queue():
+    """
+        Commits the waiting writes and goes back to writing on the callers' connections.
+    :return: WriteQueue: The stopped queue with its counters, or None.
+    """
+    global _write_queue
+    write_queue, _write_queue = _write_queue, None
+    if write_queue is not None:
+        write_queue.stop()
+    return write_queue
+
+
+def _is_locked(error):
+    """
+        Checks if an OperationalError means that the write lock was not available.
+    """
+    return "locked" in str(error) or "busy" in str(error)
+
+
+def _write(function, *args):
+    """
+        Runs a write function through the write queue if it is running, or directly.
+        Every writer of this module goes through here with its raising variant. A
+        direct write that did not get the write lock within BUSY_TIMEOUT was rolled back
+        as a whole and is run again, up to WRITE_RETRIES times; inside a transaction it
+        is part of that one and the error is raised to its owner instead.
+    """
+    if _write_queue is not None:
+        return _write_queue.submit(function, *args)
+    if get_database().in_transaction():
+        return function(*args)
+    attempt = 0
+    while True:
+        try:
+            return function(*args)
+        except sqlite3.OperationalError as e:
+            attempt += 1
+            if attempt > WRITE_RETRIES or not _is_locked(e):
+                raise
+
+
+def _in_transaction(function, *args):
+    """
+        Runs function(cursor, *args) in a transaction; the writers below hand their
+        raising variants to _write() in this form.
+    """
+    with transaction() as conn:
+        return function(conn.cursor(), *args)
 
 
 # Initialize the databases if not already exists
 
-def initialize_db():
+# version of the table layout, stored in the database file as PRAGMA user_version
+SCHEMA_VERSION = 9
+
+HABIT_LOG_TABLE = """
+                    CREATE TABLE IF NOT EXISTS habit_log (
+                            log_ID INTEGER PRIMARY KEY,
+                            habit_ID INTEGER NOT NULL,
+                            habit_completed BOOLEAN,
+                            habit_date_created DATE NOT NULL,
+                            habit_seq INTEGER,
+                            habit_day INTEGER,
+                            habit_week INTEGER,
+                            FOREIGN KEY (habit_ID) REFERENCES habit_info(habit_ID)
+                    )
+                  """
+
+# the last sequence number handed out to an event of habit_log ('habit_log'), the
+# checkpoint up to which all events are applied to habit_streak ('habit_streak') and the
+# day number up to which habit_rollup has the buckets of all habits ('habit_rollup')
+SEQUENCE_TABLE = """
+                  CREATE TABLE IF NOT EXISTS habit_sequence (
+                          name TEXT PRIMARY KEY,
+                          seq INTEGER NOT NULL
+                  )
+                  """
+
+# completions and expected completions of a habit per day, ISO week and month, see rebuild_rollup()
+ROLLUP_TABLE = """
+                CREATE TABLE IF NOT EXISTS habit_rollup (
+                        habit_ID INTEGER NOT NULL,
+                        bucket TEXT NOT NULL,
+                        period_start DATE NOT NULL,
+                        completed INTEGER NOT NULL DEFAULT 0,
+                        expected INTEGER NOT NULL,
+                        PRIMARY KEY (habit_ID, bucket, period_start),
+                        FOREIGN KEY (habit_ID) REFERENCES habit_info(habit_ID)
+                ) WITHOUT ROWID
+               """
+
+# share of the expected completions of a rollup row that were made, at most 1; NULL if
+# nothing was expected. Queries have to spell it exactly like this to use habit_rollup_rate.
+ROLLUP_RATE = "MIN(completed, expected) * 1.0 / expected"
+
+# the days a habit was completed, one bit per day starting with first_day, see bitmap.py
+BITMAP_TABLE = """
+                CREATE TABLE IF NOT EXISTS habit_bitmap (
+                        habit_ID INTEGER PRIMARY KEY,
+                        first_day DATE NOT NULL,
+                        bits BLOB NOT NULL,
+                        FOREIGN KEY (habit_ID) REFERENCES habit_info(habit_ID)
+                )
+               """
+
+# one streak row per habit, looked up on every streak update
+STREAK_INDEX = """
+               CREATE UNIQUE INDEX IF NOT EXISTS habit_streak_habit
+               ON habit_streak (habit_ID)
+               """
+
+INDEXES = [
+    # one row per habit and day; also serves every lookup of a habit's log by date
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS habit_log_habit_date
+    ON habit_log (habit_ID, habit_date_created)
+    """,
+    # the habits of a user, see use_user()
+    """
+    CREATE INDEX IF NOT EXISTS habit_info_user
+    ON habit_info (user_ID)
+    """,
+    STREAK_INDEX,
+    # the events of habit_log in the order they happened, see _apply_events()
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS habit_log_seq
+    ON habit_log (habit_seq)
+    """,
+    # the leaderboards of analyze.py read the highest streaks first and stop after the top K
+    """
+    CREATE INDEX IF NOT EXISTS habit_streak_counter
+    ON habit_streak (habit_counter DESC, habit_ID)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS habit_streak_counter_max
+    ON habit_streak (habit_counter_max DESC, habit_ID)
+    """,
+    # the habits due in a range of days, swept by scheduler.py
+    """
+    CREATE INDEX IF NOT EXISTS habit_streak_next_due
+    ON habit_streak (habit_next_due)
+    """,
+    # the habits of one period ordered by completion rate, the expression is ROLLUP_RATE
+    f"""
+    CREATE INDEX IF NOT EXISTS habit_rollup_rate
+    ON habit_rollup (bucket, period_start, ({ROLLUP_RATE}) DESC, habit_ID)
+    """,
+]
+
+# the day number and ISO week key of a log row, see day_number() and week_key(); they are
+# derived from habit_date_created by the database, so every writer gets them for free
+LOG_DAY_SQL = """
+              habit_day = CAST(julianday(habit_date_created) - 1721424.5 AS INTEGER),
+              habit_week = (CAST(julianday(habit_date_created) - 1721424.5 AS INTEGER) - 1) / 7
+              """
+
+# every new row of habit_log and every change of habit_completed is an event, numbered
+# from a counter that never goes back, not even when the newest rows are deleted
+EVENT_SQL = """
+            UPDATE habit_sequence SET seq = seq + 1 WHERE name = 'habit_log';
+            UPDATE habit_log SET habit_seq = (SELECT seq FROM habit_sequence WHERE name = 'habit_log'){days}
+            WHERE log_ID = NEW.log_ID;
+            """
+
+TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_log_insert_event AFTER INSERT ON habit_log
+    BEGIN {EVENT_SQL.format(days=", " + LOG_DAY_SQL)} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_log_update_event AFTER UPDATE OF habit_completed ON habit_log
+    WHEN NEW.habit_completed IS NOT OLD.habit_completed
+    BEGIN {EVENT_SQL.format(days="")} END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS habit_log_update_day AFTER UPDATE OF habit_date_created ON habit_log
+    BEGIN UPDATE habit_log SET {LOG_DAY_SQL} WHERE log_ID = NEW.log_ID; END
+    """,
+]
+
+
+def initialize_db(verbose=True):
     """
         Initializes the database and creates necessary tables if they do not already exist:
         - habit_info
         - habit_log
         - habit_streak
+        - habit_rollup
+        - habit_bitmap
+        - habit_sequence
+        Databases written by an older version of the program are migrated in place
+        to SCHEMA_VERSION. Events of habit_log that are not yet part of the streaks,
+        e.g. after a crash, are applied at the end, see _apply_events(), and the
+        rollup is extended to today, see extend_rollup().
+        The database is switched to write-ahead logging, so readers never wait for a
+        writer and writers only wait for each other; every connection additionally
+        uses BUSY_TIMEOUT and SYNCHRONOUS, see Database.connection().
+    :param verbose: Print a message for every step.
     :return:
     """
+    log = print if verbose else lambda *args: None
     try:
-        with sqlite3.connect(db_name) as conn:
-            print(f"Opened SQLite database with version {sqlite3.sqlite_version} successfully.")
+        # the journal mode is stored in the file, it cannot change inside a transaction
+        journal_mode = get_connection().execute("PRAGMA journal_mode = WAL").fetchone()[0]
+        log(f"Journal mode: {journal_mode}")
+        with transaction() as conn:
+            log(f"Opened SQLite database with version {sqlite3.sqlite_version} successfully.")
             cursor = conn.cursor()
 
+            cursor.execute("PRAGMA user_version")
+            version = cursor.fetchone()[0]
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'habit_log'")
+            if cursor.fetchone() is None:
+                # new database, the tables below are created in the latest layout
+                version = SCHEMA_VERSION
+
             cursor.execute("""
                                 CREATE TABLE IF NOT EXISTS habit_info (
                                        habit_ID INTEGER PRIMARY KEY,
                                        habit_name TEXT NOT NULL, 
                                        habit_description TEXT NOT NULL,
                                        habit_time_period TEXT NOT NULL,
-                                       habit_date_created DATE 
+                                       habit_date_created DATE,
+                                       user_ID TEXT
                                 ) 
                             """)
-            print("Created table: habit_info")
-            cursor.execute("""
-                                CREATE TABLE IF NOT EXISTS habit_log (
-                                        habit_ID INTEGER,
-                                        habit_completed BOOLEAN,
-                                        habit_date_created DATE,
-                                        FOREIGN KEY (habit_ID) REFERENCES habit_info(habit_ID) 
-                                ) 
-                             """)
-            print("Created table: habit_log")
+            log("Created table: habit_info")
+            cursor.execute(HABIT_LOG_TABLE)
+            log("Created table: habit_log")
             cursor.execute("""
                                 CREATE TABLE IF NOT EXISTS habit_streak (
                                         habit_ID INTEGER,
                                         habit_counter INTEGER DEFAULT 0,
                                         habit_counter_max INTEGER DEFAULT 0,
+                                        habit_next_due DATE,
+                                        habit_last_completed DATE,
+                                        habit_last_seq INTEGER DEFAULT 0,
                                         FOREIGN KEY (habit_ID) REFERENCES habit_info(habit_ID)
                                 )
                              """)
-            print("Created table: habit_streak")
-
-            conn.commit()
+            log("Created table: habit_streak")
+            cursor.execute(ROLLUP_TABLE)
+            log("Created table: habit_rollup")
+            cursor.execute(BITMAP_TABLE)
+            log("Created table: habit_bitmap")
+            cursor.execute(SEQUENCE_TABLE)
+            cursor.execute("INSERT OR IGNORE INTO habit_sequence (name, seq) "
+                           "VALUES ('habit_log', 0), ('habit_streak', 0), ('habit_rollup', 0)")
+            log("Created table: habit_sequence")
+
+            if version < SCHEMA_VERSION:
+                # the rebuilds of the older migrations below already read the day numbers
+                _add_day_numbers(cursor)
+            for migration in MIGRATIONS[version:]:
+                migration(cursor)
+                log(f"Migrated database: {migration.__doc__.strip()}")
+
+            for index in INDEXES:
+                cursor.execute(index)
+            for trigger in TRIGGERS:
+                cursor.execute(trigger)
+            cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            log(f"Replayed events of habit_log: {_apply_events(cursor)}")
+            log(f"Extended habit_rollup to today: {_extend_rollup_to_today(cursor)} rows")
 
     except sqlite3.OperationalError as e:
         print("Failed to open database:", e)
 
 
+# schema migrations, MIGRATIONS[n] upgrades a database from version n to n + 1
+
+def _iso_date_sql(column):
+    """
+        Returns an SQL expression converting a "%m/%d/%Y" date column to ISO-8601,
+        values already in another format are left unchanged.
+    :param column: Name of the date column.
+    :return: str
+    """
+    return (f"CASE WHEN {column} LIKE '__/__/____' "
+            f"THEN substr({column}, 7, 4) || '-' || substr({column}, 1, 2) || '-' || substr({column}, 4, 2) "
+            f"ELSE {column} END")
+
+
+def _migrate_to_iso_dated_log(cursor):
+    """
+        ISO-8601 dates and one indexed row per habit and day in habit_log
+    """
+    cursor.execute("ALTER TABLE habit_log RENAME TO habit_log_old")
+    cursor.execute(HABIT_LOG_TABLE)
+    # collapse several entries of one day into a single row, completed if any of them was
+    cursor.execute(f"""
+                    INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created)
+                    SELECT habit_ID, MAX(habit_completed), {_iso_date_sql("habit_date_created")}
+                    FROM habit_log_old
+                    WHERE habit_ID IS NOT NULL AND habit_date_created IS NOT NULL
+                    GROUP BY habit_ID, {_iso_date_sql("habit_date_created")}
+                    ORDER BY habit_ID, {_iso_date_sql("habit_date_created")}
+                    """)
+    cursor.execute("DROP TABLE habit_log_old")
+    _add_day_numbers(cursor)
+    cursor.execute(f"""
+                    UPDATE habit_info
+                    SET habit_date_created = {_iso_date_sql("habit_date_created")},
+                    habit_time_period = lower(habit_time_period)
+                    """)
+
+
+def _migrate_to_unique_streaks(cursor):
+    """
+        one habit_streak row per habit
+    """
+    cursor.execute("""
+                    DELETE FROM habit_streak
+                    WHERE rowid NOT IN (SELECT MIN(rowid) FROM habit_streak GROUP BY habit_ID)
+                    """)
+    cursor.execute(STREAK_INDEX)
+
+
+def _migrate_to_rollup(cursor):
+    """
+        completions per day, week and month in habit_rollup
+    """
+    _rebuild_rollup(cursor)
+
+
+def _migrate_to_bitmaps(cursor):
+    """
+        completion history as bitmap per habit in habit_bitmap
+    """
+    _rebuild_bitmaps(cursor)
+
+
+def _migrate_to_users(cursor):
+    """
+        owner of every habit in habit_info.user_ID
+    """
+    cursor.execute("ALTER TABLE habit_info ADD COLUMN user_ID TEXT")
+
+
+def _migrate_to_due_dates(cursor):
+    """
+        next due date of every habit in habit_streak.habit_next_due
+    """
+    cursor.execute("ALTER TABLE habit_streak ADD COLUMN habit_next_due DATE")
+    _rebuild_due_dates(cursor)
+
+
+def _migrate_to_event_log(cursor):
+    """
+        habit_log as event stream numbered by habit_seq, habit_streak as snapshot of it
+    """
+    # databases migrated from version 0 got habit_seq with the new habit_log table
+    cursor.execute("PRAGMA table_info(habit_log)")
+    if "habit_seq" not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE habit_log ADD COLUMN habit_seq INTEGER")
+    cursor.execute("ALTER TABLE habit_streak ADD COLUMN habit_last_completed DATE")
+    cursor.execute("ALTER TABLE habit_streak ADD COLUMN habit_last_seq INTEGER DEFAULT 0")
+    cursor.execute("UPDATE habit_log SET habit_seq = log_ID")
+    cursor.execute("UPDATE habit_sequence SET seq = (SELECT IFNULL(MAX(log_ID), 0) FROM habit_log) "
+                   "WHERE name = 'habit_log'")
+    # the snapshots are derived once from the complete log
+    _recompute_streaks(cursor)
+
+
+def _add_day_numbers(cursor):
+    """
+        Adds habit_day and habit_week to habit_log if they are missing and fills them in
+        for rows that do not have them yet.
+    """
+    cursor.execute("PRAGMA table_info(habit_log)")
+    columns = [row[1] for row in cursor.fetchall()]
+    for column in ("habit_day", "habit_week"):
+        if column not in columns:
+            cursor.execute(f"ALTER TABLE habit_log ADD COLUMN {column} INTEGER")
+    cursor.execute(f"UPDATE habit_log SET {LOG_DAY_SQL} WHERE habit_day IS NULL")
+
+
+def _migrate_to_day_numbers(cursor):
+    """
+        day number and ISO week key of every log entry in habit_log.habit_day and habit_week
+    """
+    _add_day_numbers(cursor)
+    # created again with the day numbers by initialize_db()
+    cursor.execute("DROP TRIGGER IF EXISTS habit_log_insert_event")
+
+
+def _migrate_to_calendar_periods(cursor):
+    """
+        streaks of weekly habits in calendar ISO weeks
+    """
+    # weekly streaks used to count completions exactly seven days apart
+    _recompute_streaks(cursor)
+
+
+MIGRATIONS = [
+    _migrate_to_iso_dated_log,
+    _migrate_to_unique_streaks,
+    _migrate_to_rollup,
+    _migrate_to_bitmaps,
+    _migrate_to_users,
+    _migrate_to_due_dates,
+    _migrate_to_event_log,
+    _migrate_to_day_numbers,
+    _migrate_to_calendar_periods,
+]
+
+
 # methods to add new information to the tables and classes
 
 def add_habit_info(habit_name, habit_description, habit_time_period, habit_date_created):
     """
-         Inserts a new habit into the 'habit_info' table.
+         Inserts a new habit of the current user into the 'habit_info' table.
 
     :return: int: The ID of the newly created habit.
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                                INSERT INTO habit_info(habit_name, habit_description,
-                                habit_time_period, habit_date_created)
-                                VALUES (?, ?, ?, ?) 
-                            """,
-                           (habit_name, habit_description, habit_time_period, habit_date_created))
-            conn.commit()
-        # get the id of the last inserted row
-        return cursor.lastrowid
+        return _write(_in_transaction, _add_habit_info,
+                      habit_name, habit_description, habit_time_period, habit_date_created)
 
     except sqlite3.OperationalError as e:
         print("Failed to add data for habit_info to the database:", e)
 
 
+def _add_habit_info(cursor, habit_name, habit_description, habit_time_period, habit_date_created):
+    """
+        Inserts a new habit, see add_habit_info(). Errors are raised.
+    :return: int
+    """
+    cursor.execute("""
+                        INSERT INTO habit_info(habit_name, habit_description,
+                        habit_time_period, habit_date_created, user_ID)
+                        VALUES (?, ?, ?, ?, ?) 
+                    """,
+                   (habit_name, habit_description, habit_time_period, habit_date_created,
+                    current_user()))
+    # get the id of the last inserted row
+    return cursor.lastrowid
+
+
 def add_habit_log(habit_ID, habit_completed, habit_date_created):
     """
          Logs the completion status of a habit for a given date in 'habit_log'.
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                            INSERT INTO habit_log(habit_ID, habit_completed,
-                            habit_date_created)
-                            VALUES (?, ?, ?)
-                            """,
-                           (habit_ID, habit_completed, habit_date_created))
-            conn.commit()
+        _write(_in_transaction, _add_habit_log, habit_ID, habit_completed, habit_date_created)
 
     except sqlite3.OperationalError as e:
         print("Failed to add data for habit_log to the database:", e)
 
 
+def _add_habit_log(cursor, habit_ID, habit_completed, habit_date_created):
+    """
+        Logs the status of a habit on a date, see add_habit_log(). Errors are raised.
+    :return:
+    """
+    cursor.execute("""
+                    INSERT INTO habit_log(habit_ID, habit_completed,
+                    habit_date_created)
+                    VALUES (?, ?, ?)
+                    """,
+                   (habit_ID, habit_completed, habit_date_created))
+
+    if habit_completed:
+        cursor.execute("SELECT habit_time_period, habit_date_created FROM habit_info "
+                       "WHERE habit_ID = ?", (habit_ID,))
+        row = cursor.fetchone()
+        if row is not None:
+            _log_completions(cursor, habit_ID, row[0], row[1], [habit_date_created])
+
+
 def add_habit_streak(habit_ID, habit_counter, habit_counter_max):
     """
          Initializes streak tracking for a habit in 'habit_streak'.
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-                            INSERT INTO habit_streak(habit_ID, habit_counter,
-                            habit_counter_max)
-                            VALUES (?, ?, ?)
-                            """,
-                           (habit_ID, habit_counter, habit_counter_max))
-            conn.commit()
+        _write(_in_transaction, _add_habit_streak, habit_ID, habit_counter, habit_counter_max)
 
     except sqlite3.OperationalError as e:
         print("Failed to add data for habit_log to the database:", e)
 
 
-def add_habit():
+def _add_habit_streak(cursor, habit_ID, habit_counter, habit_counter_max):
     """
-        Adds a habit to all relevant tables (habit_info, habit_log, habit_streak).
-
+        Adds the streak row of a habit, see add_habit_streak(). Errors are raised.
     :return:
     """
+    # the counters given are the snapshot of all events logged so far
+    cursor.execute("""
+                    INSERT INTO habit_streak(habit_ID, habit_counter,
+                    habit_counter_max, habit_last_completed, habit_last_seq)
+                    VALUES (?, ?, ?,
+                            (SELECT MAX(habit_date_created) FROM habit_log
+                             WHERE habit_ID = ? AND habit_completed),
+                            (SELECT seq FROM habit_sequence WHERE name = 'habit_log'))
+                    """,
+                   (habit_ID, habit_counter, habit_counter_max, habit_ID))
+    _rebuild_due_dates(cursor, [habit_ID])
+    # the buckets up to today, the ones after it follow with extend_rollup()
+    _extend_rollup(cursor, [habit_ID])
+
+
+def add_habit(habit_name, habit_description, habit_time_period, habit_date_created,
+              habit_completed=False, habit_counter=0, habit_counter_max=0):
+    """
+        Adds a habit to all relevant tables (habit_info, habit_log, habit_streak)
+        in a single transaction.
+
+    :return: int: The ID of the newly created habit.
+    """
     try:
-        with sqlite3.connect(db_name) as conn:
-            # add the new habit in habit_info
+        return _write(_in_transaction, _add_habit, habit_name, habit_description, habit_time_period,
+                      habit_date_created, habit_completed, habit_counter, habit_counter_max)
 
-            habit_ID = add_habit_info(habit_name, habit_description, habit_time_period, habit_date_created)
-            print(f"Created a new habit in habit_log with the ID {habit_ID}")
+    except sqlite3.OperationalError as e:
+        print("Failed to add habit to the database:", e)
 
-            # add the new habit in habit_log
 
-            add_habit_log(habit_ID, habit_completed, habit_date_created)
+def _add_habit(cursor, habit_name, habit_description, habit_time_period, habit_date_created,
+               habit_completed, habit_counter, habit_counter_max):
+    """
+        Adds a habit to all relevant tables, see add_habit(). Errors are raised.
+    :return: int
+    """
+    # add the new habit in habit_info
 
-            # add the new habit in habit_streak
+    habit_ID = _add_habit_info(cursor, habit_name, habit_description, habit_time_period, habit_date_created)
 
-            add_habit_streak(habit_ID, habit_counter, habit_counter_max)
+    # add the new habit in habit_log
 
+    _add_habit_log(cursor, habit_ID, habit_completed, habit_date_created)
 
-    except sqlite3.OperationalError as e:
-        print("Failed to add habit to the database:", e)
+    # add the new habit in habit_streak
+
+    _add_habit_streak(cursor, habit_ID, habit_counter, habit_counter_max)
+    return habit_ID
+
+
+def add_habits_bulk(habits):
+    """
+        Adds many habits of the current user to habit_info, habit_log and habit_streak
+        in a single transaction, every table written with one executemany. The write
+        lock is held from the start of the transaction, so the new habit_info rows are
+        the ones above the highest habit_ID before the insert; their IDs are read back
+        from there and checked against the number of habits given.
+
+    :param habits: Iterable of (habit_name, habit_description, habit_time_period,
+                   habit_date_created, habit_completed) tuples.
+    :return: list[int]: The IDs of the new habits in the order given, empty if they could not be added.
+    """
+    habits = list(habits)
+    if not habits:
+        return []
+    try:
+        return _write(_in_transaction, _add_habits_bulk, habits)
+
+    except sqlite3.Error as e:
+        print("Failed to add habits to the database:", e)
+        return []
+
+
+def _add_habits_bulk(cursor, habits):
+    """
+        Writes the rows of many new habits, see add_habits_bulk(). Errors are raised.
+    :return: list[int]
+    """
+    user_ID = current_user()
+    cursor.execute("SELECT COALESCE(MAX(habit_ID), 0) FROM habit_info")
+    max_ID = cursor.fetchone()[0]
+    cursor.executemany("""
+                       INSERT INTO habit_info(habit_name, habit_description,
+                       habit_time_period, habit_date_created, user_ID)
+                       VALUES (?, ?, ?, ?, ?)
+                       """,
+                       ((name, description, time_period, date_created, user_ID)
+                        for name, description, time_period, date_created, _ in habits))
+    cursor.execute("SELECT habit_ID FROM habit_info WHERE habit_ID > ? ORDER BY habit_ID", (max_ID,))
+    habit_ids = [row[0] for row in cursor.fetchall()]
+    if len(habit_ids) != len(habits):
+        raise sqlite3.IntegrityError(f"expected {len(habits)} new habits, found {len(habit_ids)}")
+
+    cursor.executemany("INSERT INTO habit_log(habit_ID, habit_completed, habit_date_created) VALUES (?, ?, ?)",
+                       ((habit_ID, completed, date_created)
+                        for habit_ID, (*_, date_created, completed) in zip(habit_ids, habits)))
+    # the streak rows are the snapshot of all events so far, including the new log rows;
+    # a habit that was never completed is due on the day it was created
+    last_event = _sequence(cursor, "habit_log")
+    cursor.executemany("""
+                       INSERT INTO habit_streak(habit_ID, habit_counter, habit_counter_max,
+                       habit_next_due, habit_last_seq)
+                       VALUES (?, 0, 0, ?, ?)
+                       """,
+                       ((habit_ID, date_created, last_event)
+                        for habit_ID, (*_, date_created, _) in zip(habit_ids, habits)))
+
+    completed = [(habit_ID, time_period, date_created)
+                 for habit_ID, (_, _, time_period, date_created, habit_completed) in zip(habit_ids, habits)
+                 if habit_completed]
+    for habit_ID, time_period, date_created in completed:
+        _log_completions(cursor, habit_ID, time_period, date_created, [date_created])
+    if completed:
+        _recompute_streaks(cursor, [habit_ID for habit_ID, *_ in completed])
+    _extend_rollup(cursor, habit_ids)
+    return habit_ids
 
 
 # method to fetch all current habits for selection
 
 def get_all_habits():
     """
-         Retrieves all existing habits' IDs and names from 'habit_info'.
+         Retrieves the IDs and names of the current user's habits from 'habit_info'.
     :return: list[tuple]: List of (habit_ID, habit_name) tuples.
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT habit_ID, habit_name FROM habit_info")
-            return cursor.fetchall()
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT habit_ID, habit_name FROM habit_info WHERE user_ID IS ?", (current_user(),))
+        return cursor.fetchall()
     except sqlite3.OperationalError as e:
         print("Failed to fetch habits:", e)
         return []
 
 
+def get_habit_log(habit_ID):
+    """
+         Retrieves the log of a habit from 'habit_log' in chronological order.
+    :param habit_ID: The ID of the habit.
+    :return: list[tuple]: List of (habit_date_created, habit_completed) tuples.
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("""
+                        SELECT habit_date_created, habit_completed
+                        FROM habit_log
+                        WHERE habit_ID = ?
+                        ORDER BY habit_date_created
+                        """, (habit_ID,))
+        return [(habit_date, bool(completed)) for habit_date, completed in cursor]
+    except sqlite3.OperationalError as e:
+        print("Failed to fetch the habit log:", e)
+        return []
+
+
 # methods to delete data from all the tables and the class
 
 def delete_habit_from_db(habit_ID):
@@ -171,194 +1083,1088 @@ def delete_habit_from_db(habit_ID):
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
+        _write(_in_transaction, _delete_habit, habit_ID)
 
-            cursor.execute("DELETE FROM habit_log WHERE habit_ID = ?", (habit_ID,))
-            cursor.execute("DELETE FROM habit_streak WHERE habit_ID = ?", (habit_ID,))
-            cursor.execute("DELETE FROM habit_info WHERE habit_ID = ?", (habit_ID,))
-
-            conn.commit()
-            # print(f"Habit {habit_ID} and associated data successfully deleted.")
+        # print(f"Habit {habit_ID} and associated data successfully deleted.")
     except sqlite3.OperationalError as e:
         print("Failed to delete habit:", e)
 
 
-# methods to print our three db tables & view streak information
+def _delete_habit(cursor, habit_ID):
+    """
+        Deletes a habit from all tables, see delete_habit_from_db(). Errors are raised.
+    :return:
+    """
+    cursor.execute("DELETE FROM habit_log WHERE habit_ID = ?", (habit_ID,))
+    cursor.execute("DELETE FROM habit_streak WHERE habit_ID = ?", (habit_ID,))
+    cursor.execute("DELETE FROM habit_rollup WHERE habit_ID = ?", (habit_ID,))
+    cursor.execute("DELETE FROM habit_bitmap WHERE habit_ID = ?", (habit_ID,))
+    cursor.execute("DELETE FROM habit_info WHERE habit_ID = ?", (habit_ID,))
+
+
+# method to print our three db tables & view streak information
 
-def print_table(habit_info, db_name):
+def print_table(table_name):
     """
-     Prints the contents of a given table from the database.
-    :param habit_info: table_name (str): The name of the table to be printed.
-    :param db_name: db_name (str): The name of the SQLite database.
+     Prints the contents of a given table from the database, row by row.
+    :param table_name: table_name (str): The name of the table to be printed,
+                       e.g. habit_info, habit_log or habit_streak.
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {habit_info}")
-            rows = cursor.fetchall()
+        cursor = get_connection().cursor()
+        cursor.execute(f"SELECT * FROM {table_name}")
+
+        empty = True
+        for row in cursor:
+            if empty:
+                print(f"\n--- Contents of table: {table_name} ---")
+                empty = False
+            print(row)
+        if empty:
+            print(f"\nTable '{table_name}' is empty.")
+    except sqlite3.OperationalError as e:
+        print(f"Error reading table '{table_name}':", e)
+
+
+# methods for checking off habit
+
+# logs a completion, an existing row of the same day is marked as completed instead
+CHECK_OFF_SQL = """
+                INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created)
+                VALUES (?, ?, ?)
+                ON CONFLICT (habit_ID, habit_date_created)
+                DO UPDATE SET habit_completed = excluded.habit_completed
+                WHERE NOT habit_completed
+                """
+
+def check_off_habit_in_db(habit_ID):
+    """
+    Marks a habit as completed for today's date by adding a row to 'habit_log'.
+    If there already is a row for today it is marked as completed instead. The streak
+    is updated in the same transaction.
+    :param habit_ID: The ID of the habit being marked as completed.
+    :return: bool: True if the habit was not completed today before this call.
+    """
+    try:
+        return _write(_check_off, habit_ID, date.today().isoformat())
 
-            if rows:
-                print(f"\n--- Contents of table: {habit_info} ---")
-                for row in rows:
-                    print(row)
-            else:
-                print(f"\nTable '{habit_info}' is empty.")
     except sqlite3.OperationalError as e:
-        print(f"Error reading table '{habit_info}':", e)
+        print("Failed to mark habit as completed:", e)
+        return False
 
 
-def print_table(habit_log, db_name):
+def _check_off(habit_ID, habit_date):
     """
-         Prints the contents of a given table from the database.
-        :param habit_log: table_name (str): The name of the table to be printed.
-        :param db_name: db_name (str): The name of the SQLite database.
-        :return:
+        Logs one completion, see check_off_habit_in_db(). Errors are raised.
+    :return: bool
+    """
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # Insert new entry into habit_log
+        cursor.execute(CHECK_OFF_SQL, (habit_ID, True, habit_date))
+        if cursor.rowcount != 1:
+            return False
+
+        cursor.execute("SELECT habit_time_period, habit_date_created FROM habit_info WHERE habit_ID = ?",
+                       (habit_ID,))
+        row = cursor.fetchone()
+        _extend_rollup_to_today(cursor)
+        if row is not None:
+            _log_completions(cursor, habit_ID, row[0], row[1], [habit_date])
+        # the streak follows the new event in the same transaction
+        _apply_events(cursor)
+        return True
+
+
+def update_streak_in_db():
+    """
+    Updates the current and maximum streak counters in 'habit_streak' of all habits with
+    the events of 'habit_log' that are not part of them yet, see _apply_events(). A
+    check-off applies its own event, so there only is work left after log rows were
+    written by other means or a write was interrupted.
+    :return: int: Number of events applied.
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {habit_log}")
-            rows = cursor.fetchall()
+        with transaction() as conn:
+            count = _apply_events(conn.cursor())
+            print(f"Streaks updated with {count} events.")
+            return count
 
-            if rows:
-                print(f"\n--- Contents of table: {habit_log} ---")
-                for row in rows:
-                    print(row)
-            else:
-                print(f"\nTable '{habit_log}' is empty.")
     except sqlite3.OperationalError as e:
-        print(f"Error reading table '{habit_log}':", e)
+        print("Error while updating streak:", e)
+        return 0
 
 
-def print_table(habit_streak, db_name):
+# methods to convert between the date strings of the database and day numbers
+
+# dates memoized by day_number() and day_string(); the same few thousand days come up over and over
+DATE_CACHE_SIZE = 1 << 16
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def day_number(habit_date):
     """
-        Prints the contents of a given table from the database.
-        :param habit_streak: table_name (str): The name of the table to be printed.
-        :param db_name: db_name (str): The name of the SQLite database.
-        :return:
+        Converts a date string to its day number of date.toordinal(). Besides ISO-8601,
+        the "%m/%d/%Y" dates of databases and files written by old versions are accepted.
+        Every date is only parsed once.
+    :param habit_date: Date as string.
+    :return: int
+    """
+    if "/" in habit_date:
+        return datetime.strptime(habit_date, "%m/%d/%Y").toordinal()
+    return date.fromisoformat(habit_date).toordinal()
+
+
+@lru_cache(maxsize=DATE_CACHE_SIZE)
+def day_string(day):
+    """
+        Converts a day number to the ISO-8601 string stored in the database and shown to users.
+    :param day: Day number of date.toordinal().
+    :return: str
+    """
+    return date.fromordinal(day).isoformat()
+
+
+def week_key(day):
+    """
+        Returns the key of the ISO week containing a day, as stored in habit_log.habit_week:
+        the number of weeks since the week of day number 1, which is a Monday. Two days
+        lie in consecutive weeks if their keys differ by 1.
+    :param day: Day number of date.toordinal().
+    :return: int
+    """
+    return (day - 1) // 7
+
+
+# methods to derive the streaks from the complete habit_log
+
+def ordinal_sql(column):
+    """
+        Returns an SQL expression converting an ISO-8601 date column to the day number
+        of date.toordinal(), so dates can be compared as integers.
+    :param column: Name of the date column.
+    :return: str
+    """
+    return f"CAST(julianday({column}) - 1721424.5 AS INTEGER)"
+
+
+# number of habit IDs read per query when recomputing selected habits
+RECOMPUTE_BATCH_SIZE = 500
+
+# writes both streak counters of a habit, creating its habit_streak row if necessary
+SAVE_STREAK_SQL = """
+                  INSERT INTO habit_streak (habit_ID, habit_counter, habit_counter_max)
+                  VALUES (?, ?, ?)
+                  ON CONFLICT (habit_ID) DO UPDATE
+                  SET habit_counter = excluded.habit_counter,
+                  habit_counter_max = excluded.habit_counter_max
+                  """
+
+# writes the snapshot of a habit's streak: the counters, the last completion, the next
+# due date and the sequence number of the last event they include
+SAVE_SNAPSHOT_SQL = """
+                    INSERT INTO habit_streak (habit_counter, habit_counter_max, habit_last_completed,
+                    habit_next_due, habit_last_seq, habit_ID)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (habit_ID) DO UPDATE
+                    SET habit_counter = excluded.habit_counter,
+                    habit_counter_max = excluded.habit_counter_max,
+                    habit_last_completed = excluded.habit_last_completed,
+                    habit_next_due = excluded.habit_next_due,
+                    habit_last_seq = excluded.habit_last_seq
+                    """
+
+
+def compute_streaks(day_numbers, time_period):
+    """
+    Derives the current and the longest streak of a habit in a single pass over
+    the day numbers of its completions. Every completion is put into the calendar
+    period of the habit, and a streak is a run of consecutive periods that were
+    completed often enough, see periods.fold().
+    :param day_numbers: Ascending day numbers (e.g. date.toordinal()) of all completions.
+    :param time_period: Periodicity of the habit, e.g. 'd', 'w', 'm', '3d' or '3/w'.
+    :return: tuple: (current streak, longest streak)
+    """
+    return periods.streaks(day_numbers, time_period)
+
+
+def _streak_snapshots(habits, completions, last_event):
+    """
+        Derives the streak snapshots of habits from their completions.
+    :param habits: {habit_ID: (time period, creation date)}
+    :param completions: (habit_ID, day numbers) pairs as of _iter_completion_days().
+    :param last_event: Sequence number of the last event the snapshots include.
+    :return: list of tuples in the column order of SAVE_SNAPSHOT_SQL
+    """
+    # habits without any completion have no streak and are due on the day they were created
+    snapshots = {habit_ID: (0, 0, None, created, last_event, habit_ID)
+                 for habit_ID, (_, created) in habits.items()}
+    for habit_ID, days in completions:
+        if habit_ID in habits:
+            time_period = habits[habit_ID][0]
+            current, longest, last_day, completed = periods.fold(days, time_period)
+            snapshots[habit_ID] = (current, longest, day_string(last_day),
+                                   day_string(periods.due_day(last_day, time_period, completed)),
+                                   last_event, habit_ID)
+    return list(snapshots.values())
+
+
+def _iter_completion_days(cursor, habit_ids=None, habit_range=None):
+    """
+        Streams (habit_ID, day numbers) for every habit with at least one completion,
+        ordered by habit_ID. The rows come out of the (habit_ID, date) index in order,
+        so no sorting is needed.
+    :param cursor: Cursor of the connection to read from.
+    :param habit_ids: Optional list of habit IDs to restrict the query to.
+    :param habit_range: Optional tuple (first, last) of habit IDs to restrict the query to.
+    :return: generator of tuples
+    """
+    query = """
+            SELECT habit_ID, habit_day
+            FROM habit_log
+            WHERE habit_completed
+            """
+    parameters = []
+    if habit_ids is not None:
+        query += f" AND habit_ID IN ({', '.join('?' * len(habit_ids))})"
+        parameters += habit_ids
+    if habit_range is not None:
+        query += " AND habit_ID BETWEEN ? AND ?"
+        parameters += habit_range
+    query += " ORDER BY habit_ID, habit_date_created"
+    cursor.execute(query, parameters)
+
+    for habit_ID, rows in groupby(cursor, key=itemgetter(0)):
+        yield habit_ID, map(itemgetter(1), rows)
+
+
+def recompute_streaks(habit_ids=None, workers=1):
+    """
+    Recomputes habit_counter, habit_counter_max and habit_next_due from the complete
+    history in 'habit_log' and rewrites 'habit_streak' in bulk. Use this after log entries were
+    backfilled, deleted or imported; placeholder rows that are not completed are ignored.
+    With more than one worker all habits are recomputed in parallel processes, see
+    _recompute_streaks_parallel(); inside an enclosing transaction() they are recomputed
+    in this process, as the workers could not read its uncommitted log rows.
+    :param habit_ids: IDs of the habits to recompute, all habits if None.
+    :param workers: Number of worker processes for recomputing all habits.
+    :return: int: Number of habits whose streaks were rewritten.
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f"SELECT * FROM {habit_streak}")
-            rows = cursor.fetchall()
+        database = get_database()
+        parallel = (workers > 1 and habit_ids is None and database.db_name != ":memory:"
+                    and not database.in_transaction())
+        with transaction() as conn:
+            if parallel:
+                return _recompute_streaks_parallel(conn.cursor(), workers)
+            return _recompute_streaks(conn.cursor(), habit_ids)
 
-            if rows:
-                print(f"\n--- Contents of table: {habit_streak} ---")
-                for row in rows:
-                    print(row)
-            else:
-                print(f"\nTable '{habit_streak}' is empty.")
     except sqlite3.OperationalError as e:
-        print(f"Error reading table '{habit_streak}':", e)
+        print("Error while recomputing streaks:", e)
+        return 0
 
 
+def _recompute_streaks(cursor, habit_ids=None):
+    """
+        Rewrites the streak snapshots of habits from their complete log, as of the last
+        event, see recompute_streaks().
+    :return: int: Number of habits
+    """
+    last_event = _sequence(cursor, "habit_log")
+    if habit_ids is None:
+        batches = [None]
+    else:
+        habit_ids = list(habit_ids)
+        batches = [habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+                   for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE)]
+
+    count = 0
+    for batch in batches:
+        query = "SELECT habit_ID, habit_time_period, habit_date_created FROM habit_info"
+        if batch is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query + f" WHERE habit_ID IN ({', '.join('?' * len(batch))})", batch)
+        habits = {habit_ID: (time_period, created) for habit_ID, time_period, created in cursor.fetchall()}
+
+        snapshots = _streak_snapshots(habits, _iter_completion_days(cursor, batch), last_event)
+        cursor.executemany(SAVE_SNAPSHOT_SQL, snapshots)
+        count += len(snapshots)
+    if habit_ids is None:
+        _set_sequence(cursor, "habit_streak", last_event)
+    return count
+
+
+# the habits are split into this many partitions per worker, so a worker that gets
+# habits with long logs does not hold up the others
+PARTITIONS_PER_WORKER = 4
+
+
+def _habit_partitions(cursor, partitions):
+    """
+        Splits the habit IDs into at most partitions ranges of about the same number of habits.
+    :return: list of tuples: (first habit_ID, last habit_ID)
+    """
+    cursor.execute("SELECT habit_ID FROM habit_info ORDER BY habit_ID")
+    habit_ids = [row[0] for row in cursor]
+    size = -(-len(habit_ids) // partitions)
+    return [(habit_ids[i], habit_ids[min(i + size, len(habit_ids)) - 1])
+            for i in range(0, len(habit_ids), size)]
 
-# methods for checking off habit
 
-def check_off_habit_in_db(habit_ID):
+def _recompute_partition(db_name, first, last, last_event):
     """
-    Marks a habit as completed for today's date by adding a row to 'habit_log'.
-    :param habit_ID: The ID of the habit being marked as completed.
-    :return:
+        Worker of _recompute_streaks_parallel(): computes the streaks of the habits with
+        IDs from first to last on a read-only connection of its own.
+    :return: list of tuples in the column order of SAVE_SNAPSHOT_SQL
     """
-    today = date.today().strftime("%m/%d/%Y")
+    conn = sqlite3.connect(f"file:{db_name}?mode=ro", uri=True)
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
+        cursor = conn.cursor()
+        cursor.execute("SELECT habit_ID, habit_time_period, habit_date_created FROM habit_info "
+                       "WHERE habit_ID BETWEEN ? AND ?", (first, last))
+        habits = {habit_ID: (time_period, created) for habit_ID, time_period, created in cursor.fetchall()}
+        return _streak_snapshots(habits, _iter_completion_days(cursor, habit_range=(first, last)), last_event)
+    finally:
+        conn.close()
 
-            # Insert new entry into habit_log
-            cursor.execute("""
-                INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created)
-                VALUES (?, ?, ?)
-            """, (habit_ID, True, today))
 
-            conn.commit()
+def _recompute_streaks_parallel(cursor, workers):
+    """
+        Recomputes the streaks of all habits like _recompute_streaks(), with the CPU-bound
+        part spread over worker processes. The habit IDs are split into ranges, every
+        worker reads the log of its ranges with a read-only connection and returns the
+        snapshots, which are written back in the transaction of cursor. That transaction
+        holds the write lock while the workers read, so no other writer changes the log
+        in between. The workers only see committed rows, so the transaction must not
+        have written to the log itself: it has to be the outermost one.
+    :param cursor: Cursor inside an outermost transaction() that has not written yet.
+    :param workers: Number of worker processes.
+    :return: int: Number of habits
+    """
+    last_event = _sequence(cursor, "habit_log")
+    partitions = _habit_partitions(cursor, workers * PARTITIONS_PER_WORKER)
+    db_name = get_database().db_name
+
+    count = 0
+    with ProcessPoolExecutor(workers) as executor:
+        for snapshots in executor.map(_recompute_partition, repeat(db_name),
+                                      [first for first, _ in partitions], [last for _, last in partitions],
+                                      repeat(last_event)):
+            cursor.executemany(SAVE_SNAPSHOT_SQL, snapshots)
+            count += len(snapshots)
+    _set_sequence(cursor, "habit_streak", last_event)
+    return count
+
+
+def check_off_many(completions):
+    """
+    Marks many habits as completed on many dates in a single transaction. The log rows
+    are written with one executemany, then the streaks of the affected habits are
+    updated in the same transaction: habits that only got completions after their last
+    logged one continue their streak incrementally, habits with backdated completions
+    are recomputed from their log.
+    :param completions: Iterable of (habit_ID, date) pairs, the date as datetime.date
+                        or ISO-8601 string. Dates in the past are accepted.
+    :return: int: Number of completions that were not logged before.
+    """
+    completed_days = {}
+    for habit_ID, habit_date in completions:
+        if isinstance(habit_date, date):
+            habit_date = habit_date.isoformat()
+        completed_days.setdefault(habit_ID, set()).add(habit_date)
+
+    try:
+        return _write(_check_off_many, completed_days)
+
     except sqlite3.OperationalError as e:
-        print("Failed to mark habit as completed:", e)
+        print("Failed to mark habits as completed:", e)
+        return 0
+
+
+def _check_off_many(completed_days):
+    """
+        Logs the completions of many habits, see check_off_many(). Errors are raised.
+    :param completed_days: {habit_ID: set of ISO-8601 dates}
+    :return: int
+    """
+    habit_ids = list(completed_days)
+    with transaction() as conn:
+        cursor = conn.cursor()
+
+        # 1. Time period and creation date of the affected habits
+        habits = {}
+        for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE):
+            batch = habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+            cursor.execute(f"""
+                    SELECT habit_ID, habit_time_period, habit_date_created
+                    FROM habit_info
+                    WHERE habit_ID IN ({', '.join('?' * len(batch))})
+                """, batch)
+            habits.update((row[0], row[1:]) for row in cursor)
+
+        # 2. Log all completions of existing habits; rowcount leaves out the rows
+        #    the event triggers change
+        cursor.executemany(CHECK_OFF_SQL, ((habit_ID, True, habit_date)
+                                           for habit_ID in habits
+                                           for habit_date in completed_days[habit_ID]))
+        checked_off = cursor.rowcount
+
+        # 3. Update the derived tables, completions that were logged before leave them unchanged
+        _extend_rollup_to_today(cursor)
+        for habit_ID, (time_period, date_created) in habits.items():
+            _log_completions(cursor, habit_ID, time_period, date_created, sorted(completed_days[habit_ID]))
+
+        # 4. Apply the new events to the streaks, backdated ones recompute their habit
+        _apply_events(cursor)
+        return checked_off
+
+
+# methods to apply the events of habit_log to the snapshots in habit_streak
+
+def _sequence(cursor, name):
+    """
+        Returns a counter of habit_sequence.
+    :param name: 'habit_log' for the last event, 'habit_streak' for the checkpoint,
+                 'habit_rollup' for the day the rollup was extended to.
+    :return: int
+    """
+    cursor.execute("SELECT seq FROM habit_sequence WHERE name = ?", (name,))
+    return cursor.fetchone()[0]
+
+
+def _set_sequence(cursor, name, seq):
+    cursor.execute("UPDATE habit_sequence SET seq = ? WHERE name = ?", (seq, name))
+
+
+def _apply_events(cursor):
+    """
+        Brings the streak snapshots in habit_streak up to date with habit_log. Only the
+        events after the checkpoint are read, through the index on habit_seq, and of
+        those only the ones after the habit_last_seq of their habit. Completions after
+        the last applied one continue the streak period by period; an event on or
+        before that day, e.g. a backdated completion, is replayed on the completion
+        bitmap of the habit, and so is every event of a habit that has to be completed
+        several times per period, as the snapshot does not hold the completions of its
+        last period, see _replay_backdated(). Afterwards the checkpoint is moved to the
+        last event, so the next call starts there.
+    :return: int: Number of events applied
+    """
+    checkpoint, last_event = _sequence(cursor, "habit_streak"), _sequence(cursor, "habit_log")
+    if checkpoint == last_event:
+        return 0
+    cursor.execute("""
+                   SELECT habit_log.habit_ID, habit_log.habit_seq, habit_log.habit_completed,
+                   habit_log.habit_day, habit_info.habit_time_period, habit_info.habit_date_created,
+                   habit_streak.habit_counter, habit_streak.habit_counter_max,
+                   habit_streak.habit_last_completed
+                   FROM habit_log
+                   CROSS JOIN habit_streak ON habit_streak.habit_ID = habit_log.habit_ID
+                   CROSS JOIN habit_info ON habit_info.habit_ID = habit_log.habit_ID
+                   WHERE habit_log.habit_seq > ? AND habit_log.habit_seq > habit_streak.habit_last_seq
+                   ORDER BY habit_log.habit_seq
+                   """, (checkpoint,))
+    # grouped by habit in Python, ordering by habit_ID in SQL would scan the whole log
+    events = sorted(cursor, key=itemgetter(0))
+    bitmaps = _stale_bitmaps_rebuilt(cursor, events)
+
+    snapshots, backdated, recompute = [], {}, []
+    for habit_ID, rows in groupby(events, key=itemgetter(0)):
+        rows = list(rows)
+        time_period, date_created, counter, counter_max, last_completed = rows[0][4:]
+        periodicity = periods.get(time_period)
+        previous = day_number(last_completed) if last_completed else None
+        days = [(row[3], row[2]) for row in rows]
+        counter, counter_max = counter or 0, counter_max or 0
+        if periodicity is None:
+            recompute.append(habit_ID)
+            continue
+        if periodicity.target > 1 or previous is not None and min(days)[0] <= previous:
+            backdated[habit_ID] = (time_period, counter, counter_max, days, rows[-1][1])
+            continue
+        for day in sorted(day for day, completed in days if completed):
+            period = periods.bucket(day, periodicity)
+            if previous is None or period > periods.bucket(previous, periodicity) + 1:
+                counter = 1
+            elif period > periods.bucket(previous, periodicity):
+                counter += 1
+            counter_max = max(counter, counter_max)
+            previous = day
+        next_due = next_due_date(time_period, previous and date.fromordinal(previous), date_created)
+        if previous is not None:
+            last_completed = day_string(previous)
+        snapshots.append((counter, counter_max, last_completed, next_due, rows[-1][1], habit_ID))
+
+    cursor.executemany(SAVE_SNAPSHOT_SQL, snapshots)
+    recompute += _replay_backdated(cursor, backdated, bitmaps)
+    if recompute:
+        _recompute_streaks(cursor, recompute)
+    _set_sequence(cursor, "habit_streak", last_event)
+    return len(events)
+
+
+def _replay_streaks(habit_bitmap, time_period, counter, counter_max, days):
+    """
+        Replays the events of a habit on its completion bitmap, which already holds the
+        completions of the events. Completions only add met periods, so the streaks only
+        change around a period the events made met: the run through it is counted on the
+        bitmap in both directions, period by period, and is the current streak if it
+        ends with the last met period. Periods the events left unmet keep both streaks.
+    :param habit_bitmap: bitmap.Bitmap of the habit, or None.
+    :param counter: Current streak of the snapshot before the events.
+    :param counter_max: Longest streak of the snapshot before the events.
+    :param days: (day number, completed) of the events.
+    :return: tuple: (current streak, longest streak, last completed day, completed days in
+                    its period), or None if the bitmap is empty.
+    """
+    if habit_bitmap is None or not habit_bitmap.bits:
+        return None
+    periodicity = periods.get(time_period)
+    target = periodicity.target
+
+    def completed_days(period):
+        first, last = periods.period_bounds(period, periodicity)
+        return bin(bitmap.window(habit_bitmap, first, last - first + 1)).count("1")
+
+    def run(period, step):
+        length = 0
+        while completed_days(period) >= target:
+            length, period = length + 1, period + step
+        return length
+
+    added = Counter(periods.bucket(day, periodicity) for day, completed in days if completed)
+    counts = {period: completed_days(period) for period in added}
+    met = sorted(period for period, count in added.items() if counts[period] - count < target <= counts[period])
+    last_day = habit_bitmap.first_day + habit_bitmap.bits.bit_length() - 1
+    if met:
+        last_met = periods.bucket(last_day, periodicity)
+        while completed_days(last_met) < target:
+            last_met -= 1
+        run_end = None
+        for period in met:
+            # periods of a run counted already are not counted again
+            if run_end is None or period > run_end:
+                after = run(period + 1, 1)
+                length = run(period - 1, -1) + 1 + after
+                counter_max = max(counter_max, length)
+                run_end = period + after
+                if run_end == last_met:
+                    counter = length
+    return counter, counter_max, last_day, completed_days(periods.bucket(last_day, periodicity))
+
+
+def _stale_bitmaps_rebuilt(cursor, events):
+    """
+        Reads the completion bitmaps of the habits of some events. The check-offs update
+        the bitmap together with the log; the bitmaps of habits whose log rows were
+        written by other means, e.g. by another program, do not match their events and
+        are rebuilt from the log, so they can be replayed on the next time.
+    :param events: Rows of _apply_events(), ordered by habit ID.
+    :return: dict: {habit_ID: bitmap.Bitmap} of the habits whose bitmap matches their events.
+    """
+    habit_ids = list({row[0] for row in events})
+    bitmaps = {}
+    for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE):
+        batch = habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+        cursor.execute(f"SELECT habit_ID, first_day, bits FROM habit_bitmap "
+                       f"WHERE habit_ID IN ({', '.join('?' * len(batch))})", batch)
+        bitmaps.update((habit_ID, bitmap.from_blob(day_number(first_day), bits))
+                       for habit_ID, first_day, bits in cursor)
+
+    stale = []
+    for habit_ID, rows in groupby(events, key=itemgetter(0)):
+        habit_bitmap = bitmaps.get(habit_ID, bitmap.Bitmap(0, 0))
+        # the last event of a day holds its state, the rows are in the order of the events
+        days = {row[3]: bool(row[2]) for row in rows}
+        if any(bitmap.completed_on(habit_bitmap, day) != completed for day, completed in days.items()):
+            stale.append(habit_ID)
+            bitmaps.pop(habit_ID, None)
+    if stale:
+        _rebuild_bitmaps(cursor, stale)
+    return bitmaps
+
+
+def _replay_backdated(cursor, habits, bitmaps):
+    """
+        Writes the snapshots of habits whose events cannot simply continue their streak,
+        replayed on their completion bitmaps, see _replay_streaks(). Only the periods
+        around the events are read instead of the whole log of the habit.
+    :param habits: {habit_ID: (time period, counter, counter_max, events as (day number,
+                   completed), sequence number of the last event)}
+    :param bitmaps: {habit_ID: bitmap.Bitmap} that match the events, see _stale_bitmaps_rebuilt().
+    :return: list: IDs of the habits without a matching bitmap; they have to be recomputed.
+    """
+    snapshots, failed = [], []
+    for habit_ID, (time_period, counter, counter_max, days, last_seq) in habits.items():
+        replayed = _replay_streaks(bitmaps.get(habit_ID), time_period, counter, counter_max, days)
+        if replayed is None:
+            failed.append(habit_ID)
+            continue
+        counter, counter_max, last_day, completed = replayed
+        snapshots.append((counter, counter_max, day_string(last_day),
+                          day_string(periods.due_day(last_day, time_period, completed)), last_seq, habit_ID))
+    cursor.executemany(SAVE_SNAPSHOT_SQL, snapshots)
+    return failed
+
+
+# methods to maintain the day by which a habit has to be completed again
+
+def next_due_date(time_period, last_completion, habit_date_created=None, completed=None):
+    """
+        Returns the last day on which the next completion of a habit continues its
+        streak: the end of the period after its last completion, or the end of the
+        period of the last completion while that period is not completed often enough
+        yet, or the day the habit was created if it was never completed.
+    :param time_period: Periodicity of the habit, e.g. 'd', 'w', 'm', '3d' or '3/w'.
+    :param last_completion: datetime.date of the last completion, or None.
+    :param habit_date_created: Creation date of the habit as ISO-8601 string.
+    :param completed: Completed days in the period of the last completion, see periods.due_day().
+    :return: str: ISO-8601 date, or None
+    """
+    if last_completion is None:
+        return habit_date_created
+    return day_string(periods.due_day(last_completion.toordinal(), time_period, completed))
 
 
-def update_streak_in_db(habit_ID):
+def _rebuild_due_dates(cursor, habit_ids=None):
     """
-    Updates the current and maximum streak counters for a habit based on the
-    last two completion dates and the habit's time period.
-    :param habit_ID: The ID of the habit whose streak is being updated.
+        Sets habit_next_due like next_due_date() from the last completion in habit_log,
+        read from the end of the (habit_ID, date) index of every habit. For habits with
+        a target of several completions per period, the completions of the last period
+        are counted as well.
+    :param habit_ids: IDs of the habits, all habits if None.
     :return:
     """
-    try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
+    query = """
+            SELECT habit_info.habit_ID, habit_info.habit_time_period, habit_info.habit_date_created,
+            (SELECT habit_log.habit_day FROM habit_log
+             WHERE habit_log.habit_ID = habit_info.habit_ID AND habit_completed
+             ORDER BY habit_log.habit_date_created DESC LIMIT 1)
+            FROM habit_streak CROSS JOIN habit_info ON habit_info.habit_ID = habit_streak.habit_ID
+            """
+    if habit_ids is None:
+        cursor.execute(query)
+        habits = cursor.fetchall()
+    else:
+        habit_ids = list(habit_ids)
+        habits = []
+        for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE):
+            batch = habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+            cursor.execute(query + f" WHERE habit_streak.habit_ID IN ({', '.join('?' * len(batch))})", batch)
+            habits += cursor.fetchall()
+
+    due_dates = []
+    for habit_ID, time_period, date_created, last_day in habits:
+        if last_day is None:
+            due_dates.append((date_created, habit_ID))
+            continue
+        periodicity = periods.get(time_period)
+        completed = None
+        if periodicity is not None and periodicity.target > 1:
+            first, last = periods.period_bounds(periods.bucket(last_day, periodicity), periodicity)
+            cursor.execute("SELECT COUNT(*) FROM habit_log WHERE habit_ID = ? AND habit_completed "
+                           "AND habit_date_created BETWEEN ? AND ?", (habit_ID, day_string(first), day_string(last)))
+            completed = cursor.fetchone()[0]
+        due_dates.append((day_string(periods.due_day(last_day, time_period, completed)), habit_ID))
+    cursor.executemany("UPDATE habit_streak SET habit_next_due = ? WHERE habit_ID = ?", due_dates)
+
+
+# methods to maintain the rollup of completions per day, ISO week and month
+
+# buckets kept in habit_rollup per time period, the first one is the period of the habit itself;
+# habits with other periodicities have no rollup
+ROLLUP_BUCKETS = {"d": ("d", "w", "m"), "w": ("w", "m"), "m": ("m",)}
+
+# marks the period of a habit as completed, unless it already is
+ROLLUP_COMPLETE_SQL = """
+                      UPDATE habit_rollup SET completed = 1
+                      WHERE habit_ID = ? AND bucket = ? AND period_start = ? AND completed = 0
+                      """
+
+ROLLUP_ADD_SQL = """
+                 UPDATE habit_rollup SET completed = completed + 1
+                 WHERE habit_ID = ? AND bucket = ? AND period_start = ?
+                 """
+
+ROLLUP_INSERT_SQL = """
+                    INSERT OR IGNORE INTO habit_rollup (habit_ID, bucket, period_start, completed, expected)
+                    VALUES (?, ?, ?, ?, ?)
+                    """
+
+
+def bucket_start(day, bucket):
+    """
+        Returns the first day of the bucket containing a day.
+    :param day: Day number of date.toordinal().
+    :param bucket: 'd' for days, 'w' for ISO weeks starting on Monday or 'm' for months.
+    :return: int: Day number
+    """
+    if bucket == "w":
+        return week_key(day) * 7 + 1
+    if bucket == "m":
+        return date.fromordinal(day).replace(day=1).toordinal()
+    return day
 
-            # 1. Get the last completion date
-            cursor.execute("""
-                    SELECT habit_date_created 
-                    FROM habit_log 
-                    WHERE habit_ID = ? 
-                    ORDER BY habit_date_created DESC LIMIT 2
-                """, (habit_ID,))
-            dates = cursor.fetchall()
-
-            if len(dates) < 2:
-                # First completion or only one record: start streak
-                cursor.execute("""
-                        UPDATE habit_streak 
-                        SET habit_counter = 1 
-                        WHERE habit_ID = ?
-                    """, (habit_ID,))
-                conn.commit()
-                return
 
-            last_date = datetime.strptime(dates[1][0], "%m/%d/%Y").date()
-            today = date.today()
+def _next_bucket_start(start, bucket):
+    """
+        Returns the first day of the bucket following the bucket starting at start.
+    """
+    if bucket == "w":
+        return start + 7
+    if bucket == "m":
+        first = date.fromordinal(start)
+        if first.month == 12:
+            return first.replace(year=first.year + 1, month=1).toordinal()
+        return first.replace(month=first.month + 1).toordinal()
+    return start + 1
 
-            # 2. Get time_period (d or w)
-            cursor.execute("""
-                    SELECT habit_time_period 
-                    FROM habit_info 
-                    WHERE habit_ID = ?
-                """, (habit_ID,))
-            time_period = cursor.fetchone()[0]
-
-            # 3. Define valid gap
-            if time_period == 'd':
-                expected_date = last_date + timedelta(days=1)
-            elif time_period == 'w':
-                expected_date = last_date + timedelta(weeks=1)
-            else:
-                print("Invalid time period.")
-                return
-
-            # 4. Compare and update streak
-            if today == expected_date:
-                # Increment streak
-                cursor.execute("""
-                        UPDATE habit_streak 
-                        SET habit_counter = habit_counter + 1 
-                        WHERE habit_ID = ?
-                    """, (habit_ID,))
+
+def _expected_periods(start, bucket, time_period, first_day):
+    """
+        Returns the number of periods of a habit within a bucket: days for daily habits,
+        ISO weeks for weekly habits, counted in the bucket of their Monday, and months
+        for monthly habits. Periods before the period of the first day of the habit
+        are not expected.
+    :return: int
+    """
+    end = _next_bucket_start(start, bucket) - 1
+    return periods.count_periods(max(start, periods.period_start(first_day, time_period)), end, time_period)
+
+
+def _rollup_rows(habit_ID, time_period, bucket, first, last, first_day, completed=None):
+    """
+        Yields the habit_rollup rows of the buckets starting between first and last.
+    :param completed: Optional {bucket start: completed count}, 0 for missing buckets.
+    :return: generator of tuples in the column order of ROLLUP_INSERT_SQL
+    """
+    start = first
+    while start <= last:
+        yield (habit_ID, bucket, day_string(start),
+               completed.get(start, 0) if completed else 0,
+               _expected_periods(start, bucket, time_period, first_day))
+        start = _next_bucket_start(start, bucket)
+
+
+def _rollup_check_off(cursor, habit_ID, time_period, habit_date_created, habit_date):
+    """
+        Adds a completion to the rollup of a habit. The period of the completion is
+        marked as completed in the bucket of the habit's own time period; only if it
+        was not completed before, the completed counts of the larger buckets containing
+        it are increased. Buckets between the last bucket of the habit and the new one
+        are added with nothing completed.
+    :param habit_date_created: Creation date of the habit as ISO-8601 string, or None.
+    :param habit_date: Date of the completion as ISO-8601 string.
+    :return:
+    """
+    buckets = ROLLUP_BUCKETS.get(time_period)
+    if buckets is None:
+        return
+    day = day_number(habit_date)
+    period = bucket_start(day, buckets[0])
+
+    period_key = (habit_ID, buckets[0], day_string(period))
+    cursor.execute(ROLLUP_COMPLETE_SQL, period_key)
+    if cursor.rowcount == 0:
+        cursor.execute("SELECT 1 FROM habit_rollup WHERE habit_ID = ? AND bucket = ? AND period_start = ?",
+                       period_key)
+        if cursor.fetchone() is not None:
+            return
+
+        # first completion in this bucket: add it and the empty buckets between it and
+        # the existing ones, starting from the first day of the habit like rebuild_rollup()
+        first_day = day
+        if habit_date_created:
+            first_day = min(first_day, day_number(habit_date_created))
+        cursor.execute("SELECT MIN(period_start) FROM habit_rollup WHERE habit_ID = ? AND bucket = ?",
+                       (habit_ID, buckets[0]))
+        earliest = cursor.fetchone()[0]
+        if earliest is not None:
+            first_day = min(first_day, day_number(earliest))
+
+        for bucket in buckets:
+            start = bucket_start(period, bucket)
+            cursor.execute("SELECT MIN(period_start), MAX(period_start) FROM habit_rollup "
+                           "WHERE habit_ID = ? AND bucket = ?", (habit_ID, bucket))
+            first, last = cursor.fetchone()
+            if first is None:
+                first, last = bucket_start(bucket_start(first_day, buckets[0]), bucket), start
             else:
-                # Reset streak
-                cursor.execute("""
-                        UPDATE habit_streak 
-                        SET habit_counter = 1 
-                        WHERE habit_ID = ?
-                    """, (habit_ID,))
+                first, last = (min(start, _next_bucket_start(day_number(last), bucket)),
+                               max(start, day_number(first) - 1))
+            cursor.executemany(ROLLUP_INSERT_SQL,
+                               _rollup_rows(habit_ID, time_period, bucket, first, last, first_day))
+            if earliest is not None and period < day_number(earliest):
+                # the habit starts earlier now, so more periods are expected in its old first bucket
+                old_first = bucket_start(day_number(earliest), bucket)
+                cursor.execute("UPDATE habit_rollup SET expected = ? "
+                               "WHERE habit_ID = ? AND bucket = ? AND period_start = ?",
+                               (_expected_periods(old_first, bucket, time_period, first_day),
+                                habit_ID, bucket, day_string(old_first)))
+        cursor.execute(ROLLUP_COMPLETE_SQL, period_key)
+
+    cursor.executemany(ROLLUP_ADD_SQL, ((habit_ID, bucket,
+                                         day_string(bucket_start(period, bucket)))
+                                        for bucket in buckets[1:]))
+
+
+def _rebuild_rollup(cursor, habit_ids=None):
+    """
+        Rewrites the rollup rows of habits from their complete log, see rebuild_rollup().
+    :return: int: Number of habits
+    """
+    if habit_ids is None:
+        cursor.execute("SELECT habit_ID, habit_time_period, habit_date_created FROM habit_info")
+        habits = cursor.fetchall()
+        cursor.execute("DELETE FROM habit_rollup")
+    else:
+        habit_ids = list(habit_ids)
+        habits = []
+        for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE):
+            batch = habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            cursor.execute(f"SELECT habit_ID, habit_time_period, habit_date_created FROM habit_info "
+                           f"WHERE habit_ID IN ({placeholders})", batch)
+            habits += cursor.fetchall()
+            cursor.execute(f"DELETE FROM habit_rollup WHERE habit_ID IN ({placeholders})", batch)
+
+    today = date.today().toordinal()
+    for i in range(0, len(habits), RECOMPUTE_BATCH_SIZE):
+        batch = habits[i:i + RECOMPUTE_BATCH_SIZE]
+        days = {habit_ID: list(habit_days) for habit_ID, habit_days
+                in _iter_completion_days(cursor, [habit[0] for habit in batch])}
+
+        rows = []
+        for habit_ID, time_period, habit_date_created in batch:
+            buckets = ROLLUP_BUCKETS.get(time_period)
+            if buckets is None:
+                continue
+            habit_days = days.get(habit_ID, [])
+            first_day = day_number(habit_date_created) if habit_date_created else today
+            if habit_days:
+                first_day = min(first_day, habit_days[0])
+            last_day = max([today] + habit_days[-1:])
+
+            completed_periods = {bucket_start(day, buckets[0]) for day in habit_days}
+            for bucket in buckets:
+                completed = Counter(bucket_start(period, bucket) for period in completed_periods)
+                first = bucket_start(bucket_start(first_day, buckets[0]), bucket)
+                rows += _rollup_rows(habit_ID, time_period, bucket, first, last_day, first_day, completed)
+        cursor.executemany(ROLLUP_INSERT_SQL, rows)
+    return len(habits)
+
+
+def _extend_rollup(cursor, habit_ids=None):
+    """
+        Adds the buckets from the last bucket of every habit up to the current one, with
+        nothing completed, so the rollup has the same rows as after _rebuild_rollup().
+        Check-offs only add the buckets up to their own, the buckets of the days since
+        a habit was last completed are added here. Habits without any bucket get them
+        from the day they were created.
+    :param habit_ids: IDs of the habits, all habits if None.
+    :return: int: Number of rows added
+    """
+    query = "SELECT habit_ID, habit_time_period, habit_date_created FROM habit_info"
+    last_query = "SELECT habit_ID, bucket, MAX(period_start) FROM habit_rollup"
+    if habit_ids is None:
+        batches = [None]
+    else:
+        habit_ids = list(habit_ids)
+        batches = [habit_ids[i:i + RECOMPUTE_BATCH_SIZE] for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE)]
+
+    today = date.today().toordinal()
+    count = 0
+    for batch in batches:
+        where, parameters = "", ()
+        if batch is not None:
+            where, parameters = f" WHERE habit_ID IN ({', '.join('?' * len(batch))})", batch
+        cursor.execute(query + where, parameters)
+        habits = cursor.fetchall()
+        cursor.execute(last_query + where + " GROUP BY habit_ID, bucket", parameters)
+        last_starts = {(habit_ID, bucket): day_number(last) for habit_ID, bucket, last in cursor}
+
+        rows = []
+        for habit_ID, time_period, habit_date_created in habits:
+            buckets = ROLLUP_BUCKETS.get(time_period)
+            if buckets is None:
+                continue
+            first_day = day_number(habit_date_created) if habit_date_created else today
+            for bucket in buckets:
+                last = last_starts.get((habit_ID, bucket))
+                if last is None:
+                    first = bucket_start(bucket_start(first_day, buckets[0]), bucket)
+                else:
+                    first = _next_bucket_start(last, bucket)
+                rows += _rollup_rows(habit_ID, time_period, bucket, first, today, first_day)
+        cursor.executemany(ROLLUP_INSERT_SQL, rows)
+        count += len(rows)
+    return count
+
+
+def _extend_rollup_to_today(cursor):
+    """
+        Extends all habits by the buckets that began since the day kept in habit_sequence,
+        so the habits are only read by the first write of a day; every other call reads a
+        single row. Errors are raised.
+    :return: int: Number of rows added.
+    """
+    today = date.today().toordinal()
+    if _sequence(cursor, "habit_rollup") >= today:
+        return 0
+    count = _extend_rollup(cursor)
+    _set_sequence(cursor, "habit_rollup", today)
+    return count
 
-            # 5. Update max if needed
-            cursor.execute("""
-                    UPDATE habit_streak 
-                    SET habit_counter_max = MAX(habit_counter, habit_counter_max)
-                    WHERE habit_ID = ?
-                """, (habit_ID,))
 
-            conn.commit()
-            cursor.close()
-            print(f"Streak updated for habit ID {habit_ID}.")
+def extend_rollup():
+    """
+    Brings 'habit_rollup' up to the current day, ISO week and month, see _extend_rollup().
+    initialize_db() and every check-off do this in their transaction, so the completion
+    rates of analyze.py count the periods since a habit was last completed like
+    rebuild_rollup() does, without writing anything themselves. Call this in a
+    process that keeps running past midnight without writing, e.g. once a day.
+    :return: int: Number of rows added.
+    """
+    try:
+        if _sequence(get_connection().cursor(), "habit_rollup") >= date.today().toordinal():
+            return 0
+        with transaction() as conn:
+            # another writer may have extended it while this one waited for the lock
+            return _extend_rollup_to_today(conn.cursor())
 
     except sqlite3.OperationalError as e:
-        print("Error while updating streak:", e)
+        print("Error while extending the rollup:", e)
+        return 0
+
+
+def rebuild_rollup(habit_ids=None):
+    """
+    Rebuilds 'habit_rollup' from the complete history in 'habit_log'. The table holds
+    one row per habit and day, ISO week and month (weekly habits only have weeks and
+    months, monthly habits only months) from the creation of the habit until today,
+    with the number of periods completed and expected in it. Check-offs keep it up to date; use this after log
+    entries were backfilled, deleted or imported.
+    :param habit_ids: IDs of the habits to rebuild, all habits if None.
+    :return: int: Number of habits whose rollup was rebuilt.
+    """
+    try:
+        with transaction() as conn:
+            return _rebuild_rollup(conn.cursor(), habit_ids)
+
+    except sqlite3.OperationalError as e:
+        print("Error while rebuilding the rollup:", e)
+        return 0
+
+
+# methods to maintain the completion bitmaps
+
+BITMAP_SAVE_SQL = """
+                  INSERT INTO habit_bitmap (habit_ID, first_day, bits)
+                  VALUES (?, ?, ?)
+                  ON CONFLICT (habit_ID) DO UPDATE
+                  SET first_day = excluded.first_day, bits = excluded.bits
+                  """
+
+
+def _log_completions(cursor, habit_ID, time_period, habit_date_created, habit_dates):
+    """
+        Updates the tables derived from habit_log after completions of a habit were logged.
+        Completions that were logged before leave them unchanged. The streak and the
+        next due date follow from the events, see _apply_events().
+    :param habit_date_created: Creation date of the habit as ISO-8601 string, or None.
+    :param habit_dates: Dates of the completions as ISO-8601 strings.
+    :return:
+    """
+    cursor.execute("SELECT first_day, bits FROM habit_bitmap WHERE habit_ID = ?", (habit_ID,))
+    row = cursor.fetchone()
+    if row is None:
+        # the bitmap starts on the day the habit was created
+        first_day = day_number(habit_date_created or habit_dates[0])
+        habit_bitmap = bitmap.Bitmap(first_day, 0)
+    else:
+        habit_bitmap = bitmap.from_blob(day_number(row[0]), row[1])
+    # the bitmap holds the completions logged before, they are in the rollup already
+    days = [day for day in map(day_number, habit_dates) if not bitmap.completed_on(habit_bitmap, day)]
+    if not days:
+        return
+    for day in days:
+        _rollup_check_off(cursor, habit_ID, time_period, habit_date_created, day_string(day))
+
+    habit_bitmap = bitmap.add_days(habit_bitmap, days)
+    cursor.execute(BITMAP_SAVE_SQL, (habit_ID, day_string(habit_bitmap.first_day),
+                                     bitmap.to_blob(habit_bitmap)))
+
+
+def _rebuild_bitmaps(cursor, habit_ids=None):
+    """
+        Rewrites the bitmaps of habits from their complete log, see rebuild_bitmaps().
+    :return: int: Number of habits
+    """
+    if habit_ids is None:
+        cursor.execute("SELECT habit_ID, habit_date_created FROM habit_info")
+        habits = cursor.fetchall()
+        cursor.execute("DELETE FROM habit_bitmap")
+    else:
+        habit_ids = list(habit_ids)
+        habits = []
+        for i in range(0, len(habit_ids), RECOMPUTE_BATCH_SIZE):
+            batch = habit_ids[i:i + RECOMPUTE_BATCH_SIZE]
+            placeholders = ", ".join("?" * len(batch))
+            cursor.execute(f"SELECT habit_ID, habit_date_created FROM habit_info "
+                           f"WHERE habit_ID IN ({placeholders})", batch)
+            habits += cursor.fetchall()
+            cursor.execute(f"DELETE FROM habit_bitmap WHERE habit_ID IN ({placeholders})", batch)
+
+    today = date.today().toordinal()
+    for i in range(0, len(habits), RECOMPUTE_BATCH_SIZE):
+        batch = habits[i:i + RECOMPUTE_BATCH_SIZE]
+        days = {habit_ID: list(habit_days) for habit_ID, habit_days
+                in _iter_completion_days(cursor, [habit[0] for habit in batch])}
+
+        rows = []
+        for habit_ID, habit_date_created in batch:
+            first_day = day_number(habit_date_created) if habit_date_created else today
+            habit_bitmap = bitmap.Bitmap(first_day, 0)
+            if habit_ID in days:
+                habit_bitmap = bitmap.add_days(habit_bitmap, days[habit_ID])
+            rows.append((habit_ID, day_string(habit_bitmap.first_day),
+                         bitmap.to_blob(habit_bitmap)))
+        cursor.executemany(BITMAP_SAVE_SQL, rows)
+    return len(habits)
+
+
+def rebuild_bitmaps(habit_ids=None):
+    """
+    Rebuilds 'habit_bitmap' from the complete history in 'habit_log'. Check-offs keep
+    the bitmaps up to date; use this after log entries were backfilled, deleted or imported.
+    :param habit_ids: IDs of the habits to rebuild, all habits if None.
+    :return: int: Number of habits whose bitmap was rebuilt.
+    """
+    try:
+        with transaction() as conn:
+            return _rebuild_bitmaps(conn.cursor(), habit_ids)
+
+    except sqlite3.OperationalError as e:
+        print("Error while rebuilding the bitmaps:", e)
+        return 0
+
+
+def get_habit_bitmap(habit_ID):
+    """
+         Retrieves the completion bitmap of a habit from 'habit_bitmap'.
+    :param habit_ID: The ID of the habit.
+    :return: bitmap.Bitmap, or None if the habit has no bitmap.
+    """
+    try:
+        cursor = get_connection().cursor()
+        cursor.execute("SELECT first_day, bits FROM habit_bitmap WHERE habit_ID = ?", (habit_ID,))
+        row = cursor.fetchone()
+        return bitmap.from_blob(day_number(row[0]), row[1]) if row else None
+    except sqlite3.OperationalError as e:
+        print("Failed to fetch the habit bitmap:", e)
+        return None
 
 
 def update_habit_info(habit_ID, new_habit_name, new_habit_description):
@@ -370,15 +2176,20 @@ def update_habit_info(habit_ID, new_habit_name, new_habit_description):
     :return:
     """
     try:
-        with sqlite3.connect(db_name) as conn:
-            cursor = conn.cursor()
-            cursor.execute(""" 
-                UPDATE habit_info
-                SET habit_name = ?,
-                habit_description = ?
-                WHERE habit_ID = ?""",
-                           (habit_ID, new_habit_name, new_habit_description))
-            conn.commit()
-            print(f"Habit {habit_ID} successfully updated in habit_info.")
+        _write(_in_transaction, _update_habit_info, habit_ID, new_habit_name, new_habit_description)
+        print(f"Habit {habit_ID} successfully updated in habit_info.")
     except sqlite3.OperationalError as e:
         print("Error while editing habit_info:", e)
+
+
+def _update_habit_info(cursor, habit_ID, new_habit_name, new_habit_description):
+    """
+        Updates the name and description of a habit, see update_habit_info(). Errors are raised.
+    :return:
+    """
+    cursor.execute(""" 
+        UPDATE habit_info
+        SET habit_name = ?,
+        habit_description = ?
+        WHERE habit_ID = ?""",
+                   (new_habit_name, new_habit_description, habit_ID))
@@ -1,5 +1,6 @@
 from datetime import date
 import db
+import periods
 
 
 class Habit:
@@ -9,31 +10,103 @@ and methods will be defined.
 
     This class allows creation, tracking, and editing of habits. It automatically
     adds the habit to the database in the three tables habit_info, habit_log and habit_streak.
+    With save=False the object is only built, without touching the database, and can
+    be stored later together with many others by Habit.save_many(); Habit.create_many()
+    does both for a list of habits.
 
     Attributes:
         habit_ID (int): identifier assigned by the database.
         habit_name (str): Name of the habit.
         habit_description (str): Description of the habit.
-        habit_time_period (str): Time interval for habit ('d' for daily, 'w' for weekly).
-        habit_date_created (str): Date the habit was created (MM/DD/YYYY).
+        habit_time_period (str): Periodicity of the habit, e.g. 'd' for daily, 'w' for weekly,
+                                 'm' for monthly, '3d' for every 3 days or '3/w' for 3 times
+                                 per week, see periods.py.
+        habit_date_created (str): Date the habit was created (YYYY-MM-DD).
         habit_counter (int): Current streak count.
         habit_counter_max (int): Maximum streak count.
         habit_completed (bool): Whether the habit is marked completed for the current period.
+        habit_log (list[tuple]): (date, completed) entries of the habit, loaded from the
+                                 database on first access.
+
+    Habits that already exist in the database are loaded with HabitRepository instead,
+    which builds the objects without writing anything.
     """
 
+    # fixed attributes keep the objects small when many habits are held in memory
+    __slots__ = ("habit_ID", "habit_name", "habit_description", "habit_time_period",
+                 "habit_date_created", "habit_counter", "habit_counter_max",
+                 "habit_completed", "_habit_log")
+
     # initiating the class
     def __init__(self, name: str, description: str,
-                 time_period: str, completed = False):
+                 time_period: str, completed = False, save = True):
         self.habit_ID = None
         self.habit_name = name
         self.habit_description = description
-        self.habit_time_period = time_period
-        self.habit_date_created = date.today().strftime("%m/%d/%Y")
+        self.habit_time_period = periods.normalize(time_period)
+        self.habit_date_created = date.today().isoformat()
         self.habit_counter = 0
         self.habit_counter_max = 0
         self.habit_completed = completed
+        self._habit_log = None
+
+        if save:
+            self.add_habit_object()
+
+
+    @classmethod
+    def from_row(cls, row):
+        """
+            Build a Habit from a database row without touching the database.
+        :param row: (habit_ID, habit_name, habit_description, habit_time_period,
+                     habit_date_created, habit_counter, habit_counter_max, habit_completed)
+        :return: Habit
+        """
+        habit = cls.__new__(cls)
+        (habit.habit_ID, habit.habit_name, habit.habit_description, habit.habit_time_period,
+         habit.habit_date_created, habit.habit_counter, habit.habit_counter_max,
+         completed) = row
+        habit.habit_completed = bool(completed)
+        habit._habit_log = None
+        return habit
+
 
-        self.add_habit_object()
+    @classmethod
+    def save_many(cls, habits):
+        """
+            Add habits built with save=False to the database in a single transaction,
+            see db.add_habits_bulk(). Their habit_ID is set afterwards.
+        :param habits: list[Habit]
+        :return: list[Habit], the habits given
+        """
+        habit_ids = db.add_habits_bulk((habit.habit_name, habit.habit_description, habit.habit_time_period,
+                                        habit.habit_date_created, habit.habit_completed)
+                                       for habit in habits)
+        for habit, habit_ID in zip(habits, habit_ids):
+            habit.habit_ID = habit_ID
+        return habits
+
+
+    @classmethod
+    def create_many(cls, specs):
+        """
+            Create many habits at once, e.g. from a template or an import: the objects
+            are built without side effects and then stored with save_many().
+        :param specs: Iterable of dicts with the arguments of Habit(), e.g.
+                      {"name": "Read", "description": "10 pages", "time_period": "d"}.
+        :return: list[Habit]
+        """
+        return cls.save_many([cls(**spec, save=False) for spec in specs])
+
+
+    @property
+    def habit_log(self):
+        """
+            The log entries of the habit, only queried the first time they are used.
+        """
+        if self._habit_log is None:
+            self._habit_log = db.get_habit_log(self.habit_ID)
+        return self._habit_log
 
 
     def __str__(self):
@@ -46,25 +119,84 @@ and methods will be defined.
     # defining the method to add a new habit in the database using a db function
     def add_habit_object(self):
         """
-            Add the habit's details to the database.
+            Add the habit's details to the database. All three rows are written
+            in one transaction, so the habit is committed exactly once.
         """
-        self.habit_ID = db.add_habit_info(
+        self.habit_ID = db.add_habit(
             self.habit_name,
             self.habit_description,
             self.habit_time_period,
-            self.habit_date_created
-        )
-        db.add_habit_log(
-            self.habit_ID,
+            self.habit_date_created,
             self.habit_completed,
-            self.habit_date_created
-        )
-
-        db.add_habit_streak(
-            self.habit_ID,
             self.habit_counter,
             self.habit_counter_max
         )
 
 
+class HabitRepository:
+    """
+    Loads the current user's habits from the database as Habit objects, with their
+    current streaks from habit_streak. The objects are built from the query results without
+    any further database access; the log of a habit is only read when its habit_log
+    attribute is used.
+    """
+
+    _SELECT = """
+              SELECT habit_info.habit_ID,
+                     habit_info.habit_name,
+                     habit_info.habit_description,
+                     habit_info.habit_time_period,
+                     habit_info.habit_date_created,
+                     COALESCE(habit_streak.habit_counter, 0),
+                     COALESCE(habit_streak.habit_counter_max, 0),
+                     EXISTS (SELECT 1 FROM habit_log
+                             WHERE habit_log.habit_ID = habit_info.habit_ID
+                             AND habit_log.habit_date_created = ?
+                             AND habit_log.habit_completed)
+              FROM habit_info
+              LEFT JOIN habit_streak ON habit_streak.habit_ID = habit_info.habit_ID
+              WHERE habit_info.user_ID IS ?
+              """
+
+    def _query(self, where="", parameters=()):
+        """
+            Run the habit query with an optional additional condition.
+        :return: sqlite3.Cursor
+        """
+        cursor = db.get_connection().cursor()
+        cursor.execute(self._SELECT + where + " ORDER BY habit_info.habit_ID",
+                       (date.today().isoformat(), db.current_user()) + tuple(parameters))
+        return cursor
 
+    def get(self, habit_ID):
+        """
+            Load a single habit.
+        :param habit_ID: ID of the habit.
+        :return: Habit, or None if there is no habit with this ID.
+        """
+        row = self._query(" AND habit_info.habit_ID = ?", (habit_ID,)).fetchone()
+        return Habit.from_row(row) if row else None
+
+    def all(self):
+        """
+            Load all habits.
+        :return: list[Habit]
+        """
+        return list(self.iter_all())
+
+    def by_period(self, time_period):
+        """
+            Load all habits of one time period.
+        :param time_period: Periodicity of the habits, e.g. 'd', 'w' or '3/w'.
+        :return: list[Habit]
+        """
+        cursor = self._query(" AND habit_info.habit_time_period = ?", (periods.normalize(time_period),))
+        return [Habit.from_row(row) for row in cursor]
+
+    def iter_all(self):
+        """
+            Stream all habits one by one, without holding them all in memory.
+        :return: generator of Habit
+        """
+        for row in self._query():
+            yield Habit.from_row(row)
@@ -0,0 +1,178 @@
+# LOADTEST.PY
+"""The loadtest.py-file measures the JSON API of server.py under load. A number of
+clients send requests over keep-alive connections at the same time, each waiting for
+its response before sending the next request, and the latencies of all requests are
+collected. The result is printed as requests per second and the p50 and p99 latency.
+Without --url a server with a fresh database is started for the test and stopped
+afterwards:
+    python loadtest.py --connections 32 --requests 5000
+    python loadtest.py --url http://127.0.0.1:8080 --mix write --json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlsplit
+
+# share of requests that write, per --mix
+WRITE_SHARE = {"read": 0.0, "mixed": 0.2, "write": 1.0}
+
+
+async def _request(reader, writer, method, path, body=None, user_ID=None):
+    """
+        Sends one request over an open connection and reads the response.
+    :return: tuple: (status, parsed JSON body)
+    """
+    payload = json.dumps(body).encode("utf-8") if body is not None else b""
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(payload)}\r\n"
+    if user_ID is not None:
+        head += f"X-User: {user_ID}\r\n"
+    writer.write(head.encode("latin-1") + b"\r\n" + payload)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length)) if length else None
+
+
+def percentile(values, percent):
+    """
+        Returns the value below which percent percent of the sorted values lie.
+    :param values: Sorted list of numbers.
+    :return: float
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+
+async def _client(host, port, habit_ids, requests, write_share, seed, latencies, errors):
+    """
+        One client: a keep-alive connection sending requests one after the other.
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(requests):
+            habit_ID = rng.choice(habit_ids)
+            if rng.random() < write_share:
+                day = date.today() - timedelta(days=rng.randrange(3650))
+                request = ("POST", f"/habits/{habit_ID}/checkoff", {"date": day.isoformat()})
+            else:
+                request = rng.choice([("GET", "/habits", None), ("GET", f"/habits/{habit_ID}", None),
+                                      ("GET", f"/habits/{habit_ID}/rates?bucket=m", None)])
+            start = time.perf_counter()
+            status, _ = await _request(reader, writer, *request)
+            latencies.append(time.perf_counter() - start)
+            if status >= 400:
+                errors.append(status)
+    finally:
+        writer.close()
+
+
+async def run_load(host, port, connections, requests, write_share, habits=20):
+    """
+        Creates some habits and sends requests from all clients at the same time.
+    :param connections: Number of concurrent clients.
+    :param requests: Number of requests in total.
+    :param write_share: Share of check-off requests, the others only read.
+    :param habits: Number of habits created before the test.
+    :return: dict: requests, errors, seconds, requests_per_second, p50_ms, p99_ms
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    habit_ids = []
+    for i in range(habits):
+        _, habit = await _request(reader, writer, "POST", "/habits",
+                                  {"name": f"Load test {i}", "period": "d" if i % 3 else "w"})
+        habit_ids.append(habit["habit_ID"])
+    writer.close()
+
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, habit_ids, requests // connections + (i < requests % connections),
+                                   write_share, i, latencies, errors)
+                           for i in range(connections)))
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {"requests": len(latencies), "errors": len(errors), "seconds": round(seconds, 3),
+            "requests_per_second": round(len(latencies) / seconds, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3)}
+
+
+def start_server(db_name, workers, write_queue=False):
+    """
+        Starts server.py on a free port with a database of its own.
+    :return: tuple: (subprocess.Popen, port)
+    """
+    command = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py"),
+               "--port", "0", "--db", db_name, "--workers", str(workers)]
+    if write_queue:
+        command.append("--write-queue")
+    process = subprocess.Popen(command, stderr=subprocess.PIPE, text=True)
+    # the server announces its address on stderr: "Serving habits on http://host:port"
+    line = process.stderr.readline()
+    if "http://" not in line:
+        process.kill()
+        raise SystemExit(f"The server did not start: {line}")
+    return process, int(line.rsplit(":", 1)[1])
+
+
+def main(argv=None):
+    """
+        Runs the load test and prints the results.
+    :return: int: exit code, 1 if any request failed
+    """
+    parser = argparse.ArgumentParser(description="Load test for the habit tracker API.")
+    parser.add_argument("--url", help="URL of a running server (default: start one with a temporary database)")
+    parser.add_argument("--connections", type=int, default=16, help="concurrent clients (default: 16)")
+    parser.add_argument("--requests", type=int, default=2000, help="requests in total (default: 2000)")
+    parser.add_argument("--mix", choices=sorted(WRITE_SHARE), default="mixed",
+                        help="read only, 20%% check-offs or only check-offs (default: mixed)")
+    parser.add_argument("--workers", type=int, default=8, help="database threads of a started server")
+    parser.add_argument("--write-queue", action="store_true", help="start the server with --write-queue")
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    args = parser.parse_args(argv)
+
+    process = None
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            url = urlsplit(args.url)
+            host, port = url.hostname, url.port or 80
+        else:
+            process, port = start_server(os.path.join(directory, "loadtest.db"), args.workers,
+                                         args.write_queue)
+            host = "127.0.0.1"
+        try:
+            result = asyncio.run(run_load(host, port, args.connections, args.requests, WRITE_SHARE[args.mix]))
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+
+    if args.json:
+        print(json.dumps(result))
+    else:
+        print(f"{result['requests']} requests in {result['seconds']} s with {args.connections} connections: "
+              f"{result['requests_per_second']} requests/s, p50 {result['p50_ms']} ms, "
+              f"p99 {result['p99_ms']} ms, {result['errors']} errors")
+    return 1 if result["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
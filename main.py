@@ -13,16 +13,89 @@ the main.py file using getter functions. They can also create new objects via th
 habits.py file and analyze habit data using the functions in the analyze.py file.
 When interacting with the CLI, the main.py-file will provide written instructions and
 appropriate feedback to the user.
+For scripts and cron jobs every operation is also available as a subcommand that skips
+the menu and prints machine-readable output, e.g.
+    python main.py checkoff --id 3 --date 2025-07-01
+    python main.py list --period d --json
+    python main.py create --name Gym --period 3/w
+    python main.py analyze --longest
+    python main.py top --by rate --bucket m --limit 5
+    python main.py import habits.jsonl
+Run 'python main.py --help' for the full list. With --user the app serves one of many
+users, whose habits can be spread over several files with --shards.
+Set the environment variable HABIT_PROFILE to profile the database work of a run,
+see profiling.py.
 """
 
-import questionary
+import argparse
+import json
+import os
+import sys
+from collections.abc import Iterator
+from contextlib import redirect_stdout
+from datetime import date
 import db
 import analyze
+import bitmap
+import periods
 #import habit
 from habit import Habit
 
+# questionary is only imported once the interactive menu is started, see run_interactive()
+questionary = None
 
-def main_menu():
+
+class Session:
+    """
+    The state of one interactive session. It caches the habit list and the streak rows
+    shown by the menu, so moving between menu points does not query the database again.
+    Every action that changes data calls invalidate(), after which the next menu point
+    reloads them. All queries of a session share the connection of db.get_database().
+
+    Attributes:
+        queries (int): Number of times data was loaded from the database.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self._habits = None
+        self._streaks = None
+
+    def habits(self):
+        """
+        Return all habits as (habit_ID, habit_name) tuples.
+        :return: list[tuple]
+        """
+        if self._habits is None:
+            self._habits = db.get_all_habits()
+            self.queries += 1
+        return self._habits
+
+    def habit_streaks(self, habit_ID=None, time_period=None):
+        """
+        Return the rows of analyze.get_habit_streaks(), filtered by habit ID or time period.
+        :return: list[tuple]
+        """
+        if self._streaks is None:
+            self._streaks = analyze.get_habit_streaks()
+            self.queries += 1
+        if habit_ID is not None:
+            return [record for record in self._streaks if record.habit_ID == habit_ID]
+        if periods.is_valid(time_period):
+            time_period = periods.normalize(time_period)
+            return [record for record in self._streaks if record.habit_time_period == time_period]
+        return self._streaks
+
+    def invalidate(self):
+        """
+        Forget the cached data after the database was changed.
+        :return:
+        """
+        self._habits = None
+        self._streaks = None
+
+
+def main_menu(session=None):
     """
     Display the main menu to the user using a CLI interface powered by questionary.
     This function acts as the main navigation hub for the user, allowing them to:
@@ -34,161 +107,194 @@ def main_menu():
     - Exit the program
 
     After performing any action, the user is returned to the main menu unless they choose to exit.
+    :param session: Session whose cached data is used, a new one if not provided.
     :return:
     """
+    if session is None:
+        session = Session()
     print("Hi there, welcome to your personal habit tracking app!")
-    choice = questionary.select(
-        "Choose an action:",
-        choices=[
-            "Check off habit for today",
-            "Create new habit",
-            "Edit existing habit",
-            "Delete existing habit",
-            "View current habits",
-            "Analyze current habits",
-            "Exit the program"
-        ]
-    ).ask()
 
-    if choice == "Check off habit for today":
-        check_off_habit()
-        main_menu()
-    elif choice == "Create new habit":
-        add_new_habit()
-        main_menu()
-    elif choice == "Edit existing habit":
-        edit_existing_habit()
-        main_menu()
-    elif choice == "Delete existing habit":
-        delete_existing_habit()
-        main_menu()
-    elif choice == "View current habits":
-        second_choice = questionary.select(
-            "Which habits & streaks do you want to display?",
-            choices=[
-                "Show me all habits",
-                "Show me only the daily habits",
-                "Show me only the weekly habits",
-                "Go back to main menu"
-            ]
-        ).ask()
-        if second_choice == "Show me all habits":
-            analyze.view_habits_by_time_period()
-            main_menu()
-        elif second_choice == "Show me only the daily habits":
-            analyze.view_habits_by_time_period("d")
-            main_menu()
-        elif second_choice == "Show me only the weekly habits":
-            analyze.view_habits_by_time_period("w")
-            main_menu()
-        elif second_choice == "Go back to main menu":
-            main_menu()
-    elif choice == "Analyze current habits":
-        second_choice = questionary.select(
-            "Choose option",
+    while True:
+        choice = questionary.select(
+            "Choose an action:",
             choices=[
-                "Analyze current longest streak for all habits per time period",
-                "Analyze longest streak for a chosen habit",
-                "Go back to main menu"
+                "Check off habit for today",
+                "Create new habit",
+                "Edit existing habit",
+                "Delete existing habit",
+                "View current habits",
+                "Analyze current habits",
+                "Exit the program"
             ]
         ).ask()
-        if second_choice == "Analyze current longest " \
-                            "streak for all habits per time period":
-            analyze.analyze_current_streak_max(time_period="d")
-            analyze.analyze_current_streak_max(time_period="w")
-            main_menu()
-        elif second_choice == "Analyze longest streak for a chosen habit":
-            try:
-                habits = db.get_all_habits()
-            except ValueError:
-                print("\nThere are no habits in the database yet.\n"
-                      " Please add a habit first.\n")
-
-                # get the name and ID of habit
-            choices = [f"{habit[0]}: {habit[1]}" for habit in habits]  # habit[0] = ID, habit[1] = name
-
-            choice = questionary.select("Choose the habit you want to analyze: ", choices=choices).ask()
-            if not choice:
-                return
-            habit_ID = int(choice.split(":")[0])
-
-            # function
-            analyze.analyze_current_streak_max(habit_ID=habit_ID)
-            main_menu()
-        elif second_choice == "Go back to main menu":
-            main_menu()
-    elif choice == "Exit the program":
-        print("Have a nice day, see u tomorrow!")
-        exit()
-
-
-
-def check_off_habit():
+
+        if choice == "Check off habit for today":
+            check_off_habit(session)
+        elif choice == "Create new habit":
+            add_new_habit(session)
+        elif choice == "Edit existing habit":
+            edit_existing_habit(session)
+        elif choice == "Delete existing habit":
+            delete_existing_habit(session)
+        elif choice == "View current habits":
+            second_choice = questionary.select(
+                "Which habits & streaks do you want to display?",
+                choices=[
+                    "Show me all habits",
+                    "Show me only the daily habits",
+                    "Show me only the weekly habits",
+                    "Show me the habits of another periodicity",
+                    "Show me the history of a habit",
+                    "Go back to main menu"
+                ]
+            ).ask()
+            if second_choice == "Show me all habits":
+                analyze.view_habits_by_time_period(rows=session.habit_streaks())
+            elif second_choice == "Show me only the daily habits":
+                analyze.view_habits_by_time_period("d", rows=session.habit_streaks(time_period="d"))
+            elif second_choice == "Show me only the weekly habits":
+                analyze.view_habits_by_time_period("w", rows=session.habit_streaks(time_period="w"))
+            elif second_choice == "Show me the habits of another periodicity":
+                time_period = ask_time_period()
+                if time_period:
+                    analyze.view_habits_by_time_period(time_period,
+                                                       rows=session.habit_streaks(time_period=time_period))
+            elif second_choice == "Show me the history of a habit":
+                habit = choose_habit(session, "Choose the habit you want to view: ")
+                if habit:
+                    analyze.view_habit_history(habit[0])
+        elif choice == "Analyze current habits":
+            second_choice = questionary.select(
+                "Choose option",
+                choices=[
+                    "Analyze current longest streak for all habits per time period",
+                    "Analyze longest streak for a chosen habit",
+                    "Analyze monthly completion rates for a chosen habit",
+                    "Show the top 10 habits",
+                    "Go back to main menu"
+                ]
+            ).ask()
+            if second_choice == "Analyze current longest " \
+                                "streak for all habits per time period":
+                # the first rank of the leaderboard, all habits if they share it
+                analyze.view_leaderboard(analyze.get_streak_leaders("d"), "Longest streak of the daily habits")
+                analyze.view_leaderboard(analyze.get_streak_leaders("w"), "Longest streak of the weekly habits")
+                others = {record.habit_time_period for record in session.habit_streaks()} - {"d", "w"}
+                for time_period in sorted(others):
+                    analyze.view_leaderboard(analyze.get_streak_leaders(time_period),
+                                             f"Longest streak of the habits done "
+                                             f"{periods.describe(time_period).lower()}")
+            elif second_choice == "Show the top 10 habits":
+                analyze.view_leaderboard(analyze.get_streak_leaderboard("current"), "Top 10 by current streak")
+                analyze.view_leaderboard(analyze.get_streak_leaderboard("longest"), "Top 10 by longest streak")
+                analyze.view_leaderboard(analyze.get_completion_leaderboard("w"),
+                                         f"Top 10 by completion rate, week of {analyze.last_finished_period('w')}",
+                                         "{:.0%}")
+            elif second_choice == "Analyze longest streak for a chosen habit":
+                habit = choose_habit(session, "Choose the habit you want to analyze: ")
+                if habit:
+                    habit_ID, _ = habit
+                    analyze.analyze_current_streak_max(habit_ID=habit_ID,
+                                                       rows=session.habit_streaks(habit_ID=habit_ID))
+            elif second_choice == "Analyze monthly completion rates for a chosen habit":
+                habit = choose_habit(session, "Choose the habit you want to analyze: ")
+                if habit:
+                    habit_ID, _ = habit
+                    analyze.view_completion_rates(habit_ID, bucket="m")
+        else:
+            # "Exit the program", or the prompt was cancelled with Ctrl+C
+            print("Have a nice day, see u tomorrow!")
+            return
+
+
+def choose_habit(session, message):
     """
-    Allow the user to check off a habit for today's completion.
-    :return:
+    Let the user select one of the existing habits.
+    :param session: Session holding the habit list.
+    :param message: Question shown above the list.
+    :return: tuple: (habit_ID, habit_name), or None if there are no habits or nothing was chosen.
     """
-    # check if there are habits in the database
-    try:
-        habits = db.get_all_habits()
-    except ValueError:
+    habits = session.habits()
+    if not habits:
         print("\nThere are no habits in the database yet.\n"
               " Please add a habit first.\n")
+        return None
 
     # get the name and ID of habit
     choices = [f"{habit[0]}: {habit[1]}" for habit in habits]  # habit[0] = ID, habit[1] = name
-
-    choice = questionary.select("Choose the habit you want to check off: ", choices=choices).ask()
+    choice = questionary.select(message, choices=choices).ask()
     if not choice:
-        return
-    habit_ID = int(choice.split(":")[0])
-    habit_name = choice.split(":")[1].strip()
+        return None
+    habit_ID, habit_name = choice.split(":", 1)
+    return int(habit_ID), habit_name.strip()
 
-    # checking off the habit in the db
-    db.check_off_habit_in_db(habit_ID)
 
-    # update streak information in the db
-    db.update_streak_in_db(habit_ID)
+def check_off_habit(session):
+    """
+    Allow the user to check off a habit for today's completion.
+    :param session: Session of the main menu.
+    :return:
+    """
+    habit = choose_habit(session, "Choose the habit you want to check off: ")
+    if not habit:
+        return
+    habit_ID, habit_name = habit
 
-    # User feedback
-    print(f"Habit '{habit_name}' has been checked off for today!")
+    # log the completion, the streak is updated in the same transaction
+    checked_off = db.check_off_habit_in_db(habit_ID)
 
+    # User feedback
+    if checked_off:
+        session.invalidate()
+        print(f"Habit '{habit_name}' has been checked off for today!")
+    else:
+        print(f"Habit '{habit_name}' was already checked off today.")
 
 
-def add_new_habit():
+def add_new_habit(session):
     """
     Create a new habit entry through user input.
-
+    :param session: Session of the main menu.
     :return:
     """
     name = questionary.text("Enter the name of the new habit: ").ask()
     description = questionary.text("Enter the description of the new habit: ").ask()
     time_period = questionary.select("""How often do you want to repeat this habit? \n
-            Enter "d" for a daily habit and "w" for a weekly habit.""", choices=["d", "w"]).ask()
+            Enter "d" for a daily habit, "w" for a weekly habit, "m" for a monthly habit
+            or "other" for e.g. every 3 days or 3 times per week.""",
+                                     choices=["d", "w", "m", "other"]).ask()
+    if time_period == "other":
+        time_period = ask_time_period()
+    if name is None or description is None or time_period is None:
+        return
 
+    # creating the Habit already stores it in the database
     habit = Habit(name=name, description=description, time_period=time_period)
-    habit.add_habit_object(name=name, description=description, time_period=time_period)
+    session.invalidate()
     print(f"Habit {habit} successfully created!")
 
 
-def edit_existing_habit():
+def ask_time_period():
     """
-    Allow the user to edit the name and description of an existing habit.
+    Let the user enter a periodicity of periods.py, e.g. '3d' or '3/w'.
+    :return: str, or None if the prompt was cancelled.
+    """
+    return questionary.text("Enter the periodicity, e.g. 3d for every 3 days, 2w for every other week, "
+                            "3/w for 3 times per week or 10/m for 10 times per month: ",
+                            validate=lambda text: periods.is_valid(text)
+                            or "Use a number of days, weeks or months, e.g. 3d, 2w, 3/w or 10/m").ask()
 
+
+def edit_existing_habit(session):
+    """
+    Allow the user to edit the name and description of an existing habit.
+    :param session: Session of the main menu.
     :return:
     """
-    try:
-        habits = db.get_all_habits()
-        if not habits:
-            print("There are no habits in the database yet.")
-            return
-    except Exception as e:
-        print("Failed to retrieve habits from the database:", e)
+    habit = choose_habit(session, "Select a habit to edit:")
+    if not habit:
         return
-    choices = [f"{habit[0]}: {habit[1]}" for habit in habits]  # habit[0] = ID, habit[1] = name
-    choice = questionary.select("Select a habit to edit:", choices=choices).ask()
-    habit_ID = int(choice.split(":")[0])
-    old_habit_name = choice.split(":")[1].strip()
+    habit_ID, old_habit_name = habit
 
     # new information
     new_habit_name = questionary.text("Enter the new name of the existing habit: ").ask()
@@ -202,46 +308,384 @@ def edit_existing_habit():
 
     if confirm:
         db.update_habit_info(habit_ID, new_habit_name, new_habit_description)
+        session.invalidate()
         print("Habit successfully updated.")
     else:
         print("Update cancelled.")
 
 
-def delete_existing_habit():
+def delete_existing_habit(session):
     """
     Allow the user to delete an existing habit from the database.
+    :param session: Session of the main menu.
     :return:
     """
-    try:
-        habits = db.get_all_habits()
-        if not habits:
-            print("There are no habits in the database yet.")
-            return
-    except Exception as e:
-        print("Failed to retrieve habits from the database:", e)
+    habit = choose_habit(session, "Select a habit to delete:")
+    if not habit:
         return
-
-    choices = [f"{habit[0]}: {habit[1]}" for habit in habits]  # habit[0] = ID, habit[1] = name
-    choice = questionary.select("Select a habit to delete:", choices=choices).ask()
-    habit_ID = int(choice.split(":")[0])
-    habit_name = choice.split(":")[1].strip()
+    habit_ID, habit_name = habit
 
     confirm = questionary.confirm(
         f"Are you sure u want to delete the habit '{habit_name}' (ID: {habit_ID})?"
     ).ask()
     if confirm:
         db.delete_habit_from_db(habit_ID)
+        session.invalidate()
         print(f"Habit '{habit_name}' (ID: {habit_ID}) has been successfully deleted.")
     else:
         print("Deletion cancelled.")
 
 
-if __name__ == "__main__":
+# batch mode: one subcommand per operation, without questionary prompts
+
+def batch_checkoff(args):
     """
-    Entry point for the habit tracking application.
+    Check off a habit for today or a given date.
+    :return: dict
+    """
+    _require_habit(args.habit_ID)
+    habit_date = args.date or date.today()
+    checked_off = db.check_off_many([(args.habit_ID, habit_date)])
+    return {"habit_ID": args.habit_ID, "date": habit_date.isoformat(), "checked_off": checked_off == 1}
+
+
+def batch_create(args):
+    """
+    Create a new habit.
+    :return: dict
+    """
+    habit = Habit(name=args.name, description=args.description, time_period=args.period)
+    return {"habit_ID": habit.habit_ID, "habit_name": habit.habit_name,
+            "habit_time_period": habit.habit_time_period}
+
+
+def batch_edit(args):
+    """
+    Change the name and description of a habit.
+    :return: dict
+    """
+    _require_habit(args.habit_ID)
+    db.update_habit_info(args.habit_ID, args.name, args.description)
+    return {"habit_ID": args.habit_ID, "habit_name": args.name, "habit_description": args.description}
+
+
+def batch_delete(args):
+    """
+    Delete a habit and all its data.
+    :return: dict
+    """
+    _require_habit(args.habit_ID)
+    db.delete_habit_from_db(args.habit_ID)
+    return {"habit_ID": args.habit_ID, "deleted": True}
+
+
+def batch_list(args):
+    """
+    List the habits and their current streaks, streamed from the cursor.
+    :return: Iterator[dict]
+    """
+    return ({"habit_ID": record.habit_ID, "habit_name": record.habit_name,
+             "habit_time_period": record.habit_time_period, "habit_counter": record.habit_counter}
+            for record in analyze.iter_habit_streaks(time_period=args.period))
+
+
+def batch_analyze(args):
+    """
+    List the current and longest streaks, optionally only the habits with the longest streak.
+    :return: list[dict]
+    """
+    if args.longest and args.habit_ID is None:
+        records = analyze.get_longest_streaks(args.period)
+    else:
+        records = analyze.get_habit_streaks(args.habit_ID, args.period)
+    return [record._asdict() for record in records]
+
+
+def batch_import(args):
+    """
+    Import habits from a CSV or JSONL file.
+    :return: dict
+    """
+    import transfer
+
+    return {"file": args.file, "rows": transfer.import_habits(args.file, args.format)}
+
+
+def batch_export(args):
+    """
+    Export all habits to a CSV or JSONL file.
+    :return: dict
+    """
+    import transfer
+
+    return {"file": args.file, "rows": transfer.export_habits(args.file, args.format)}
+
+
+def batch_recompute(args):
+    """
+    Recompute all streaks from the complete log, in parallel with --workers.
+    :return: dict
+    """
+    return {"habits": db.recompute_streaks(workers=args.workers)}
+
+
+def batch_rates(args):
+    """
+    List the completion rates of a habit per day, week or month.
+    :return: Iterator[dict]
+    """
+    _require_habit(args.habit_ID)
+    return ({"period_start": record.period_start, "completed": record.completed,
+             "expected": record.expected, "rate": round(record.rate, 4)}
+            for record in analyze.iter_completion_rates(args.habit_ID, args.bucket))
+
+
+def batch_trend(args):
+    """
+    Compare the last completion rates of a habit with the ones before, and show its
+    best and worst period.
+    :return: dict
+    """
+    _require_habit(args.habit_ID)
+    trend = analyze.get_completion_trend(args.habit_ID, args.bucket, args.periods)
+    trend = trend or analyze.CompletionTrend(None, None, None)
+    empty = analyze.PeriodRate(None, None)
+    best, worst = analyze.get_best_and_worst_period(args.habit_ID, args.bucket) or (empty, empty)
+    return {"habit_ID": args.habit_ID, "recent_rate": trend.recent, "previous_rate": trend.previous,
+            "change": trend.change, "best_period": best.period_start, "best_rate": best.rate,
+            "worst_period": worst.period_start, "worst_rate": worst.rate}
+
+
+def batch_history(args):
+    """
+    Show the completions of a habit in a year as heatmap.
+    :return: str, or dict with --json
+    """
+    _require_habit(args.habit_ID)
+    habit_bitmap = db.get_habit_bitmap(args.habit_ID) or bitmap.Bitmap(date.today().toordinal(), 0)
+    year = args.year or date.today().year
+    if not args.json:
+        return analyze.render_heatmap(habit_bitmap, year)
+    days = (date.fromordinal(day) for day in bitmap.completion_days(habit_bitmap))
+    return {"habit_ID": args.habit_ID, "year": year,
+            "completed": [day.isoformat() for day in days if day.year == year]}
+
+
+def batch_top(args):
+    """
+    Rank the habits by current streak, longest streak or completion rate.
+    :return: list[dict]
+    """
+    if args.by == "rate":
+        entries = analyze.get_completion_leaderboard(args.bucket, args.date, args.limit)
+    else:
+        entries = analyze.get_streak_leaderboard(args.by, args.period, args.limit)
+    return [entry._asdict() for entry in entries]
+
+
+def batch_summary(args):
+    """
+    Add up the habits of all users, reading the shards in parallel.
+    :return: dict
+    """
+    return analyze.get_cross_user_summary(args.workers)
+
 
-    This block ensures the database is initialized (tables are created if they don't exist)
-    and starts the main menu for user interaction.
+def batch_rollup(args):
     """
+    Rebuild the completion rollup of all habits from the complete log.
+    :return: dict
+    """
+    return {"habits": db.rebuild_rollup()}
+
+
+def _require_habit(habit_ID):
+    """
+    Stop with an error message if there is no habit with the given ID.
+    """
+    if not analyze.get_habit_streaks(habit_ID):
+        raise SystemExit(f"There is no habit with the ID {habit_ID}.")
+
+
+def _time_period(value):
+    """
+    Argument type of --period: a periodicity of periods.py in the spelling stored in the database.
+    :return: str
+    """
+    try:
+        return periods.normalize(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e)) from None
+
+
+def build_parser():
+    """
+    Build the command line parser with one subcommand per batch operation.
+    :return: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(
+        description="Habit tracker. Without a command the interactive menu is started.")
+    parser.add_argument("--db", default="main.db", help="SQLite database file (default: main.db)")
+    parser.add_argument("--user", help="ID of the user whose habits are used")
+    parser.add_argument("--shards", metavar="DIRECTORY",
+                        help="keep every user's habits in one of several database files in this "
+                             "directory, selected by a hash of the user ID")
+    parser.add_argument("--shard-count", type=int, default=16,
+                        help="number of shard files (default: 16), must not change later")
+    output = argparse.ArgumentParser(add_help=False)
+    output.add_argument("--json", action="store_true", help="print the result as JSON")
+    commands = parser.add_subparsers(dest="command", metavar="command")
+
+    command = commands.add_parser("checkoff", parents=[output], help="check off a habit")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.add_argument("--date", type=date.fromisoformat,
+                         help="date of the completion as YYYY-MM-DD (default: today)")
+    command.set_defaults(handler=batch_checkoff)
+
+    command = commands.add_parser("create", parents=[output], help="create a new habit")
+    command.add_argument("--name", required=True)
+    command.add_argument("--description", default="")
+    command.add_argument("--period", type=_time_period, required=True,
+                         help="d, w, m, every N days/weeks/months (e.g. 3d) or N times per period (e.g. 3/w)")
+    command.set_defaults(handler=batch_create)
+
+    command = commands.add_parser("edit", parents=[output], help="edit name and description of a habit")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.add_argument("--name", required=True)
+    command.add_argument("--description", required=True)
+    command.set_defaults(handler=batch_edit)
+
+    command = commands.add_parser("delete", parents=[output], help="delete a habit")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.set_defaults(handler=batch_delete)
+
+    command = commands.add_parser("list", parents=[output], help="list habits and current streaks")
+    command.add_argument("--period", type=_time_period, help="only habits of this periodicity, e.g. d, w or 3/w")
+    command.set_defaults(handler=batch_list)
+
+    command = commands.add_parser("analyze", parents=[output], help="show current and longest streaks")
+    command.add_argument("--id", type=int, dest="habit_ID")
+    command.add_argument("--period", type=_time_period, help="only habits of this periodicity, e.g. d, w or 3/w")
+    command.add_argument("--longest", action="store_true",
+                         help="only show the habits with the longest streak")
+    command.set_defaults(handler=batch_analyze)
+
+    for name, handler, text in (("import", batch_import, "import habits from a file"),
+                                ("export", batch_export, "export all habits to a file")):
+        command = commands.add_parser(name, parents=[output], help=text)
+        command.add_argument("file", help="CSV or JSONL file")
+        command.add_argument("--format", choices=["csv", "jsonl"],
+                             help="file format (default: taken from the file extension)")
+        command.set_defaults(handler=handler)
+
+    command = commands.add_parser("recompute", parents=[output], help="recompute all streaks from the log")
+    command.add_argument("--workers", type=int, default=1,
+                         help="number of processes computing the streaks (default: 1)")
+    command.set_defaults(handler=batch_recompute)
+
+    command = commands.add_parser("rates", parents=[output], help="show the completion rate per period")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.add_argument("--bucket", choices=["d", "w", "m"], default="w",
+                         help="day, ISO week or month (default: w)")
+    command.set_defaults(handler=batch_rates)
+
+    command = commands.add_parser("trend", parents=[output],
+                                  help="show the completion trend and best and worst period")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.add_argument("--bucket", choices=["d", "w", "m"], default="w",
+                         help="day, ISO week or month (default: w)")
+    command.add_argument("--periods", type=int, default=4,
+                         help="number of periods compared for the trend (default: 4)")
+    command.set_defaults(handler=batch_trend)
+
+    command = commands.add_parser("history", parents=[output], help="show the completions of a year")
+    command.add_argument("--id", type=int, required=True, dest="habit_ID")
+    command.add_argument("--year", type=int, help="year to show (default: the current year)")
+    command.set_defaults(handler=batch_history)
+
+    command = commands.add_parser("top", parents=[output], help="rank the habits, ties share a rank")
+    command.add_argument("--by", choices=["current", "longest", "rate"], default="longest",
+                         help="current streak, longest streak or completion rate (default: longest)")
+    command.add_argument("--period", type=_time_period, help="only habits of this periodicity (streaks)")
+    command.add_argument("--bucket", choices=["d", "w", "m"], default="w",
+                         help="day, ISO week or month of the rate (default: w)")
+    command.add_argument("--date", type=date.fromisoformat,
+                         help="a day of the period of the rate as YYYY-MM-DD (default: the last finished one)")
+    command.add_argument("--limit", type=int, default=10, help="number of habits (default: 10)")
+    command.set_defaults(handler=batch_top)
+
+    command = commands.add_parser("summary", parents=[output], help="add up the habits of all users")
+    command.add_argument("--workers", type=int, help="number of processes reading the shards")
+    command.set_defaults(handler=batch_summary)
+
+    command = commands.add_parser("rollup", parents=[output],
+                                  help="rebuild the completion rates of all habits from the log")
+    command.set_defaults(handler=batch_rollup)
+    return parser
+
+
+def run_batch(args):
+    """
+    Run a single subcommand. Messages of the db functions go to stderr, so stdout
+    only contains the result: tab separated lines, or JSON with --json.
+    :return: int: exit code
+    """
+    output = sys.stdout
+    with redirect_stdout(sys.stderr):
+        db.initialize_db(verbose=False)
+        result = args.handler(args)
+
+    if isinstance(result, str):
+        print(result, file=output)
+    elif args.json and isinstance(result, Iterator):
+        # a streamed listing is written row by row, in the format of json.dumps()
+        separator = "["
+        for row in result:
+            output.write(separator + json.dumps(row))
+            separator = ", "
+        print("[]" if separator == "[" else "]", file=output)
+    elif args.json:
+        print(json.dumps(result), file=output)
+    else:
+        for row in [result] if isinstance(result, dict) else result:
+            print("\t".join(str(value) for value in row.values()), file=output)
+    return 0
+
+
+def run_interactive():
+    """
+    Start the interactive menu.
+    :return:
+    """
+    global questionary
+    import questionary
+
     db.initialize_db()
     main_menu()
+
+
+def main(argv=None):
+    """
+    Entry point for the habit tracking application.
+
+    The database is initialized (tables are created if they don't exist), then either the
+    given subcommand is run or the main menu is started for user interaction.
+    :return: int: exit code
+    """
+    args = build_parser().parse_args(argv)
+    db.connect(args.db)
+    if args.shards:
+        db.connect_shards(args.shards, args.shard_count)
+    if os.environ.get("HABIT_PROFILE"):
+        import profiling
+
+        profiling.enable_from_env()
+    with db.use_user(args.user):
+        if args.command is None:
+            run_interactive()
+            return 0
+        return run_batch(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,242 @@
+# PERIODS.PY
+"""The periods.py-file defines how often a habit is repeated, its periodicity, which is
+stored as a short string in habit_info.habit_time_period:
+    'd'     daily
+    'w'     weekly, in calendar ISO weeks from Monday to Sunday
+    'm'     monthly, in calendar months
+    '3d'    every 3 days, '2w' every other week, '3m' every quarter, ...
+    '3/w'   3 times per week, '10/m' 10 times per month, ...
+Every periodicity splits the calendar into numbered periods with the bucket function of
+its unit: consecutive periods have consecutive numbers, and a period is met if the
+habit was completed on at least the target number of days in it. A streak is a run of
+met periods, so the completions of a habit are bucketed once, in a single pass, instead
+of comparing the distance between neighbouring completions. Periods of N days or weeks
+are counted from day number 1 (0001-01-01, a Monday) and periods of N months from
+January of year 1, so '7d' is the same as 'w' and '3m' are the calendar quarters.
+All day numbers are those of date.toordinal().
+"""
+
+import re
+from collections import namedtuple
+from datetime import date
+from functools import lru_cache
+
+# unit: 'd', 'w' or 'm'; length: units per period; target: completed days per period
+Periodicity = namedtuple("Periodicity", ["unit", "length", "target"])
+
+# the result of fold(): both streaks, the last completion and the completed days of its period
+Streaks = namedtuple("Streaks", ["current", "longest", "last_day", "completed"])
+
+_PATTERN = re.compile(r"(?:([1-9][0-9]*)/)?([1-9][0-9]*)?([dwm])")
+
+# the fewest days a period of one unit has, a target can not be higher than that
+_UNIT_DAYS = {"d": 1, "w": 7, "m": 28}
+
+_UNIT_NAMES = {"d": ("Daily", "day"), "w": ("Weekly", "week"), "m": ("Monthly", "month")}
+
+DAILY = Periodicity("d", 1, 1)
+
+
+# methods to parse and name periodicities
+
+@lru_cache(maxsize=256)
+def parse(time_period):
+    """
+        Parses the periodicity of a habit.
+    :param time_period: e.g. 'd', 'w', 'm', '3d' or '3/w'; upper case is accepted.
+    :return: Periodicity
+    :raises ValueError: if time_period is no periodicity.
+    """
+    match = _PATTERN.fullmatch(time_period.strip().lower()) if isinstance(time_period, str) else None
+    if match is None:
+        raise ValueError(f"Unknown time period '{time_period}', use e.g. d, w, m, 3d or 3/w")
+    target, length, unit = match.groups()
+    periodicity = Periodicity(unit, int(length or 1), int(target or 1))
+    if periodicity.target > periodicity.length * _UNIT_DAYS[unit]:
+        raise ValueError(f"A period of '{time_period}' has fewer than {periodicity.target} days")
+    return periodicity
+
+
+def is_valid(time_period):
+    """
+        Checks if a string is a periodicity parse() accepts.
+    :return: bool
+    """
+    try:
+        parse(time_period)
+    except ValueError:
+        return False
+    return True
+
+
+def get(time_period):
+    """
+        Returns the Periodicity of a habit, or None if its time period is unknown.
+    :return: Periodicity
+    """
+    try:
+        return parse(time_period)
+    except ValueError:
+        return None
+
+
+def normalize(time_period):
+    """
+        Returns the shortest spelling of a periodicity, the one stored in the database,
+        e.g. 'd' for '1d' or 'D'.
+    :return: str
+    :raises ValueError: if time_period is no periodicity.
+    """
+    unit, length, target = parse(time_period)
+    return (f"{target}/" if target > 1 else "") + (str(length) if length > 1 else "") + unit
+
+
+def describe(time_period):
+    """
+        Returns the name of a periodicity for display, e.g. 'Weekly', 'Every 3 days' or
+        '3 times per week'. Unknown time periods are returned unchanged.
+    :return: str
+    """
+    periodicity = get(time_period)
+    if periodicity is None:
+        return str(time_period)
+    unit, length, target = periodicity
+    adjective, noun = _UNIT_NAMES[unit]
+    if length == 1:
+        return adjective if target == 1 else f"{target} times per {noun}"
+    every = f"every {length} {noun}s"
+    return every.capitalize() if target == 1 else f"{target} times {every}"
+
+
+# bucket functions: the number of the unit containing a day, counted from day number 1
+
+def _day_index(day):
+    return day - 1
+
+
+def _week_index(day):
+    # day number 1 is a Monday, so these are ISO weeks
+    return (day - 1) // 7
+
+
+@lru_cache(maxsize=1 << 16)
+def _month_index(day):
+    first = date.fromordinal(day)
+    return (first.year - 1) * 12 + first.month - 1
+
+
+BUCKETS = {"d": _day_index, "w": _week_index, "m": _month_index}
+
+# the inverse of BUCKETS: the first day of a unit
+UNIT_STARTS = {"d": lambda index: index + 1,
+               "w": lambda index: index * 7 + 1,
+               "m": lambda index: date(index // 12 + 1, index % 12 + 1, 1).toordinal()}
+
+
+def bucket(day, periodicity):
+    """
+        Returns the number of the period containing a day; consecutive periods have
+        consecutive numbers.
+    :param day: Day number of date.toordinal().
+    :param periodicity: Periodicity
+    :return: int
+    """
+    return BUCKETS[periodicity.unit](day) // periodicity.length
+
+
+def period_bounds(period, periodicity):
+    """
+        Returns the first and the last day of a period.
+    :param period: Number of the period, see bucket().
+    :return: tuple: (first day number, last day number)
+    """
+    start = UNIT_STARTS[periodicity.unit]
+    return start(period * periodicity.length), start((period + 1) * periodicity.length) - 1
+
+
+def period_start(day, time_period):
+    """
+        Returns the first day of the period of a habit containing a day, the day itself
+        for unknown time periods.
+    :return: int: Day number
+    """
+    periodicity = get(time_period)
+    if periodicity is None:
+        return day
+    return period_bounds(bucket(day, periodicity), periodicity)[0]
+
+
+def count_periods(first_day, last_day, time_period):
+    """
+        Returns the number of periods of a habit that start between two days.
+    :param first_day: Day number of the first day, inclusive.
+    :param last_day: Day number of the last day, inclusive.
+    :return: int
+    """
+    periodicity = get(time_period) or DAILY
+    first = bucket(first_day, periodicity)
+    if period_bounds(first, periodicity)[0] < first_day:
+        first += 1
+    return max(0, bucket(last_day, periodicity) - first + 1)
+
+
+# methods to derive streaks and due dates from the completions
+
+def fold(days, time_period):
+    """
+        Derives the streaks of a habit in a single pass over its completions: every day
+        is put into its period, a period is met when its completed days reach the target,
+        and consecutive met periods make up a streak. The current streak is the one that
+        ends with the last met period.
+    :param days: Ascending day numbers of all completions, every day once.
+    :param time_period: Periodicity of the habit; with an unknown one no completion
+                        continues a streak.
+    :return: Streaks
+    """
+    periodicity = get(time_period)
+    if periodicity is None:
+        last_day = None
+        for last_day in days:
+            pass
+        streak = 0 if last_day is None else 1
+        return Streaks(streak, streak, last_day, streak)
+
+    index, length, target = BUCKETS[periodicity.unit], periodicity.length, periodicity.target
+    current = longest = completed = 0
+    period = run_end = last_day = None
+    for last_day in days:
+        day_period = index(last_day) // length
+        if day_period != period:
+            period, completed = day_period, 0
+        completed += 1
+        if completed == target:
+            current = current + 1 if run_end == period - 1 else 1
+            run_end = period
+            if current > longest:
+                longest = current
+    return Streaks(current, longest, last_day, completed)
+
+
+def streaks(days, time_period):
+    """
+        Returns the current and the longest streak of a habit, see fold().
+    :return: tuple: (current streak, longest streak)
+    """
+    return fold(days, time_period)[:2]
+
+
+def due_day(last_day, time_period, completed=None):
+    """
+        Returns the last day on which a completion continues the streak after the
+        completion on last_day: the end of the following period, or the end of the period
+        of last_day itself while that period is not met yet.
+    :param last_day: Day number of the last completion.
+    :param time_period: Periodicity of the habit; unknown ones are due the next day.
+    :param completed: Completed days in the period of last_day, the target if not provided.
+    :return: int: Day number
+    """
+    periodicity = get(time_period) or DAILY
+    period = bucket(last_day, periodicity)
+    if completed is None or completed >= periodicity.target:
+        period += 1
+    return period_bounds(period, periodicity)[1]
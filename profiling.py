@@ -0,0 +1,270 @@
+# PROFILING.PY
+"""The profiling.py-file gives visibility into slow database work. When enabled, every
+entry point of db.py and analyze.py is wrapped with a timing wrapper, and every SQL
+statement is recorded through sqlite3's set_trace_callback. Per function it collects
+the number of calls, the wall time, the rows returned, the commits and the SQL
+statements that were run; generators like analyze.iter_habit_streaks() are measured
+while they are consumed, with every item they yield as a row.
+Profiling is off by default and costs nothing then: the functions are only wrapped
+while it is enabled. Enable it with the environment variable HABIT_PROFILE or with
+enable(). At exit a report is written, depending on HABIT_PROFILE:
+    HABIT_PROFILE=1                  summary table on stderr
+    HABIT_PROFILE=profile.json       summary as JSON file
+    HABIT_PROFILE=run.trace.json     Chrome trace file (chrome://tracing, Perfetto)
+"""
+
+import atexit
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+import analyze
+import db
+
+# functions of db.py that only hand out connections, users or SQL snippets, they are not wrapped
+NOT_PROFILED = {"connect", "get_database", "get_connection", "transaction", "ordinal_sql",
+                "bucket_start", "next_due_date", "day_number", "day_string", "week_key",
+                "connect_shards", "get_router", "use_user", "current_user", "generation"}
+
+_profiler = None
+
+
+class Profiler:
+    """
+    Collects the measurements of all wrapped functions and SQL statements.
+
+    Attributes:
+        functions (dict): {function name: dict of calls, seconds, rows, commits, statements}
+        statements (Counter): Number of executions per SQL statement.
+        events (list): Chrome trace events of all calls and statements.
+    """
+
+    def __init__(self):
+        self.functions = {}
+        self.statements = Counter()
+        self.events = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._originals = []
+        self._start = time.perf_counter()
+
+    def _stack(self):
+        """
+            Returns the names of the wrapped functions currently running in this thread.
+        """
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def wrap(self, name, function):
+        """
+            Returns function wrapped with a timing wrapper that records its calls as name.
+        """
+        if inspect.isgeneratorfunction(function):
+            return self._wrap_generator(name, function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            stack = self._stack()
+            stack.append(name)
+            commits = db.get_database().commit_count
+            start = time.perf_counter()
+            try:
+                return_value = function(*args, **kwargs)
+            finally:
+                seconds = time.perf_counter() - start
+                stack.pop()
+            rows = len(return_value) if isinstance(return_value, list) else 0
+            self._record(name, start, seconds, rows, db.get_database().commit_count - commits)
+            return return_value
+        return wrapper
+
+    def _wrap_generator(self, name, function):
+        """
+            Returns a generator function wrapped like wrap(). Creating the generator runs
+            nothing, its SQL runs while it is consumed: every step is timed and counted
+            as name, every item yielded as a row, and the call is recorded once the
+            generator is exhausted or closed.
+        """
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            iterator = function(*args, **kwargs)
+            commits = db.get_database().commit_count
+            first, seconds, rows = None, 0.0, 0
+            try:
+                while True:
+                    stack = self._stack()
+                    stack.append(name)
+                    start = time.perf_counter()
+                    if first is None:
+                        first = start
+                    try:
+                        item = next(iterator)
+                    except StopIteration:
+                        return
+                    finally:
+                        seconds += time.perf_counter() - start
+                        stack.pop()
+                    rows += 1
+                    yield item
+            finally:
+                iterator.close()
+                self._record(name, first, seconds, rows, db.get_database().commit_count - commits)
+        return wrapper
+
+    def _record(self, name, start, seconds, rows, commits):
+        with self._lock:
+            stats = self.functions.setdefault(
+                name, {"calls": 0, "seconds": 0.0, "rows": 0, "commits": 0, "statements": 0})
+            stats["calls"] += 1
+            stats["seconds"] += seconds
+            stats["rows"] += rows
+            stats["commits"] += commits
+            self.events.append({"name": name, "cat": "function", "ph": "X", "pid": os.getpid(),
+                                "tid": threading.get_ident(),
+                                "ts": (start - self._start) * 1e6, "dur": seconds * 1e6})
+
+    def trace_sql(self, statement):
+        """
+            Callback for sqlite3's set_trace_callback, counts the statement for the
+            innermost running function.
+        """
+        statement = " ".join(statement.split())
+        stack = self._stack()
+        with self._lock:
+            self.statements[statement] += 1
+            if stack:
+                self.functions.setdefault(
+                    stack[-1], {"calls": 0, "seconds": 0.0, "rows": 0, "commits": 0, "statements": 0}
+                )["statements"] += 1
+            self.events.append({"name": statement[:80], "cat": "sql", "ph": "i", "s": "t",
+                                "pid": os.getpid(), "tid": threading.get_ident(),
+                                "ts": (time.perf_counter() - self._start) * 1e6,
+                                "args": {"sql": statement}})
+
+    def install(self):
+        """
+            Wraps the entry points of db.py and analyze.py and traces all connections.
+        """
+        for module in (db, analyze):
+            for name, function in inspect.getmembers(module, inspect.isfunction):
+                if function.__module__ != module.__name__ or name.startswith("_") \
+                        or name in NOT_PROFILED:
+                    continue
+                self._originals.append((module, name, function))
+                setattr(module, name, self.wrap(f"{module.__name__}.{name}", function))
+        db.connection_hooks.append(self._trace_connection)
+        self._trace_connection(db.get_connection())
+
+    def uninstall(self):
+        """
+            Restores the original functions and stops tracing SQL statements.
+        """
+        for module, name, function in self._originals:
+            setattr(module, name, function)
+        self._originals = []
+        if self._trace_connection in db.connection_hooks:
+            db.connection_hooks.remove(self._trace_connection)
+        db.get_connection().set_trace_callback(None)
+
+    def _trace_connection(self, conn):
+        conn.set_trace_callback(self.trace_sql)
+
+    def summary(self):
+        """
+            Returns all measurements as a JSON serializable dict.
+        """
+        with self._lock:
+            return {"functions": {name: dict(stats) for name, stats in self.functions.items()},
+                    "statements": dict(self.statements.most_common())}
+
+    def table(self, top_statements=10):
+        """
+            Returns the measurements as a printable table, slowest functions first.
+        """
+        lines = [f"{'function':<40}{'calls':>8}{'total ms':>12}{'mean ms':>10}"
+                 f"{'rows':>9}{'commits':>9}{'sql':>8}"]
+        for name, stats in sorted(self.functions.items(), key=lambda item: -item[1]["seconds"]):
+            mean = stats["seconds"] / stats["calls"] * 1000 if stats["calls"] else 0.0
+            lines.append(f"{name:<40}{stats['calls']:>8}{stats['seconds'] * 1000:>12.3f}{mean:>10.3f}"
+                         f"{stats['rows']:>9}{stats['commits']:>9}{stats['statements']:>8}")
+        lines.append(f"\n{'executions':>10}  SQL statement")
+        for statement, count in self.statements.most_common(top_statements):
+            lines.append(f"{count:>10}  {statement[:100]}")
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+            Returns all calls and statements in the Chrome trace event format.
+        """
+        with self._lock:
+            return {"traceEvents": list(self.events), "displayTimeUnit": "ms"}
+
+
+def enable(output=None):
+    """
+        Starts profiling, if it is not running already.
+    :param output: Where the report is written at exit: None for no report, "1" for a
+                   table on stderr, a path ending in .trace.json for a Chrome trace or
+                   another path for a JSON summary.
+    :return: Profiler
+    """
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+        _profiler.install()
+        if output:
+            atexit.register(write_report, output)
+    return _profiler
+
+
+def enable_from_env():
+    """
+        Starts profiling if the environment variable HABIT_PROFILE is set.
+    :return: Profiler, or None if profiling is off.
+    """
+    output = os.environ.get("HABIT_PROFILE")
+    if output and output != "0":
+        return enable(output)
+    return None
+
+
+def disable():
+    """
+        Stops profiling and restores the original functions.
+    :return: Profiler: The profiler with the measurements collected so far, or None.
+    """
+    global _profiler
+    profiler, _profiler = _profiler, None
+    if profiler is not None:
+        profiler.uninstall()
+    return profiler
+
+
+def get_profiler():
+    """
+        Returns the running profiler, or None if profiling is off.
+    """
+    return _profiler
+
+
+def write_report(output, profiler=None):
+    """
+        Writes the report of a profiler, see enable() for the output values.
+    :return:
+    """
+    profiler = profiler or _profiler
+    if profiler is None:
+        return
+    if output in ("1", "summary"):
+        print(profiler.table(), file=sys.stderr)
+    elif output.endswith(".trace.json"):
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(profiler.chrome_trace(), file)
+    else:
+        with open(output, "w", encoding="utf-8") as file:
+            json.dump(profiler.summary(), file, indent=2)
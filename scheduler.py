@@ -0,0 +1,184 @@
+# SCHEDULER.PY
+"""The scheduler.py-file reminds users of the habits whose streak is about to break.
+Every habit's next due date, the last day on which a completion still continues its
+streak, is kept in habit_streak.habit_next_due by every check-off and streak update
+(see db.next_due_date()). Finding the habits due within the next hours is therefore a
+single range scan over the index habit_streak_next_due, no matter how many habits
+there are or how long their logs are; the log itself is never read.
+A habit is due until the end of its due date, so its deadline is midnight after it.
+The scheduler sweeps all users of the current database, or every shard of
+db.connect_shards(), and emits each reminder once per due date:
+    python scheduler.py --hours 6 --interval 600 [--db main.db] [--shards DIRECTORY]
+"""
+
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import db
+
+# deadline: the first moment the streak is broken, as ISO-8601 date and time
+Reminder = namedtuple("Reminder", ["user_ID", "habit_ID", "habit_name", "habit_time_period",
+                                   "habit_counter", "due_date", "deadline"])
+
+DUE_SQL = """
+          SELECT habit_info.user_ID, habit_info.habit_ID, habit_info.habit_name,
+          habit_info.habit_time_period, habit_streak.habit_counter, habit_streak.habit_next_due
+          FROM habit_streak CROSS JOIN habit_info ON habit_info.habit_ID = habit_streak.habit_ID
+          WHERE habit_streak.habit_next_due BETWEEN ? AND ?
+          ORDER BY habit_streak.habit_next_due
+          """
+
+
+def due_range(hours, now=None):
+    """
+        Returns the due dates whose deadline lies within the next hours. Habits due
+        before today have missed their deadline already and are left out.
+    :param hours: (float) Length of the window.
+    :param now: (datetime.datetime, optional) Start of the window, datetime.now() if not provided.
+    :return: tuple: (first, last) due date as ISO-8601 strings; last is before first if
+                    no deadline falls into the window.
+    """
+    now = now or datetime.now()
+    # the deadline of a due date is midnight after it
+    last = (now + timedelta(hours=hours)).date() - timedelta(days=1)
+    return now.date().isoformat(), last.isoformat()
+
+
+def _due(conn, first, last):
+    """
+        Streams the reminders of one database file.
+    :return: Iterator[Reminder]
+    """
+    cursor = conn.cursor()
+    cursor.execute(DUE_SQL, (first, last))
+    for *row, due_date in cursor:
+        deadline = date.fromisoformat(due_date) + timedelta(days=1)
+        yield Reminder(*row, due_date, datetime.combine(deadline, datetime.min.time()).isoformat())
+
+
+def due_within(hours, now=None):
+    """
+        Yields the habits of all users that have to be completed within the next hours
+        to keep their streak, ordered by due date per database file. With
+        db.connect_shards() every shard is read with a read-only connection of its own.
+    :param hours: (float) Length of the window.
+    :param now: (datetime.datetime, optional) Start of the window, datetime.now() if not provided.
+    :return: Iterator[Reminder]
+    """
+    first, last = due_range(hours, now)
+    if last < first:
+        return
+    router = db.get_router()
+    if router is None:
+        yield from _due(db.get_connection(), first, last)
+        return
+    for path in router.shard_paths():
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            yield from _due(conn, first, last)
+        finally:
+            conn.close()
+
+
+def print_reminder(reminder):
+    """
+        Default output of the scheduler, one line per reminder.
+    :return:
+    """
+    user = f"{reminder.user_ID}: " if reminder.user_ID is not None else ""
+    print(f"{user}[{reminder.habit_ID}] {reminder.habit_name} is due by {reminder.deadline} "
+          f"– current streak: {reminder.habit_counter}", flush=True)
+
+
+class Scheduler:
+    """
+    Sweeps the databases for habits due within a number of hours and hands every
+    reminder to notify once per habit and due date. A check-off moves the due date,
+    so the habit is reminded again before its next deadline.
+
+    Attributes:
+        hours (float): Length of the window swept ahead.
+        notify (function): Called with every new Reminder.
+        sweeps (int): Number of sweeps so far.
+        sent (int): Number of reminders emitted so far.
+    """
+
+    def __init__(self, hours=24, notify=print_reminder):
+        self.hours = hours
+        self.notify = notify
+        self.sweeps = 0
+        self.sent = 0
+        # (user_ID, habit_ID, due_date) of the reminders already emitted
+        self._reminded = set()
+
+    def sweep(self, now=None):
+        """
+            Emits the reminders of all habits that became due within the window.
+        :param now: (datetime.datetime, optional) Time of the sweep, datetime.now() if not provided.
+        :return: int: Number of new reminders.
+        """
+        now = now or datetime.now()
+        today = now.date().isoformat()
+        # reminders of past due dates can never repeat
+        self._reminded = {key for key in self._reminded if key[2] >= today}
+
+        sent = 0
+        for reminder in due_within(self.hours, now):
+            key = (reminder.user_ID, reminder.habit_ID, reminder.due_date)
+            if key in self._reminded:
+                continue
+            self._reminded.add(key)
+            self.notify(reminder)
+            sent += 1
+        self.sweeps += 1
+        self.sent += sent
+        return sent
+
+    def run(self, interval=600, sweeps=None):
+        """
+            Sweeps every interval seconds until interrupted.
+        :param interval: (float) Seconds between the start of two sweeps.
+        :param sweeps: (int, optional) Stop after this many sweeps.
+        :return:
+        """
+        while sweeps is None or self.sweeps < sweeps:
+            start = time.monotonic()
+            self.sweep()
+            if sweeps is not None and self.sweeps >= sweeps:
+                break
+            time.sleep(max(0.0, interval - (time.monotonic() - start)))
+
+
+def main(argv=None):
+    """
+        Entry point: parse the command line and run the scheduler until Ctrl+C.
+    :return: int: exit code
+    """
+    parser = argparse.ArgumentParser(description="Remind users of habits whose streak is about to break.")
+    parser.add_argument("--db", default="main.db", help="SQLite database file (default: main.db)")
+    parser.add_argument("--shards", metavar="DIRECTORY", help="sweep the shard files of this directory")
+    parser.add_argument("--shard-count", type=int, default=16)
+    parser.add_argument("--hours", type=float, default=24, help="remind of deadlines within this many hours")
+    parser.add_argument("--interval", type=float, default=600, help="seconds between two sweeps (default: 600)")
+    parser.add_argument("--once", action="store_true", help="sweep once and exit")
+    parser.add_argument("--json", action="store_true", help="print every reminder as a JSON line")
+    args = parser.parse_args(argv)
+
+    db.connect(args.db)
+    db.initialize_db(verbose=False)
+    if args.shards:
+        db.connect_shards(args.shards, args.shard_count)
+    notify = (lambda reminder: print(json.dumps(reminder._asdict()), flush=True)) if args.json else print_reminder
+    try:
+        Scheduler(args.hours, notify).run(args.interval, sweeps=1 if args.once else None)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
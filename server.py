@@ -0,0 +1,350 @@
+# SERVER.PY
+"""The server.py-file offers the operations of main.py as a JSON API over HTTP, e.g. for
+mobile clients. It is a small HTTP/1.1 server built on asyncio streams: connections are
+kept alive for many requests, and the blocking sqlite3 work of every request runs on a
+bounded pool of worker threads, each holding one connection per database (see
+db.Database). The routes call the same handlers as the subcommands of main.py:
+
+    GET    /habits?period=d              list habits and current streaks
+    POST   /habits                       create {"name", "description", "period"}
+    GET    /habits/<id>                  current and longest streak of a habit
+    PATCH  /habits/<id>                  edit {"name", "description"}
+    DELETE /habits/<id>                  delete a habit
+    POST   /habits/<id>/checkoff         check off {"date": "YYYY-MM-DD"}, default today
+    GET    /habits/<id>/rates?bucket=w   completion rate per day, week or month
+    GET    /habits/<id>/history?year=    completed days of a year
+    GET    /analyze?period=w&longest=1   current and longest streaks
+    GET    /top?by=longest&limit=10      leaderboard by current, longest streak or rate
+    GET    /summary                      habits of all users
+    POST   /batch                        [{"method", "path", "body"}, ...] in one transaction
+
+The header X-User selects the user (see db.use_user()). Start it with
+    python server.py --port 8080 [--db main.db] [--shards DIRECTORY] [--workers 8] [--write-queue]
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+from argparse import Namespace
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from urllib.parse import parse_qsl, urlsplit
+import db
+import main
+import periods
+
+# largest accepted request body, larger requests are answered with 413
+MAX_BODY_SIZE = 1024 * 1024
+
+# seconds an idle keep-alive connection stays open
+KEEP_ALIVE_TIMEOUT = 15
+
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+
+class HTTPError(Exception):
+    """
+    Ends a request with an error status, the message is sent as {"error": message}.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _habit_ID(match):
+    return int(match.group("habit_ID"))
+
+
+def _period(value):
+    if value is None:
+        return None
+    try:
+        return periods.normalize(value)
+    except ValueError as e:
+        raise HTTPError(400, str(e)) from None
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        raise HTTPError(400, f"invalid date '{value}', use YYYY-MM-DD") from None
+
+
+def _choice(query, key, default, choices):
+    value = query.get(key, default)
+    if value not in choices:
+        raise HTTPError(400, f"{key} must be one of {', '.join(choices)}")
+    return value
+
+
+def _text(body, key):
+    value = body.get(key)
+    if not isinstance(value, str) or not value:
+        raise HTTPError(400, f"'{key}' is required")
+    return value
+
+
+# (method, path pattern, status, function building the arguments of a main.py handler, handler)
+ROUTES = [
+    ("GET", r"/habits", 200,
+     lambda match, query, body: Namespace(period=_period(query.get("period"))), main.batch_list),
+    ("POST", r"/habits", 201,
+     lambda match, query, body: Namespace(name=_text(body, "name"), description=body.get("description", ""),
+                                          period=_period(_text(body, "period"))), main.batch_create),
+    ("GET", r"/habits/(?P<habit_ID>\d+)", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match)), lambda args: _get_habit(args)),
+    ("PATCH", r"/habits/(?P<habit_ID>\d+)", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match), name=_text(body, "name"),
+                                          description=body.get("description", "")), main.batch_edit),
+    ("DELETE", r"/habits/(?P<habit_ID>\d+)", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match)), main.batch_delete),
+    ("POST", r"/habits/(?P<habit_ID>\d+)/checkoff", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match), date=_date(body.get("date"))),
+     main.batch_checkoff),
+    ("GET", r"/habits/(?P<habit_ID>\d+)/rates", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match), bucket=query.get("bucket", "w")),
+     main.batch_rates),
+    ("GET", r"/habits/(?P<habit_ID>\d+)/history", 200,
+     lambda match, query, body: Namespace(habit_ID=_habit_ID(match), json=True,
+                                          year=int(query["year"]) if query.get("year", "").isdigit() else None),
+     main.batch_history),
+    ("GET", r"/analyze", 200,
+     lambda match, query, body: Namespace(habit_ID=None, period=_period(query.get("period")),
+                                          longest=query.get("longest") in ("1", "true")), main.batch_analyze),
+    ("GET", r"/top", 200,
+     lambda match, query, body: Namespace(by=_choice(query, "by", "longest", ("current", "longest", "rate")),
+                                          period=_period(query.get("period")),
+                                          bucket=_choice(query, "bucket", "w", ("d", "w", "m")),
+                                          date=_date(query.get("date")),
+                                          limit=int(query["limit"]) if query.get("limit", "").isdigit() else 10),
+     main.batch_top),
+    ("GET", r"/summary", 200, lambda match, query, body: Namespace(workers=None), main.batch_summary),
+]
+ROUTES = [(method, re.compile(pattern + "$"), status, arguments, handler)
+          for method, pattern, status, arguments, handler in ROUTES]
+
+
+def _get_habit(args):
+    """
+    The current and longest streak of one habit.
+    :return: dict
+    """
+    main._require_habit(args.habit_ID)
+    return main.batch_analyze(Namespace(habit_ID=args.habit_ID, period=None, longest=False))[0]
+
+
+def dispatch(method, target, body):
+    """
+        Runs one request on the current thread and database.
+    :param method: HTTP method.
+    :param target: Path with an optional query string.
+    :param body: Parsed JSON body, None if there is none.
+    :return: tuple: (status, result)
+    """
+    url = urlsplit(target)
+    query = dict(parse_qsl(url.query))
+    if method == "POST" and url.path == "/batch":
+        return 200, _dispatch_batch(body)
+
+    allowed = False
+    for route_method, pattern, status, arguments, handler in ROUTES:
+        match = pattern.match(url.path)
+        if match is None:
+            continue
+        allowed = True
+        if route_method == method:
+            if body is not None and not isinstance(body, dict):
+                raise HTTPError(400, "the body must be a JSON object")
+            try:
+                result = handler(arguments(match, query, body or {}))
+                # streamed listings are read completely, before the thread is left
+                return status, list(result) if isinstance(result, Iterator) else result
+            except SystemExit as e:
+                # raised by main._require_habit()
+                raise HTTPError(404, str(e)) from None
+    raise HTTPError(405 if allowed else 404, f"{method} {url.path} is not supported")
+
+
+def _dispatch_batch(requests):
+    """
+        Runs the requests of a batch one after the other in a single transaction, so they
+        cost one thread hop and one commit. A failing request does not stop the others.
+    :return: list[dict]: {"status", "body"} per request
+    """
+    if not isinstance(requests, list):
+        raise HTTPError(400, "the body of /batch must be a JSON list of requests")
+    responses = []
+    with db.transaction():
+        for request in requests:
+            try:
+                if not isinstance(request, dict) or request.get("path") == "/batch":
+                    raise HTTPError(400, "every request needs 'method' and 'path'")
+                status, result = dispatch(str(request.get("method", "GET")).upper(),
+                                          str(request.get("path", "")), request.get("body"))
+            except HTTPError as e:
+                status, result = e.status, {"error": str(e)}
+            responses.append({"status": status, "body": result})
+    return responses
+
+
+def handle(method, target, body, user_ID):
+    """
+        Runs one request for a user, called in a worker thread.
+    :return: tuple: (status, result)
+    """
+    try:
+        with db.use_user(user_ID):
+            return dispatch(method, target, body)
+    except HTTPError as e:
+        return e.status, {"error": str(e)}
+
+
+async def _read_request(reader):
+    """
+        Reads one request from a connection.
+    :return: tuple: (method, target, headers, body bytes), or None if the client closed
+             the connection.
+    """
+    request_line = await reader.readline()
+    if not request_line.strip():
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "malformed request line") from None
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    headers[":version"] = version
+
+    length = int(headers.get("content-length") or 0)
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(413, "request body too large")
+    body = await reader.readexactly(length) if length else b""
+    return method.upper(), target, headers, body
+
+
+def _response(status, result, keep_alive):
+    """
+        Encodes a JSON response.
+    :return: bytes
+    """
+    payload = json.dumps(result).encode("utf-8")
+    return (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n").encode("latin-1") + payload
+
+
+class Server:
+    """
+    The HTTP server with its pool of worker threads.
+
+    Attributes:
+        workers (int): Number of worker threads running database work.
+        requests (int): Number of requests answered so far.
+    """
+
+    def __init__(self, workers=8):
+        self.workers = workers
+        self.requests = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="habit-db")
+
+    async def handle_connection(self, reader, writer):
+        """
+            Answers the requests of one connection until the client closes it, asks for
+            Connection: close or stays idle for KEEP_ALIVE_TIMEOUT seconds.
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await asyncio.wait_for(_read_request(reader), KEEP_ALIVE_TIMEOUT)
+                    if request is None:
+                        break
+                    method, target, headers, body = request
+                    keep_alive = (headers.get("connection", "").lower() != "close"
+                                  and headers[":version"] == "HTTP/1.1")
+                    try:
+                        body = json.loads(body) if body else None
+                    except ValueError:
+                        raise HTTPError(400, "the body is not valid JSON") from None
+                    status, result = await loop.run_in_executor(
+                        self._pool, handle, method, target, body, headers.get("x-user"))
+                except HTTPError as e:
+                    status, result = e.status, {"error": str(e)}
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception as e:
+                    status, result = 500, {"error": str(e)}
+
+                self.requests += 1
+                writer.write(_response(status, result, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8080, ready=None):
+        """
+            Accepts connections until the task is cancelled.
+        :param ready: (asyncio.Event, optional) Set once the server is listening.
+        :return:
+        """
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving habits on http://{host}:{server.sockets[0].getsockname()[1]}", file=sys.stderr)
+        if ready is not None:
+            ready.set()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._pool.shutdown(wait=True)
+
+
+def run(argv=None):
+    """
+        Entry point: parse the command line, open the database and serve until Ctrl+C.
+    :return: int: exit code
+    """
+    parser = argparse.ArgumentParser(description="JSON API for the habit tracker.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--db", default="main.db", help="SQLite database file (default: main.db)")
+    parser.add_argument("--shards", metavar="DIRECTORY", help="keep the users in shard files, see main.py")
+    parser.add_argument("--shard-count", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8, help="number of database threads (default: 8)")
+    parser.add_argument("--write-queue", action="store_true",
+                        help="commit the writes of all workers in groups on one writer thread")
+    args = parser.parse_args(argv)
+
+    db.connect(args.db)
+    db.initialize_db(verbose=False)
+    if args.shards:
+        db.connect_shards(args.shards, args.shard_count)
+    if args.write_queue:
+        db.start_write_queue()
+    try:
+        asyncio.run(Server(args.workers).serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db.stop_write_queue()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -1,7 +1,9 @@
+import os
 from datetime import date, datetime, timedelta
 import pytest
 from habit import Habit
 import db
+import random
 import sqlite3
 
 TEST_DB = "test_database.db"
@@ -13,7 +15,10 @@ def setup_module(module):
     :param module:
     :return:
     """
-    db.db_name = TEST_DB
+    # start every run from an empty database
+    if os.path.exists(TEST_DB):
+        os.remove(TEST_DB)
+    db.connect(TEST_DB)
     db.initialize_db()
 
     # lets add a testing habit
@@ -27,12 +32,14 @@ def setup_module(module):
     habit_ID = test_habit.habit_ID
 
     # lets fake some log entries
-    with sqlite3.connect(TEST_DB) as conn:
+    with db.transaction() as conn:
         cursor = conn.cursor()
 
-        # Clear today's log to avoid interference
+        # Clear today's log and the streak to avoid interference
         cursor.execute("DELETE FROM habit_log WHERE habit_ID = ?", (habit_ID,))
-        cursor.execute("DELETE FROM habit_streak WHERE habit_ID = ?", (habit_ID,))
+        cursor.execute("UPDATE habit_streak "
+                       "SET habit_counter = 0, habit_counter_max = 0 "
+                       "WHERE habit_ID = ?", (habit_ID,))
 
         # insert fake logs for testing
         cursor.executemany("""
@@ -40,53 +47,912 @@ def setup_module(module):
                                 habit_completed, 
                                 habit_date_created)
             VALUES (?, ?, ?)
-        """, [(habit_ID, True, "07/01/2025"),
-              (habit_ID, True, "07/02/2025"),
-              (habit_ID, True, "07/03/2025"),
-              (habit_ID, True, "07/04/2025"),
-              (habit_ID, True, "07/07/2025"),
-              (habit_ID, True, "07/08/2025"),
-              (habit_ID, True, "07/09/2025"),
-              (habit_ID, True, "07/11/2025"),
-              (habit_ID, True, "07/12/2025"),
-              (habit_ID, True, "07/13/2025"),
-              (habit_ID, True, "07/14/2025"),
-              (habit_ID, True, "07/15/2025"),
-              (habit_ID, True, "07/20/2025"),
-              (habit_ID, True, "07/21/2025"),
-              (habit_ID, True, "07/24/2025"),
-              (habit_ID, True, "07/25/2025")
+        """, [(habit_ID, True, "2025-07-01"),
+              (habit_ID, True, "2025-07-02"),
+              (habit_ID, True, "2025-07-03"),
+              (habit_ID, True, "2025-07-04"),
+              (habit_ID, True, "2025-07-07"),
+              (habit_ID, True, "2025-07-08"),
+              (habit_ID, True, "2025-07-09"),
+              (habit_ID, True, "2025-07-11"),
+              (habit_ID, True, "2025-07-12"),
+              (habit_ID, True, "2025-07-13"),
+              (habit_ID, True, "2025-07-14"),
+              (habit_ID, True, "2025-07-15"),
+              (habit_ID, True, "2025-07-20"),
+              (habit_ID, True, "2025-07-21"),
+              (habit_ID, True, "2025-07-24"),
+              (habit_ID, True, "2025-07-25")
               ]
                            )
-    cursor.close()
-    conn.commit()
+        cursor.close()
+
+
+def teardown_module(module):
+    """
+    closing the connection to the test database
+    :param module:
+    :return:
+    """
+    db.get_database().close()
 
 
 def test_update_streak_in_db_daily():
     """Test if streak updates correctly for a daily habit."""
-    with sqlite3.connect(TEST_DB) as conn:
-        cursor = conn.cursor()
+    cursor = db.get_connection().cursor()
 
-        # Get test habit ID
-        cursor.execute("SELECT habit_ID "
-                       "FROM habit_info "
-                       "WHERE habit_name = ?",
-                       ("Test Habit",))
-        habit_ID = cursor.fetchone()[0]
+    # Get test habit ID
+    cursor.execute("SELECT habit_ID "
+                   "FROM habit_info "
+                   "WHERE habit_name = ?",
+                   ("Test Habit",))
+    habit_ID = cursor.fetchone()[0]
 
-    # Run the streak update logic
-    db.update_streak_in_db(habit_ID)
+    # Run the streak update logic, it applies the log rows written by setup_module()
+    db.update_streak_in_db()
 
     # Check if streak incremented
-    with sqlite3.connect(TEST_DB) as conn:
-        cursor = conn.cursor()
-        cursor.execute("SELECT habit_counter, "
-                       "habit_counter_max "
-                       "FROM habit_streak "
-                       "WHERE habit_ID = ?",
-                       (habit_ID,))
-        current, maximum = cursor.fetchone()
-        cursor.close()
+    cursor.execute("SELECT habit_counter, "
+                   "habit_counter_max "
+                   "FROM habit_streak "
+                   "WHERE habit_ID = ?",
+                   (habit_ID,))
+    current, maximum = cursor.fetchone()
+    cursor.close()
+
+    # 2025-07-24 and 2025-07-25 are the current streak, 2025-07-11 to 2025-07-15 the longest
+    assert current == 2, "Current streak should be 2"
+    assert maximum == 5, "Max streak should be updated to 5"
+
+
+def test_habit_creation_commits_once():
+    """Test if creating a habit writes all three tables in a single commit."""
+    database = db.get_database()
+    commits_before = database.commit_count
+
+    habit = Habit(name="Commit Habit", description="one commit", time_period="w")
+
+    assert database.commit_count == commits_before + 1
+    cursor = db.get_connection().cursor()
+    for table in ("habit_info", "habit_log", "habit_streak"):
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE habit_ID = ?",
+                       (habit.habit_ID,))
+        assert cursor.fetchone()[0] == 1
+    db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_create_many_habits_in_one_commit():
+    """Test if habits built without side effects are stored in bulk with consecutive IDs."""
+    database = db.get_database()
+    commits_before = database.commit_count
+    unsaved = Habit(name="Unsaved Habit", description="", time_period="d", save=False)
+    assert unsaved.habit_ID is None and database.commit_count == commits_before
+
+    habits = Habit.create_many([{"name": f"Bulk Habit {i}", "description": "bulk", "time_period": "3/W"}
+                                for i in range(3)]
+                               + [{"name": "Bulk Done", "description": "", "time_period": "d",
+                                   "completed": True}])
+
+    assert database.commit_count == commits_before + 1
+    habit_ids = [habit.habit_ID for habit in habits]
+    assert habit_ids == list(range(habit_ids[0], habit_ids[0] + 4))
+    assert [habit.habit_time_period for habit in habits] == ["3/w"] * 3 + ["d"]
+    cursor = db.get_connection().cursor()
+    for table in ("habit_info", "habit_log", "habit_streak"):
+        cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE habit_ID BETWEEN ? AND ?",
+                       (habit_ids[0], habit_ids[-1]))
+        assert cursor.fetchone()[0] == 4
+    cursor.execute("SELECT habit_name FROM habit_info WHERE habit_ID = ?", (habit_ids[0],))
+    assert cursor.fetchone()[0] == "Bulk Habit 0"
+    cursor.execute("SELECT habit_counter, habit_next_due FROM habit_streak WHERE habit_ID = ?",
+                   (habit_ids[-1],))
+    assert cursor.fetchone() == (1, (date.today() + timedelta(days=1)).isoformat())
+
+    # the next check-off applies its event on top of the bulk snapshots
+    db.check_off_many([(habit_ids[0], date.today())])
+    cursor.execute("SELECT habit_counter FROM habit_streak WHERE habit_ID = ?", (habit_ids[0],))
+    assert cursor.fetchone()[0] == 0
+    for habit_ID in habit_ids:
+        db.delete_habit_from_db(habit_ID)
+
+    # a row violating a constraint rolls back the whole batch
+    cursor.execute("SELECT COUNT(*) FROM habit_info")
+    habits_before = cursor.fetchone()[0]
+    today = date.today().isoformat()
+    assert db.add_habits_bulk([("Bulk Valid", "", "d", today, False),
+                               (None, "", "d", today, False)]) == []
+    cursor.execute("SELECT COUNT(*) FROM habit_info")
+    assert cursor.fetchone()[0] == habits_before
+
+
+def test_migrate_legacy_database(tmp_path):
+    """Test if a database with "%m/%d/%Y" dates is migrated in place."""
+    legacy_db = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(legacy_db)
+    conn.executescript("""
+        CREATE TABLE habit_info (habit_ID INTEGER PRIMARY KEY, habit_name TEXT NOT NULL,
+                                 habit_description TEXT NOT NULL, habit_time_period TEXT NOT NULL,
+                                 habit_date_created DATE);
+        CREATE TABLE habit_log (habit_ID INTEGER, habit_completed BOOLEAN, habit_date_created DATE);
+        CREATE TABLE habit_streak (habit_ID INTEGER, habit_counter INTEGER DEFAULT 0,
+                                   habit_counter_max INTEGER DEFAULT 0);
+        INSERT INTO habit_info VALUES (1, 'Run', 'go for a run', 'D', '12/31/2024');
+        INSERT INTO habit_log VALUES (1, 0, '12/31/2024'), (1, 1, '12/31/2024'), (1, 1, '01/01/2025');
+        INSERT INTO habit_streak VALUES (1, 0, 0);
+    """)
+    conn.close()
+
+    try:
+        db.connect(legacy_db)
+        db.initialize_db()
+        cursor = db.get_connection().cursor()
+        cursor.execute("PRAGMA user_version")
+        assert cursor.fetchone()[0] == db.SCHEMA_VERSION
+        cursor.execute("SELECT habit_time_period, habit_date_created FROM habit_info")
+        assert cursor.fetchone() == ("d", "2024-12-31")
+        cursor.execute("SELECT habit_completed, habit_date_created FROM habit_log "
+                       "WHERE habit_ID = 1 ORDER BY habit_date_created DESC")
+        assert cursor.fetchall() == [(1, "2025-01-01"), (1, "2024-12-31")]
+        cursor.execute("SELECT habit_day, habit_week FROM habit_log ORDER BY habit_date_created")
+        assert cursor.fetchall() == [(db.day_number("12/31/2024"), db.week_key(db.day_number("2024-12-31"))),
+                                     (db.day_number("2025-01-01"), db.week_key(db.day_number("2025-01-01")))]
+
+        # a habit can only be logged once per day
+        with pytest.raises(sqlite3.IntegrityError):
+            db.add_habit_log(1, True, "2025-01-01")
+    finally:
+        db.get_database().close()
+        db.connect(TEST_DB)
+
+
+def test_log_rows_carry_day_numbers():
+    """Test if every log row gets its day number and ISO week key, also after its date changed."""
+    habit = Habit(name="Day Numbers", description="", time_period="d")
+    db.check_off_many([(habit.habit_ID, "2025-03-02"), (habit.habit_ID, "2025-03-03")])
+    query = "SELECT habit_day, habit_week FROM habit_log WHERE habit_ID = ? AND habit_completed ORDER BY habit_day"
+    cursor = db.get_connection().cursor()
+
+    (sunday, sunday_week), (monday, monday_week) = cursor.execute(query, (habit.habit_ID,)).fetchall()
+    assert (sunday, monday) == (date(2025, 3, 2).toordinal(), date(2025, 3, 3).toordinal())
+    assert monday_week - sunday_week == 1
+    assert db.bucket_start(sunday, "w") == date(2025, 2, 24).toordinal()
+    assert db.day_string(sunday) == "2025-03-02" and db.day_number("03/02/2025") == sunday
+
+    with db.transaction() as conn:
+        conn.execute("UPDATE habit_log SET habit_date_created = '2025-03-10' "
+                     "WHERE habit_ID = ? AND habit_day = ?", (habit.habit_ID, monday))
+    assert cursor.execute(query, (habit.habit_ID,)).fetchall()[-1] == (monday + 7, monday_week + 1)
+    db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_streak_lookup_uses_index():
+    """Test if the last check-offs of a habit are read from the index without sorting."""
+    cursor = db.get_connection().cursor()
+    cursor.execute("""
+        EXPLAIN QUERY PLAN
+        SELECT habit_date_created FROM habit_log
+        WHERE habit_ID = ? ORDER BY habit_date_created DESC LIMIT 2
+    """, (1,))
+    plan = " ".join(row[-1] for row in cursor.fetchall())
+    assert "habit_log_habit_date" in plan
+    assert "TEMP B-TREE" not in plan
+
+
+def test_recompute_streaks():
+    """Test if the streaks are derived from the complete log of the test habit."""
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT habit_ID FROM habit_info WHERE habit_name = ?", ("Test Habit",))
+    habit_ID = cursor.fetchone()[0]
+
+    assert db.recompute_streaks([habit_ID]) == 1
+
+    cursor.execute("SELECT habit_counter, habit_counter_max FROM habit_streak WHERE habit_ID = ?",
+                   (habit_ID,))
+    current, maximum = cursor.fetchone()
+    # 2025-07-24 and 2025-07-25 are the current streak, 2025-07-11 to 2025-07-15 the longest
+    assert current == 2, "Current streak should be 2"
+    assert maximum == 5, "Max streak should be 5"
+
+
+def test_streaks_replay_events_after_crash():
+    """Test if log rows written without their streak update are replayed on startup, and only those."""
+    habit = Habit(name="Replayed Habit", description="", time_period="d")
+    db.check_off_many([(habit.habit_ID, "2025-03-01"), (habit.habit_ID, "2025-03-02")])
+
+    # another process logs two completions and dies before it updates the streak
+    other = sqlite3.connect(TEST_DB)
+    other.executemany("INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created) VALUES (?, 1, ?)",
+                      [(habit.habit_ID, "2025-03-03"), (habit.habit_ID, "2025-03-05")])
+    other.commit()
+    other.close()
+
+    query = "SELECT habit_counter, habit_counter_max, habit_last_completed FROM habit_streak WHERE habit_ID = ?"
+    cursor = db.get_connection().cursor()
+    assert cursor.execute(query, (habit.habit_ID,)).fetchone() == (2, 2, "2025-03-02")
+    with db.transaction() as conn:
+        assert db._apply_events(conn.cursor()) == 2
+    assert cursor.execute(query, (habit.habit_ID,)).fetchone() == (1, 3, "2025-03-05")
+    assert db._sequence(cursor, "habit_streak") == db._sequence(cursor, "habit_log")
+
+    # the restart finds nothing left to replay, and a backdated event recomputes the habit
+    db.initialize_db(verbose=False)
+    with db.transaction() as conn:
+        assert db._apply_events(conn.cursor()) == 0
+    db.check_off_many([(habit.habit_ID, "2025-03-04")])
+    assert cursor.execute(query, (habit.habit_ID,)).fetchone() == (5, 5, "2025-03-05")
+    db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_compute_streaks_weekly_ignores_gaps():
+    """Test if weekly completions continue a streak in consecutive calendar weeks."""
+    # 2025-07-01 is a Tuesday, the completions fall into weeks 27, 28, 29, 29, 30 and 32
+    days = [date(2025, 7, 1).toordinal() + offset for offset in (0, 7, 14, 15, 22, 36)]
+    assert db.compute_streaks(days, "w") == (1, 4)
+    assert db.compute_streaks([], "d") == (0, 0)
+    # a Monday and the Sunday of the following week are 13 days apart but still a streak
+    monday = date(2025, 7, 7).toordinal()
+    assert db.compute_streaks([monday, monday + 13], "w") == (2, 2)
+    assert db.compute_streaks([monday + 6, monday + 7], "w") == (2, 2)
+
+
+def test_periodicities():
+    """Test if custom periodicities are parsed, bucketed and folded into streaks."""
+    import periods
+
+    assert periods.normalize("1D") == "d" and periods.normalize("3/1w") == "3/w"
+    assert not periods.is_valid("0d") and not periods.is_valid("8/w") and not periods.is_valid("x")
+    assert periods.describe("3d") == "Every 3 days" and periods.describe("3/w") == "3 times per week"
+
+    monday = date(2025, 7, 7).toordinal()
+    # three completions per week, the second week only has two
+    days = [monday, monday + 2, monday + 4, monday + 7, monday + 8, monday + 14, monday + 15, monday + 20]
+    assert periods.fold(days, "3/w") == (1, 1, monday + 20, 3)
+    assert periods.streaks(days[:5] + [monday + 9], "3/w") == (2, 2)
+    # every 3 days counts from day number 1, monday + 2 starts a period
+    assert periods.streaks([monday + 2, monday + 4, monday + 5, monday + 11], "3d") == (1, 2)
+    # calendar months, however long
+    assert periods.streaks([date(2025, 1, 31).toordinal(), date(2025, 2, 1).toordinal(),
+                            date(2025, 3, 31).toordinal()], "m") == (3, 3)
+
+    # due by the end of the next period, or of the current one while its target is not met
+    assert periods.due_day(monday, "d") == monday + 1
+    assert periods.due_day(monday + 3, "w") == monday + 13
+    assert periods.due_day(monday + 3, "3/w", completed=2) == monday + 6
+    assert periods.due_day(date(2025, 1, 15).toordinal(), "m") == date(2025, 2, 28).toordinal()
+
+    habit = Habit(name="Three Times Weekly", description="", time_period="3/W")
+    assert habit.habit_time_period == "3/w"
+    db.check_off_many([(habit.habit_ID, date.fromordinal(day)) for day in days[:3]])
+    db.check_off_many([(habit.habit_ID, date.fromordinal(days[3]))])
+    cursor = db.get_connection().cursor()
+    cursor.execute("SELECT habit_counter, habit_counter_max, habit_next_due FROM habit_streak "
+                   "WHERE habit_ID = ?", (habit.habit_ID,))
+    assert cursor.fetchone() == (1, 1, date.fromordinal(monday + 13).isoformat())
+    db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_vectorized_streaks_match_scalar_engine(tmp_path):
+    """Test if the NumPy backend computes exactly the streaks of db.compute_streaks()."""
+    pytest.importorskip("numpy")
+    import analyze_np
+    import benchmark
+    import periods
+
+    try:
+        benchmark.build_database(str(tmp_path / "bench.db"), habits=60, days=200,
+                                 density=0.7, weekly_share=0.3, seed=3, custom_share=0.4)
+        assert benchmark.streaks_vectorized() == benchmark.streaks_per_habit_loop()
+
+        log = analyze_np.load_log_arrays()
+        run_lengths = analyze_np.streak_run_lengths(log)
+        break_dates = analyze_np.streak_break_dates(log)
+        for habit_ID, lengths in run_lengths.items():
+            assert len(break_dates.get(habit_ID, [])) == len(lengths) - 1
+
+        # a streak breaks on the day the next completion was due
+        time_periods = dict(db.get_connection().execute("SELECT habit_ID, habit_time_period FROM habit_info"))
+        runs = analyze_np.streak_runs(log)
+        for habit_ID, last_day, missed_day in zip(runs.habit_ids.tolist(), runs.last_days.tolist(),
+                                                  runs.missed_days.tolist()):
+            assert missed_day == periods.due_day(last_day, time_periods[habit_ID])
+    finally:
+        db.get_database().close()
+        db.connect(TEST_DB)
+
+
+def test_parallel_recompute_matches_serial(tmp_path):
+    """Test if recomputing the streaks in worker processes writes the same snapshots."""
+    pytest.importorskip("numpy")
+    import benchmark
+
+    query = "SELECT * FROM habit_streak ORDER BY habit_ID"
+    try:
+        benchmark.build_database(str(tmp_path / "bench.db"), habits=30, days=90,
+                                 density=0.7, weekly_share=0.5, seed=5)
+        cursor = db.get_connection().cursor()
+        serial = cursor.execute(query).fetchall()
+        with db.transaction():
+            cursor.execute("UPDATE habit_streak SET habit_counter = 0, habit_counter_max = 0, "
+                           "habit_next_due = NULL")
+
+        assert db.recompute_streaks(workers=2) == 30
+        assert cursor.execute(query).fetchall() == serial
+        assert db._sequence(cursor, "habit_streak") == db._sequence(cursor, "habit_log")
+
+        # the workers cannot see the log rows of an enclosing transaction, it is recomputed serially
+        with db.transaction() as conn:
+            habit = Habit(name="Uncommitted Log", description="", time_period="d")
+            days = [(date.today() - timedelta(days=offset)).isoformat() for offset in range(1, 6)]
+            conn.executemany("INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created) "
+                             "VALUES (?, 1, ?)", [(habit.habit_ID, day) for day in days])
+            assert db.recompute_streaks(workers=2) == 31
+        cursor.execute("SELECT habit_counter, habit_counter_max FROM habit_streak WHERE habit_ID = ?",
+                       (habit.habit_ID,))
+        assert cursor.fetchone() == (5, 5)
+    finally:
+        db.get_database().close()
+        db.connect(TEST_DB)
+
+
+def test_check_off_many():
+    """Test if a batch of completions updates the streaks like a full recomputation."""
+    daily = Habit(name="Batch Daily", description="batch", time_period="d")
+    weekly = Habit(name="Batch Weekly", description="batch", time_period="w")
+    first = date(2025, 1, 1)
+
+    checked_off = db.check_off_many(
+        [(daily.habit_ID, first + timedelta(days=offset)) for offset in (0, 1, 2, 4, 5)]
+        + [(weekly.habit_ID, (first + timedelta(weeks=offset)).isoformat()) for offset in (0, 1)]
+        + [(daily.habit_ID, first)])
+    assert checked_off == 7
+
+    # a backdated completion closes the gap between the two daily streaks
+    assert db.check_off_many([(daily.habit_ID, first + timedelta(days=3)),
+                              (weekly.habit_ID, first + timedelta(weeks=2))]) == 2
+
+    cursor = db.get_connection().cursor()
+    query = "SELECT habit_counter, habit_counter_max FROM habit_streak WHERE habit_ID = ?"
+    batched = [cursor.execute(query, (habit.habit_ID,)).fetchone() for habit in (daily, weekly)]
+    db.recompute_streaks([daily.habit_ID, weekly.habit_ID])
+    recomputed = [cursor.execute(query, (habit.habit_ID,)).fetchone() for habit in (daily, weekly)]
+
+    assert batched == recomputed == [(6, 6), (3, 3)]
+    for habit in (daily, weekly):
+        db.delete_habit_from_db(habit.habit_ID)
+
+    # backdated batches of every periodicity are replayed on the bitmaps like a recomputation
+    rng = random.Random(3)
+    habits = [Habit(name=f"Replayed {time_period}", description="batch", time_period=time_period)
+              for time_period in ("d", "w", "m", "3d", "2w", "3/w", "10/m")]
+    habit_ids = [habit.habit_ID for habit in habits]
+    query = ("SELECT habit_counter, habit_counter_max, habit_next_due, habit_last_completed "
+             "FROM habit_streak WHERE habit_ID = ?")
+    for _ in range(4):
+        db.check_off_many([(habit_ID, first + timedelta(days=rng.randrange(400)))
+                           for habit_ID in habit_ids for _ in range(60)])
+        replayed = [cursor.execute(query, (habit_ID,)).fetchone() for habit_ID in habit_ids]
+        db.recompute_streaks(habit_ids)
+        assert replayed == [cursor.execute(query, (habit_ID,)).fetchone() for habit_ID in habit_ids]
+    for habit_ID in habit_ids:
+        db.delete_habit_from_db(habit_ID)
+
+
+def test_rollup_matches_rebuild():
+    """Test if the rollup kept up to date by check-offs equals a rebuild from the log."""
+    import analyze
+
+    daily = Habit(name="Rollup Daily", description="rollup", time_period="d")
+    weekly = Habit(name="Rollup Weekly", description="rollup", time_period="w")
+    first = date(2025, 1, 27)
+    db.check_off_many([(daily.habit_ID, first + timedelta(days=offset)) for offset in (0, 1, 2, 9, 40)]
+                      + [(weekly.habit_ID, first + timedelta(days=offset)) for offset in (0, 3, 14)])
+    # a backdated completion in a week that already has one
+    db.check_off_many([(daily.habit_ID, first - timedelta(days=1)), (weekly.habit_ID, first + timedelta(days=1))])
+
+    # a rebuild adds the empty buckets after the last completion until today
+    query = ("SELECT habit_ID, bucket, period_start, completed, expected FROM habit_rollup "
+             "WHERE habit_ID IN (?, ?) AND period_start <= '2025-02-10' ORDER BY 1, 2, 3")
+    cursor = db.get_connection().cursor()
+    incremental = cursor.execute(query, (daily.habit_ID, weekly.habit_ID)).fetchall()
+    db.rebuild_rollup([daily.habit_ID, weekly.habit_ID])
+    assert cursor.execute(query, (daily.habit_ID, weekly.habit_ID)).fetchall() == incremental
+
+    rates = {row[1]: row[2:] for row in analyze.get_completion_rates(daily.habit_ID, "m")}
+    assert rates["2025-01-01"] == (4, 6, 4 / 6)
+    assert rates["2025-02-01"] == (1, 28, 1 / 28)
+    weeks = {row[1]: row[2] for row in analyze.get_completion_rates(weekly.habit_ID, "m")}
+    assert weeks["2025-01-01"] == 1 and weeks["2025-02-01"] == 1
+    best, worst = analyze.get_best_and_worst_period(daily.habit_ID, "m")
+    assert best == ("2025-01-01", 4 / 6) and worst[1] == 0.0
+
+    db.delete_habit_from_db(daily.habit_ID)
+    db.delete_habit_from_db(weekly.habit_ID)
+    assert cursor.execute("SELECT COUNT(*) FROM habit_rollup WHERE habit_ID IN (?, ?)",
+                          (daily.habit_ID, weekly.habit_ID)).fetchone() == (0,)
+
+
+def test_rollup_of_lapsed_habit_matches_rebuild(monkeypatch):
+    """Test if the completion rates count the periods since a habit lapsed without a rebuild."""
+    import analyze
+    import habit as habit_module
+
+    start = date.today() - timedelta(days=120)
+
+    class LastCheckOffDay(date):
+        @classmethod
+        def today(cls):
+            return start + timedelta(days=59)
+
+    # the habit is created and checked off on its first 60 days, 120 days ago
+    monkeypatch.setattr(db, "date", LastCheckOffDay)
+    monkeypatch.setattr(habit_module, "date", LastCheckOffDay)
+    lapsed = Habit(name="Lapsed Habit", description="rollup", time_period="d")
+    with db.transaction() as conn:
+        conn.execute("UPDATE habit_info SET habit_date_created = ? WHERE habit_ID = ?",
+                     (start.isoformat(), lapsed.habit_ID))
+        # the rollup was last extended on the day of the last check-off
+        db._set_sequence(conn.cursor(), "habit_rollup", LastCheckOffDay.today().toordinal())
+    db.check_off_many([(lapsed.habit_ID, (start + timedelta(days=offset)).isoformat()) for offset in range(60)])
+    monkeypatch.undo()
+
+    def answers():
+        return (analyze.get_completion_trend(lapsed.habit_ID, "w"),
+                analyze.get_best_and_worst_period(lapsed.habit_ID, "w"),
+                analyze.get_completion_rates(lapsed.habit_ID, "d"))
+
+    # the readers only read, the first check-off of the day extends the rollup
+    database = db.get_database()
+    commits_before = database.commit_count
+    assert answers()[0].recent > 0.0
+    assert database.commit_count == commits_before
+    other = Habit(name="Other Habit", description="rollup", time_period="d")
+    db.check_off_habit_in_db(other.habit_ID)
+    incremental = answers()
+    assert incremental[0].recent == 0.0
+    db.rebuild_rollup([lapsed.habit_ID])
+    assert answers() == incremental
+    db.delete_habit_from_db(lapsed.habit_ID)
+    db.delete_habit_from_db(other.habit_ID)
+
+
+def test_completion_bitmap():
+    """Test if the bitmap kept up to date by check-offs answers like the log."""
+    import analyze
+    import bitmap
+
+    habit = Habit(name="Bitmap Habit", description="bitmap", time_period="d")
+    days = [date(2025, 3, 1) + timedelta(days=offset) for offset in (0, 1, 2, 10, 11, 400)]
+    db.check_off_many([(habit.habit_ID, day) for day in days[1:]])
+    db.check_off_many([(habit.habit_ID, days[0])])
+
+    habit_bitmap = db.get_habit_bitmap(habit.habit_ID)
+    assert habit_bitmap.first_day == days[0].toordinal()
+    assert bitmap.completion_days(habit_bitmap) == [day.toordinal() for day in days]
+    assert bitmap.completed_on(habit_bitmap, days[3].toordinal())
+    assert not bitmap.completed_on(habit_bitmap, days[3].toordinal() - 1)
+    assert not bitmap.completed_on(habit_bitmap, days[0].toordinal() - 1)
+    assert bitmap.streaks(habit_bitmap) == db.compute_streaks(bitmap.completion_days(habit_bitmap), "d")
+    assert bitmap.streaks(bitmap.add_days(None, [1, 2, 3, 5, 6])) == (2, 3)
+    assert bitmap.longest_gap(habit_bitmap) == 388
+
+    db.rebuild_bitmaps([habit.habit_ID])
+    assert bitmap.completion_days(db.get_habit_bitmap(habit.habit_ID)) == bitmap.completion_days(habit_bitmap)
+
+    heatmap = analyze.render_heatmap(habit_bitmap, 2025).splitlines()
+    assert heatmap[0].split() == ["Jan", "Feb", "Mar", "Apr", "May", "Jun",
+                                  "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    # 2025-03-01 is a Saturday in the ninth column
+    assert heatmap[6][4 + 8] == "#" and heatmap[6].count("#") == 1
+    db.delete_habit_from_db(habit.habit_ID)
+    assert db.get_habit_bitmap(habit.habit_ID) is None
+
+
+def test_users_on_shards(tmp_path):
+    """Test if users are routed to their shard, only see their habits and write independently."""
+    import threading
+    import analyze
+
+    router = db.connect_shards(str(tmp_path), shard_count=4)
+    try:
+        users = ["alice", "bob", "carol", "dave", "erin"]
+        for user in users:
+            with db.use_user(user):
+                assert db.get_database().db_name == router.shard_path(router.shard_of(user))
+                Habit(name=f"{user} habit", description="", time_period="d")
+                db.check_off_habit_in_db(db.get_all_habits()[0][0])
+        for user in users:
+            with db.use_user(user):
+                assert [name for _, name in db.get_all_habits()] == [f"{user} habit"]
+
+        # a write transaction on one shard does not block the users of another shard
+        alice, other = "alice", next(user for user in users
+                                      if router.shard_of(user) != router.shard_of("alice"))
+        written = []
+        with db.use_user(alice), db.transaction() as conn:
+            conn.execute("UPDATE habit_info SET habit_description = 'busy'")
+
+            def write():
+                with db.use_user(other):
+                    written.append(db.check_off_many([(db.get_all_habits()[0][0], "2025-01-01")]))
+            thread = threading.Thread(target=write)
+            thread.start()
+            thread.join(timeout=2)
+            assert written == [1]
+
+        assert analyze.get_cross_user_summary(workers=2) == {
+            "users": 5, "habits": 5, "daily_habits": 5, "weekly_habits": 0,
+            "other_habits": 0, "completions": 6, "longest_streak": 1}
+    finally:
+        db.connect_shards(None)
+    assert db.get_database().db_name == TEST_DB
+
+
+def test_habit_streak_cache():
+    """Test if the cached views are read again only after the database was written."""
+    import analyze
+
+    habit = Habit(name="Cached Habit", description="", time_period="w")
+    analyze.habit_streak_cache.clear()
+    first = analyze.get_habit_streaks(time_period="w")
+    assert analyze.get_habit_streaks(time_period="w") == first
+    assert (analyze.habit_streak_cache.hits, analyze.habit_streak_cache.misses) == (1, 1)
+
+    db.update_habit_info(habit.habit_ID, "Renamed Habit", "")
+    assert "Renamed Habit" in [row[1] for row in analyze.get_habit_streaks(time_period="w")]
+
+    # a write of another connection, e.g. another process, is noticed as well
+    other = sqlite3.connect(TEST_DB)
+    other.execute("UPDATE habit_streak SET habit_counter = 7 WHERE habit_ID = ?", (habit.habit_ID,))
+    other.commit()
+    other.close()
+    assert analyze.get_habit_streaks(habit.habit_ID)[0][3] == 7
+    assert analyze.habit_streak_cache.misses == 3
+
+    small = analyze.QueryCache(maxsize=2)
+    for key in ("a", "b", "a", "c"):
+        small.get(key, 0, lambda: key)
+    assert small.stats()["size"] == 2 and small.get("b", 0, lambda: "reloaded") == "reloaded"
+    db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_analytics_records_and_streamed_listing(capsys):
+    """Test if the queries return records, the listings stream and the views only print them."""
+    import json
+    import types
+    import analyze
+    import main
+
+    habits = [Habit(name=f"Listed {i}", description="", time_period="w") for i in range(3)]
+    listing = analyze.iter_habit_streaks(time_period="w")
+    assert isinstance(listing, types.GeneratorType)
+    records = list(listing)
+    assert records == analyze.get_habit_streaks(time_period="w")
+    assert records[-1].habit_name == "Listed 2" and records[-1] == tuple(records[-1])
+
+    analyze.view_habits_by_time_period(rows=iter(records))
+    assert "[{}] Listed 0 (Weekly)".format(habits[0].habit_ID) in capsys.readouterr().out
+    analyze.view_habits_by_time_period(rows=iter([]))
+    assert "No matching habits found." in capsys.readouterr().out
+
+    main.main(["--db", TEST_DB, "list", "--period", "w", "--json"])
+    listed = json.loads(capsys.readouterr().out)
+    assert [row["habit_ID"] for row in listed] == [record.habit_ID for record in records]
+    for habit in habits:
+        db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_leaderboards_rank_ties():
+    """Test if the leaderboards rank the top habits with shared ranks and read the index."""
+    import analyze
+
+    with db.use_user("leaderboard"):
+        habits = [Habit(name=f"Ranked {i}", description="", time_period="d") for i in range(5)]
+        with db.transaction() as conn:
+            conn.executemany("UPDATE habit_streak SET habit_counter = ?, habit_counter_max = ? WHERE habit_ID = ?",
+                             [(current, longest, habit.habit_ID)
+                              for habit, current, longest in zip(habits, (1, 4, 4, 2, 0), (9, 4, 9, 7, 7))])
+
+        longest = analyze.get_streak_leaderboard("longest", limit=2)
+        assert [(entry.rank, entry.habit_ID, entry.value) for entry in longest] == [
+            (1, habits[0].habit_ID, 9), (1, habits[2].habit_ID, 9)]
+        current = analyze.get_streak_leaderboard("current", "d", limit=2)
+        assert [(entry.rank, entry.value) for entry in current] == [(1, 4), (1, 4)]
+        # the habits tied with the last one are cut by habit ID
+        longest = analyze.get_streak_leaderboard("longest", limit=3)
+        assert [(entry.rank, entry.habit_ID) for entry in longest] == [
+            (1, habits[0].habit_ID), (1, habits[2].habit_ID), (3, habits[3].habit_ID)]
+        assert len(analyze.get_streak_leaderboard("current", limit=1)) == 1
+        assert [entry.habit_ID for entry in analyze.get_streak_leaders()] == [habits[0].habit_ID, habits[2].habit_ID]
+        assert analyze.get_streak_leaderboard("longest", "w") == []
+
+        week = date.today() - timedelta(days=date.today().weekday() + 7)
+        db.check_off_many([(habits[1].habit_ID, week + timedelta(days=i)) for i in range(3)]
+                          + [(habits[3].habit_ID, week)])
+        rates = analyze.get_completion_leaderboard("w", limit=1)
+        assert [(entry.rank, entry.habit_ID) for entry in rates] == [(1, habits[1].habit_ID)]
+        assert rates == analyze.get_completion_leaderboard("w", week + timedelta(days=3), limit=1)
+        # the rates of all habits are the ones of this user only
+        rated = {rate.habit_ID for rate in analyze.get_completion_rates(bucket="w")}
+        assert rated and rated <= {habit.habit_ID for habit in habits}
+
+    cursor = db.get_connection().cursor()
+    cursor.execute("EXPLAIN QUERY PLAN SELECT habit_info.habit_ID FROM habit_streak "
+                   "CROSS JOIN habit_info ON habit_info.habit_ID = habit_streak.habit_ID "
+                   "WHERE habit_info.user_ID IS NULL "
+                   "ORDER BY habit_streak.habit_counter_max DESC, habit_streak.habit_ID LIMIT 10")
+    plan = " ".join(row[-1] for row in cursor.fetchall())
+    assert "habit_streak_counter_max" in plan and "TEMP B-TREE" not in plan
+    for habit in habits:
+        db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_scheduler_reminds_of_due_habits():
+    """Test if the due dates follow the check-offs and the scheduler reminds once per due date."""
+    import scheduler
+
+    today = date.today()
+    daily = Habit(name="Due Daily", description="", time_period="d")
+    weekly = Habit(name="Due Weekly", description="", time_period="w")
+    fresh = Habit(name="Due Fresh", description="", time_period="d")
+    db.check_off_many([(daily.habit_ID, today), (weekly.habit_ID, today - timedelta(days=3))])
+    ids = {daily.habit_ID, weekly.habit_ID, fresh.habit_ID}
+    # the weekly habit is due by the Sunday of the ISO week after its completion
+    completed = today - timedelta(days=3)
+    weekly_due = (completed + timedelta(days=13 - completed.weekday())).isoformat()
+
+    def due(hours, now):
+        return {reminder.habit_ID: reminder.due_date for reminder in scheduler.due_within(hours, now)
+                if reminder.habit_ID in ids}
+
+    morning = datetime.combine(today, datetime.min.time()) + timedelta(hours=9)
+    # the habit that was never completed is due today, at midnight
+    assert due(15, morning) == {fresh.habit_ID: today.isoformat()}
+    assert due(14, morning) == {}
+    assert due(24 * 11, morning) == {fresh.habit_ID: today.isoformat(),
+                                     daily.habit_ID: (today + timedelta(days=1)).isoformat(),
+                                     weekly.habit_ID: weekly_due}
+
+    reminders = []
+    reminder_scheduler = scheduler.Scheduler(hours=15, notify=reminders.append)
+    reminder_scheduler.sweep(morning)
+    reminder_scheduler.sweep(morning)
+    assert [reminder.habit_ID for reminder in reminders if reminder.habit_ID in ids] == [fresh.habit_ID]
+    assert reminders[-1].deadline == (today + timedelta(days=1)).isoformat() + "T00:00:00"
+
+    # a check-off moves the due date, a recompute derives the same one from the log
+    db.check_off_many([(fresh.habit_ID, today)])
+    assert due(15, morning) == {}
+    with db.transaction() as conn:
+        conn.execute("UPDATE habit_streak SET habit_next_due = NULL")
+    db.recompute_streaks()
+    assert due(24 * 11, morning)[weekly.habit_ID] == weekly_due
+
+    cursor = db.get_connection().cursor()
+    cursor.execute("EXPLAIN QUERY PLAN " + scheduler.DUE_SQL, scheduler.due_range(24))
+    plan = " ".join(row[-1] for row in cursor.fetchall())
+    assert "habit_streak_next_due" in plan and "TEMP B-TREE" not in plan
+    for habit_ID in ids:
+        db.delete_habit_from_db(habit_ID)
+
+
+def test_write_queue_groups_concurrent_check_offs():
+    """Test if concurrent writes through the write queue are all committed, in fewer commits."""
+    import threading
+    import analyze
+
+    assert db.get_connection().execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    habits = [Habit(name=f"Queued {i}", description="", time_period="d") for i in range(4)]
+    write_queue = db.start_write_queue()
+    try:
+        def check_off(habit_ID):
+            for day in range(50):
+                assert db.check_off_many([(habit_ID, date(2024, 1, 1) + timedelta(days=day))]) == 1
+
+        threads = [threading.Thread(target=check_off, args=(habit.habit_ID,)) for habit in habits]
+        for thread in threads:
+            thread.start()
+
+        # readers are not blocked by the writer thread
+        assert len(analyze.get_habit_streaks(habits[0].habit_ID)) == 1
+        for thread in threads:
+            thread.join()
+
+        # creates, edits and deletes go through the writer thread as well
+        extra = Habit(name="Queued extra", description="", time_period="d")
+        db.update_habit_info(extra.habit_ID, "Queued edited", "")
+        db.delete_habit_from_db(extra.habit_ID)
+    finally:
+        assert db.stop_write_queue() is write_queue
+
+    assert write_queue.writes == 203 and write_queue.commits <= 203
+
+    # without the queue, a write that did not get the lock is run again
+    attempts = []
+
+    def locked_once(cursor):
+        attempts.append(cursor)
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return len(attempts)
+    assert db._write(db._in_transaction, locked_once) == 2
+    for habit in habits:
+        assert analyze.get_habit_streaks(habit.habit_ID)[0][3:] == (50, 50)
+        db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_api_server():
+    """Test if the API answers several requests over one keep-alive connection and in batches."""
+    import asyncio
+    import loadtest
+    import server
+
+    async def session():
+        api = server.Server(workers=2)
+        listener = await asyncio.start_server(api.handle_connection, "127.0.0.1", 0)
+        reader, writer = await asyncio.open_connection(*listener.sockets[0].getsockname()[:2])
+        try:
+            status, habit = await loadtest._request(reader, writer, "POST", "/habits",
+                                                    {"name": "API Habit", "period": "d"})
+            assert status == 201
+            habit_ID = habit["habit_ID"]
+            status, batch = await loadtest._request(reader, writer, "POST", "/batch", [
+                {"method": "POST", "path": f"/habits/{habit_ID}/checkoff", "body": {"date": "2025-01-01"}},
+                {"method": "POST", "path": f"/habits/{habit_ID}/checkoff", "body": {"date": "2025-01-02"}},
+                {"method": "GET", "path": "/habits/999999"}])
+            assert [response["status"] for response in batch] == [200, 200, 404]
+            status, streaks = await loadtest._request(reader, writer, "GET", f"/habits/{habit_ID}")
+            assert (status, streaks["habit_counter_max"]) == (200, 2)
+            assert (await loadtest._request(reader, writer, "POST", "/habits", {"name": "x", "period": "y"}))[0] == 400
+            assert (await loadtest._request(reader, writer, "PUT", "/habits"))[0] == 405
+            assert (await loadtest._request(reader, writer, "DELETE", f"/habits/{habit_ID}"))[0] == 200
+            assert api.requests == 6
+        finally:
+            writer.close()
+            listener.close()
+
+    asyncio.run(session())
+
+
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+def test_export_import_round_trip(tmp_path, fmt, monkeypatch):
+    """Test if exporting and importing into an empty database loses nothing."""
+    import transfer
+
+    habit = Habit(name="Export, \"quoted\"", description="", time_period="w")
+    db.check_off_many([(habit.habit_ID, "2024-12-30"), (habit.habit_ID, "2025-01-06")])
+    export_file = str(tmp_path / f"habits.{fmt}")
+
+    def dump():
+        return {table: list(transfer.iter_table(table)) for table in transfer.TABLE_COLUMNS}
+
+    try:
+        # the import recomputes the streaks, so start from recomputed streaks as well
+        db.recompute_streaks()
+        original = dump()
+        assert transfer.export_habits(export_file) == sum(map(len, original.values()))
+
+        db.connect(str(tmp_path / "imported.db"))
+        db.initialize_db()
+
+        # a failure while deriving the tables rolls back the rows imported before it
+        def fail(cursor, habit_ids=None):
+            raise sqlite3.OperationalError("disk I/O error")
+        with monkeypatch.context() as patch:
+            patch.setattr(db, "_rebuild_bitmaps", fail)
+            assert transfer.import_habits(export_file, fmt) == 0
+        assert db.get_all_habits() == []
+
+        assert transfer.import_habits(export_file, fmt) == sum(map(len, original.values()))
+        assert dump() == original
+    finally:
+        db.get_database().close()
+        db.connect(TEST_DB)
+        db.delete_habit_from_db(habit.habit_ID)
+
+
+def test_batch_mode(capsys):
+    """Test if the subcommands of main.py run without the interactive menu."""
+    import json
+    import main
+
+    assert main.main(["--db", TEST_DB, "create", "--name", "Batch", "--period", "d", "--json"]) == 0
+    habit_ID = json.loads(capsys.readouterr().out)["habit_ID"]
+
+    for day in ("2025-07-01", "2025-07-02"):
+        main.main(["--db", TEST_DB, "checkoff", "--id", str(habit_ID), "--date", day])
+    capsys.readouterr()
+
+    main.main(["--db", TEST_DB, "analyze", "--id", str(habit_ID), "--json"])
+    assert json.loads(capsys.readouterr().out) == [
+        {"habit_ID": habit_ID, "habit_name": "Batch", "habit_time_period": "d",
+         "habit_counter": 2, "habit_counter_max": 2}]
+    assert main.questionary is None
+    db.delete_habit_from_db(habit_ID)
+
+
+def test_main_menu_loop_uses_session_cache(monkeypatch, capsys):
+    """Test if the menu runs many actions without recursion and queries only after changes."""
+    import main
+
+    answers = iter(["View current habits", "Show me only the daily habits"] * 1500
+                   + ["Create new habit", "Menu Habit", "created from the menu", "w",
+                      "View current habits", "Show me all habits",
+                      "Exit the program"])
+
+    class Prompt:
+        def ask(self):
+            return next(answers)
+
+    class FakeQuestionary:
+        select = text = confirm = staticmethod(lambda *args, **kwargs: Prompt())
+
+    monkeypatch.setattr(main, "questionary", FakeQuestionary)
+    session = main.Session()
+    main.main_menu(session)
+
+    # one query before and one after the new habit, none for the other menu transitions
+    assert session.queries == 2
+    assert "Menu Habit" in capsys.readouterr().out
+    db.delete_habit_from_db(session.habits()[-1][0])
+
+
+def test_habit_repository():
+    """Test if existing habits are loaded as compact objects with a lazily loaded log."""
+    from habit import HabitRepository
+
+    repository = HabitRepository()
+    weekly = Habit(name="Repository Habit", description="loaded again", time_period="w")
+    db.check_off_many([(weekly.habit_ID, date.today())])
+
+    habit = repository.get(weekly.habit_ID)
+    assert (habit.habit_name, habit.habit_time_period, habit.habit_counter) == \
+        ("Repository Habit", "w", 1)
+    assert habit.habit_completed
+    assert not hasattr(habit, "__dict__")
+
+    # the log is only read on first access
+    assert habit._habit_log is None
+    assert habit.habit_log == [(date.today().isoformat(), True)]
+
+    assert [h.habit_ID for h in repository.by_period("w")] == [weekly.habit_ID]
+    assert [h.habit_ID for h in repository.all()] == [h.habit_ID for h in repository.iter_all()]
+    assert repository.get(-1) is None
+    db.delete_habit_from_db(weekly.habit_ID)
+
+
+def test_benchmark_compare_flags_regressions():
+    """Test if the benchmark comparison reports paths slower than the threshold."""
+    pytest.importorskip("numpy")
+    import benchmark
+
+    baseline = {"check_off": {"median": 1.0}, "get_all_habits": {"median": 1.0}}
+    results = {"check_off": {"median": 1.3}, "get_all_habits": {"median": 1.05},
+               "habit_creation": {"median": 5.0}}
+    assert benchmark.compare(results, baseline, threshold=10) == ["check_off"]
+
+
+def test_profiling_records_calls_and_statements():
+    """Test if the profiler counts calls, SQL statements and commits and can be removed again."""
+    import analyze
+    import profiling
+
+    original = db.get_all_habits
+    profiler = profiling.enable()
+    try:
+        habit = Habit(name="Profiled", description="profiled habit", time_period="d")
+        habits = db.get_all_habits()
+        analyze.get_habit_streaks(habit.habit_ID)
+    finally:
+        profiling.disable()
 
-    assert current == 1, "Current streak should be 1"
-    assert maximum == 4, "Max streak should be updated to 4"
+    stats = profiler.summary()["functions"]
+    assert stats["db.get_all_habits"]["calls"] == 1
+    assert stats["db.get_all_habits"]["rows"] == len(habits)
+    assert stats["db.add_habit"]["commits"] == 1
+    # the generation check of the cache, the query runs in the generator it consumes
+    assert stats["analyze.get_habit_streaks"]["statements"] == 1
+    assert stats["analyze.iter_habit_streaks"]["statements"] == 1
+    assert stats["analyze.iter_habit_streaks"]["rows"] == 1
+    assert "SELECT habit_ID, habit_name FROM habit_info WHERE user_ID IS NULL" in profiler.summary()["statements"]
+    assert db.get_all_habits is original
+    db.delete_habit_from_db(habit.habit_ID)
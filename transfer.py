@@ -0,0 +1,212 @@
+# TRANSFER.PY
+"""The transfer.py-file exports all habits with their log and streak information to
+a file and imports them again, either as CSV or as JSON Lines (one JSON object per
+line). Both formats hold the rows of the three tables habit_info, habit_log and
+habit_streak in this order, every row tagged with the table it belongs to.
+Rows are streamed in chunks in both directions, so memory use stays the same no
+matter how large the database or the file is. After an import the streaks, the
+rollup and the bitmaps of the imported habits are recomputed once from their
+complete log.
+"""
+
+import csv
+import json
+import sqlite3
+from itertools import islice
+import db
+
+# the columns written for every table, habit_log.log_ID is assigned on import
+TABLE_COLUMNS = {
+    "habit_info": ("habit_ID", "habit_name", "habit_description",
+                   "habit_time_period", "habit_date_created", "user_ID"),
+    "habit_log": ("habit_ID", "habit_completed", "habit_date_created"),
+    "habit_streak": ("habit_ID", "habit_counter", "habit_counter_max"),
+}
+
+# one CSV header for all tables, columns a table does not have stay empty
+CSV_COLUMNS = ("table",) + tuple(dict.fromkeys(column for columns in TABLE_COLUMNS.values()
+                                               for column in columns))
+
+INTEGER_COLUMNS = {"habit_ID", "habit_completed", "habit_counter", "habit_counter_max"}
+
+# text columns that can never be NULL, an empty CSV field is an empty string for them
+TEXT_COLUMNS = {"habit_name", "habit_description", "habit_time_period"}
+
+# date columns, stored as ISO-8601 even if the file has the "%m/%d/%Y" dates of old versions
+DATE_COLUMNS = {"habit_date_created"}
+
+IMPORT_SQL = {
+    "habit_info": """
+                  INSERT INTO habit_info (habit_ID, habit_name, habit_description,
+                  habit_time_period, habit_date_created, user_ID)
+                  VALUES (?, ?, ?, ?, ?, ?)
+                  ON CONFLICT (habit_ID) DO UPDATE
+                  SET habit_name = excluded.habit_name,
+                  habit_description = excluded.habit_description,
+                  habit_time_period = excluded.habit_time_period,
+                  habit_date_created = excluded.habit_date_created,
+                  user_ID = excluded.user_ID
+                  """,
+    "habit_log": """
+                 INSERT INTO habit_log (habit_ID, habit_completed, habit_date_created)
+                 VALUES (?, ?, ?)
+                 ON CONFLICT (habit_ID, habit_date_created)
+                 DO UPDATE SET habit_completed = excluded.habit_completed
+                 """,
+    "habit_streak": db.SAVE_STREAK_SQL,
+}
+
+# rows fetched from the database or written to it per round trip
+CHUNK_SIZE = 1000
+
+FORMATS = ("csv", "jsonl")
+
+
+def _format_of(path, fmt):
+    """
+        Returns the file format, taken from the file extension if fmt is None.
+    :return: str: 'csv' or 'jsonl'
+    """
+    if fmt is None:
+        fmt = path.rsplit(".", 1)[-1].lower()
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', use one of: {', '.join(FORMATS)}")
+    return fmt
+
+
+def iter_table(table_name):
+    """
+        Streams all rows of a table in chunks of CHUNK_SIZE rows.
+    :param table_name: One of the keys of TABLE_COLUMNS.
+    :return: generator of dicts {column: value}
+    """
+    columns = TABLE_COLUMNS[table_name]
+    cursor = db.get_connection().cursor()
+    cursor.execute(f"SELECT {', '.join(columns)} FROM {table_name} ORDER BY habit_ID")
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            return
+        for row in rows:
+            yield dict(zip(columns, row))
+
+
+def export_habits(path, fmt=None):
+    """
+        Exports the tables habit_info, habit_log and habit_streak to a file.
+    :param path: Path of the file to write.
+    :param fmt: 'csv' or 'jsonl', taken from the file extension if not provided.
+    :return: int: Number of rows written.
+    """
+    fmt = _format_of(path, fmt)
+    count = 0
+    try:
+        with open(path, "w", newline="", encoding="utf-8") as file:
+            if fmt == "csv":
+                writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                def write(row):
+                    file.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+            for table_name in TABLE_COLUMNS:
+                for row in iter_table(table_name):
+                    write({"table": table_name, **row})
+                    count += 1
+    except sqlite3.OperationalError as e:
+        print("Failed to export habits:", e)
+    print(f"Exported {count} rows to {path}.")
+    return count
+
+
+def _read_rows(path, fmt):
+    """
+        Streams the rows of an export file.
+    :return: generator of tuples (table name, tuple of values in TABLE_COLUMNS order)
+    """
+    with open(path, newline="", encoding="utf-8") as file:
+        if fmt == "csv":
+            for record in csv.DictReader(file):
+                table_name = record["table"]
+                # files exported before a column existed leave it empty
+                yield table_name, tuple(_to_db(column, _from_csv(column, record.get(column) or ""))
+                                        for column in TABLE_COLUMNS[table_name])
+        else:
+            for line in file:
+                if line.strip():
+                    record = json.loads(line)
+                    table_name = record["table"]
+                    yield table_name, tuple(_to_db(column, record.get(column))
+                                            for column in TABLE_COLUMNS[table_name])
+
+
+def _from_csv(column, value):
+    """
+        Converts a CSV field back to the value stored in the database.
+    """
+    if value == "" and column not in TEXT_COLUMNS:
+        return None
+    if column in INTEGER_COLUMNS:
+        return int(value)
+    return value
+
+
+def _to_db(column, value):
+    """
+        Converts the dates of an imported row to ISO-8601, all other values are kept.
+    """
+    if column in DATE_COLUMNS and value:
+        return db.day_string(db.day_number(value))
+    return value
+
+
+def _import_rows(cursor, path, fmt):
+    """
+        Writes the rows of a file and derives the streaks, rollup and bitmaps of the
+        imported habits, see import_habits(). Errors are raised.
+    :return: int: Number of rows imported.
+    """
+    count = 0
+    habit_ids = set()
+    rows = _read_rows(path, fmt)
+    while True:
+        chunk = list(islice(rows, CHUNK_SIZE))
+        if not chunk:
+            break
+        # consecutive rows of the same table are written with one executemany
+        start = 0
+        for end in range(1, len(chunk) + 1):
+            if end == len(chunk) or chunk[end][0] != chunk[start][0]:
+                cursor.executemany(IMPORT_SQL[chunk[start][0]],
+                                   (values for _, values in chunk[start:end]))
+                start = end
+        habit_ids.update(values[0] for _, values in chunk)
+        count += len(chunk)
+
+    # the raising variants, so a failure rolls back the whole import
+    db._recompute_streaks(cursor, habit_ids)
+    db._rebuild_rollup(cursor, habit_ids)
+    db._rebuild_bitmaps(cursor, habit_ids)
+    return count
+
+
+def import_habits(path, fmt=None):
+    """
+        Imports habits, log entries and streaks from a file written by export_habits().
+        Habits keep their IDs, existing habits with the same ID are overwritten. The
+        rows are written in chunks in one transaction, followed by one recomputation of
+        the streaks of all imported habits.
+    :param path: Path of the file to read.
+    :param fmt: 'csv' or 'jsonl', taken from the file extension if not provided.
+    :return: int: Number of rows imported.
+    """
+    fmt = _format_of(path, fmt)
+    try:
+        count = db._write(db._in_transaction, _import_rows, path, fmt)
+    except sqlite3.OperationalError as e:
+        print("Failed to import habits:", e)
+        return 0
+    print(f"Imported {count} rows from {path}.")
+    return count
+